@@ -1,11 +1,20 @@
 import streamlit as st
-import tempfile
 import os
-import time
-import base64
-import json
-from utils import extract_metadata, calculate_hash, analyze_frames
-from visualizations import display_metadata_chart, plot_altered_frames, create_frame_heatmap
+import uuid
+import numpy as np
+from utils import threshold_frames
+from cache import AnalysisCache
+from detectors import DETECTORS
+from jobs import JobQueue
+from fingerprint_index import FingerprintIndex
+from result_store import ResultStore
+from thumbnails import ThumbnailStore
+from report_format import ReportFile, export_json, split_frame_lists, write_report
+from array_files import save_array
+from visualizations import (
+    ScorePyramid, create_frame_heatmap, display_metadata_chart, plot_altered_frames, plot_score_timeline,
+    show_frame_list
+)
 
 # Page configuration
 st.set_page_config(
@@ -14,6 +23,198 @@ st.set_page_config(
     layout="wide",
 )
 
+# One analysis cache, fingerprint archive, result store and job queue shared by every session on this server
+@st.cache_resource
+def get_analysis_cache():
+    return AnalysisCache()
+
+@st.cache_resource
+def get_fingerprint_index():
+    return FingerprintIndex()
+
+@st.cache_resource
+def get_result_store():
+    return ResultStore()
+
+@st.cache_resource
+def get_job_queue():
+    return JobQueue(get_analysis_cache(), index=get_fingerprint_index(), store=get_result_store())
+
+# Id this session holds shared results under
+if 'owner_id' not in st.session_state:
+    st.session_state.owner_id = uuid.uuid4().hex
+
+def show_job_progress(job):
+    """
+    Render a progress bar for a queued or running analysis job
+    
+    Args:
+        job (Job): Job to report on
+    """
+    decode = job.progress.get('decode')
+    if job.status == 'queued' or decode is None:
+        st.progress(0, text="Waiting for a free analysis worker...")
+        return
+    
+    text = f"Decoded {decode['done']:,} / {decode['total']:,} frames"
+    if 'hash' in job.progress:
+        hashed = job.progress['hash']
+        text += f" · hashed {hashed['done'] / 1024 / 1024:,.0f} / {hashed['total'] / 1024 / 1024:,.0f} MB"
+    if decode['eta_seconds'] is not None:
+        text += f" · about {decode['eta_seconds']:.0f}s left"
+    
+    fraction = decode['done'] / decode['total'] if decode['total'] else 0
+    st.progress(min(1.0, fraction), text=text)
+
+@st.fragment(run_every=1.0)
+def show_job_status():
+    """
+    Poll this session's analysis job and pull its report into the session once done
+    """
+    job = get_job_queue().get(st.session_state.job_id)
+    if job is None:
+        st.warning("This analysis is no longer available. Please upload the video again.")
+        return
+    
+    if job.active:
+        show_job_progress(job)
+        return
+    
+    if job.status == 'failed':
+        st.error(f"Video analysis failed: {job.error}")
+        return
+    
+    if st.session_state.get('report_job_id') != job.id:
+        st.session_state.result_key = job.key
+        st.session_state.report_job_id = job.id
+        st.session_state.pop('report_threshold', None)
+        st.rerun()
+    
+    # Polling renews this session's hold on the result for as long as the page is open
+    if get_result_store().acquire(job.key, st.session_state.owner_id) is None:
+        st.warning("This analysis is no longer available. Please upload the video again.")
+        return
+    
+    st.success("Video analysis complete! Go to the 'Analysis Results' tab to see the findings.")
+    
+    cache_stats = get_analysis_cache().stats()
+    st.caption(
+        f"{'Loaded from' if job.cache_hit else 'Stored in'} analysis cache · "
+        f"{cache_stats['hits']} hits / {cache_stats['misses']} misses · "
+        f"{cache_stats['entries']} entries, {cache_stats['bytes'] / 1024 / 1024:.1f} MB"
+    )
+
+@st.fragment(run_every=1.0)
+def show_partial_results():
+    """
+    Show how far this session's analysis job has got and what it has flagged so far
+    """
+    job = get_job_queue().get(st.session_state.job_id)
+    if job is None or not job.active:
+        if 'result_key' not in st.session_state:
+            st.rerun()
+        return
+    
+    st.info(f"Analysis of **{job.filename}** is still running. Results so far:")
+    show_job_progress(job)
+    partial_frames = job.partial_altered_frames()
+    st.markdown(f"**Potentially altered frames found so far:** {len(partial_frames):,}")
+    if partial_frames:
+        st.caption(", ".join(map(str, partial_frames[:100])))
+
+def load_session_result():
+    """
+    Hold this session's analysis result in the shared store and build the session's view of it
+    
+    The view is rebuilt on every script run rather than kept in
+    st.session_state, so an idle session does not pin arrays the store has
+    since moved to disk. Only the chosen threshold is stored per session.
+    
+    Returns:
+        dict: 'report', 'frame_scores', 'score_pyramid', 'thumbnails' and 'result_dir', or
+            None if the session has no finished analysis
+    """
+    key = st.session_state.get('result_key')
+    if key is None:
+        return None
+    result = get_result_store().acquire(key, st.session_state.owner_id)
+    if result is None:
+        return None
+    
+    frame_scores = result.arrays['frame_scores']
+    # Copy the report so threshold changes stay local to this session
+    report = dict(result.report)
+    threshold = st.session_state.get('report_threshold', report['threshold'])
+    if threshold != report['threshold']:
+        report['altered_frames'] = threshold_frames(frame_scores, threshold)
+        report['threshold'] = threshold
+    return {
+        'report': report,
+        'frame_scores': frame_scores,
+        'score_pyramid': result.derived('score_pyramid', lambda: ScorePyramid(frame_scores)),
+        'thumbnails': result.files.get('thumbnails'),
+        'result_dir': result.result_dir,
+    }
+
+def show_report_viewer(report, counts, load_frames, key):
+    """
+    Show a report's details with its frame lists summarised, and page through one list at a time
+    
+    Args:
+        report (dict): Report with its frame lists left out
+        counts (dict): Number of frames in each list, by name
+        load_frames (callable): Returns the frames of a list by name; only
+            called for the list on screen
+        key (str): Prefix that keeps this viewer's widgets apart from other viewers'
+    """
+    st.markdown("### Report Data")
+    st.json(dict(report, frame_lists=counts), expanded=False)
+    
+    if counts:
+        st.markdown("### Frame Lists")
+        name = st.selectbox("Frame list", list(counts), key=f"{key}_list",
+                            format_func=lambda name: f"{name} ({counts[name]:,} frames)")
+        show_frame_list(load_frames(name), key=f"{key}_page_{name}")
+
+def build_report_downloads(report, frame_scores, directory):
+    """
+    Write the report as a binary file, as streamed JSON and the scores as .npy
+    
+    The files are written next to the stored result, so sessions viewing it
+    at the same threshold share them and they are deleted with the result.
+    Sessions keep only the paths; the download buttons read the files.
+    
+    Args:
+        report (dict): Forensic report
+        frame_scores (numpy.ndarray): float32 score per frame
+        directory (str): Directory of the stored result
+        
+    Returns:
+        dict: Paths of the 'binary', 'json' and 'scores' downloads
+    """
+    stem = os.path.join(directory, f"export-{report['threshold']}")
+    paths = {
+        'binary': stem + '.vgr',
+        'json': stem + '.json',
+        'scores': os.path.join(directory, 'export-scores.npy'),
+    }
+    writers = {
+        'binary': lambda path: write_report(path, report, frame_scores),
+        'json': lambda path: _write_text(path, lambda f: export_json(report, f)),
+        'scores': lambda path: save_array(path, frame_scores),
+    }
+    for name, path in paths.items():
+        if not os.path.exists(path):
+            # Another session may be writing the same export; each renames its own finished copy into place
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            writers[name](tmp_path)
+            os.replace(tmp_path, path)
+    return paths
+
+def _write_text(path, write):
+    with open(path, 'w', encoding='utf-8') as f:
+        write(f)
+
 # Display VidGuard logo
 st.markdown(
     """
@@ -71,58 +272,49 @@ with tab1:
     # File uploader
     uploaded_file = st.file_uploader("Choose a video file", type=['mp4', 'avi', 'mov', 'mkv'])
     
-    if uploaded_file is not None:
-        # Save the uploaded file to a temporary location
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            video_path = tmp_file.name
-        
-        # Show a spinner while analyzing the video
-        with st.spinner("Analyzing video. This may take a while depending on the file size..."):
-            # Create a progress bar
-            progress_bar = st.progress(0)
-            
-            # Extract metadata (10% of progress)
-            progress_bar.progress(10)
-            metadata = extract_metadata(video_path)
-            time.sleep(0.5)  # Simulate processing time
-            
-            # Calculate hash (30% of progress)
-            progress_bar.progress(30)
-            video_hash = calculate_hash(video_path)
-            time.sleep(0.5)  # Simulate processing time
-            
-            # Analyze frames (90% of progress)
-            progress_bar.progress(60)
-            altered_frames = analyze_frames(video_path)
-            time.sleep(0.5)  # Simulate processing time
-            
-            # Create forensic report
-            report = {
-                'filename': uploaded_file.name,
-                'filesize': uploaded_file.size,
-                'metadata': metadata,
-                'hash': video_hash,
-                'altered_frames': altered_frames,
-                'analysis_timestamp': time.strftime('%Y-%m-%d %H:%M:%S')
-            }
-            
-            # Store report in session state for access in other tabs
-            st.session_state.report = report
-            st.session_state.video_path = video_path
-            
-            # Complete progress
-            progress_bar.progress(100)
-            time.sleep(0.5)  # Simulate processing time
-            
-        st.success("Video analysis complete! Go to the 'Analysis Results' tab to see the findings.")
-        
-        # Clean up the temporary file - we'll do this when the session ends
-        # Don't delete now as we need it for the other tabs
+    # Reduced resolutions trade some accuracy for much faster triage of 4K footage
+    analysis_scale = st.select_slider(
+        "Analysis resolution",
+        options=[0.125, 0.25, 0.5, 1.0],
+        value=1.0,
+        format_func=lambda v: "Full" if v == 1.0 else f"{int(v * 100)}%",
+    )
+    
+    # Each extra analysis costs scan time, so they only run when asked for
+    detector_names = st.multiselect("Additional detectors", list(DETECTORS))
+    analyze_audio = st.checkbox("Analyze the audio track")
+    keep_thumbnails = st.checkbox("Keep thumbnails of flagged frames for inspection")
+    
+    # Only analyze again when the file or the analysis settings change, not on every rerun
+    analysis_key = (
+        (uploaded_file.file_id, analysis_scale, tuple(sorted(detector_names)), analyze_audio, keep_thumbnails)
+        if uploaded_file is not None else None
+    )
+    
+    if uploaded_file is not None and st.session_state.get('analysis_key') != analysis_key:
+        # Stream the uploaded file into the result store's upload directory, hashing it as it is written
+        suffix = os.path.splitext(uploaded_file.name)[1] or '.mp4'
+        video_path, video_hashes = get_result_store().save_upload(uploaded_file, suffix=suffix)
         
+        # Hand the file to the background queue; it deletes the file when done
+        st.session_state.job_id = get_job_queue().submit(
+            video_path, uploaded_file.name, uploaded_file.size, video_hashes, scale=analysis_scale,
+            detectors=detector_names, audio=analyze_audio, thumbnails=keep_thumbnails,
+        )
+        st.session_state.analysis_key = analysis_key
+        if 'result_key' in st.session_state:
+            get_result_store().release(st.session_state.pop('result_key'), st.session_state.owner_id)
+        st.session_state.pop('report_threshold', None)
+        st.session_state.pop('report_downloads', None)
+        
+    if 'job_id' in st.session_state:
+        show_job_status()
+
+session_result = load_session_result()
+
 with tab2:
-    if 'report' in st.session_state:
-        report = st.session_state.report
+    if session_result is not None:
+        report = session_result['report']
         
         st.markdown("## Video Analysis Results")
         
@@ -137,15 +329,63 @@ with tab2:
         
         with basic_info_col2:
             st.markdown(f"**MD5 Hash:** `{report['hash']}`")
+            if 'sha256' in report.get('hashes', {}):
+                st.markdown(f"**SHA-256 Hash:** `{report['hashes']['sha256']}`")
             st.markdown(f"**Duration:** {report['metadata']['frame_count']/report['metadata']['fps']:.2f} seconds")
 
+        # Where the analysis spent its time
+        if report.get('timings'):
+            with st.expander("Analysis timings"):
+                for stage, seconds in report['timings'].items():
+                    st.markdown(f"- **{stage.replace('_', ' ').title()}**: {seconds:.2f} s")
+        
         # Metadata visualization
         st.markdown("### Video Metadata")
         display_metadata_chart(report['metadata'])
-        
+
+        # Timing and tags read straight from the MP4/MKV structures
+        container = report['metadata'].get('container')
+        if container:
+            st.markdown(f"**Encoder:** {container.get('encoder') or 'not recorded'}")
+            st.markdown(f"**Created:** {container.get('creation_time') or 'not recorded'}")
+            if container.get('modification_time') and container['modification_time'] != container.get('creation_time'):
+                st.markdown(f"**Modified:** {container['modification_time']}")
+
+            anomalies = container['anomalies']
+            gaps = anomalies['timestamp_gaps']['count']
+            duplicates = anomalies['duplicate_pts']['count']
+            if gaps or duplicates:
+                st.warning(f"**Timestamp anomalies:** {gaps} gaps and {duplicates} duplicate timestamps in the container.")
+            with st.expander("Container details"):
+                st.json(container)
+
         # Altered frames visualization
         st.markdown("### Frame Analysis")
         
+        # Re-threshold the stored per-frame scores instead of decoding the video again
+        threshold = st.slider(
+            "Detection threshold (share of changed pixels)",
+            min_value=0.01,
+            max_value=0.5,
+            value=report['threshold'],
+            step=0.01,
+        )
+        if threshold != report['threshold']:
+            report['altered_frames'] = threshold_frames(session_result['frame_scores'], threshold)
+            report['threshold'] = threshold
+            st.session_state.report_threshold = threshold
+        
+        # The score timeline is drawn from pre-aggregated summaries; narrowing the range loads finer ones
+        pyramid = session_result['score_pyramid']
+        if pyramid.frame_count > 1:
+            view_start, view_stop = st.slider(
+                "Timeline range (frames)",
+                min_value=0,
+                max_value=pyramid.frame_count,
+                value=(0, pyramid.frame_count),
+            )
+            plot_score_timeline(pyramid, threshold, view_start, max(view_stop, view_start + 1))
+        
         if len(report['altered_frames']) > 0:
             st.warning(f"**Potential tampering detected!** Found {len(report['altered_frames'])} frames with significant changes.")
             plot_altered_frames(report['altered_frames'], report['metadata']['frame_count'])
@@ -156,36 +396,140 @@ with tab2:
         # Display the first 100 altered frames for reference
         if len(report['altered_frames']) > 0:
             with st.expander("View detailed altered frames information"):
-                max_frames = min(100, len(report['altered_frames']))
-                st.write(f"First {max_frames} altered frame positions (out of {len(report['altered_frames'])} total):")
-                st.write(report['altered_frames'][:max_frames])
+                st.write(f"Altered frame positions ({len(report['altered_frames']):,} total):")
+                show_frame_list(report['altered_frames'], key='altered_frames_page')
+            
+            # Thumbnails of flagged frames and their neighbours were stored during the scan
+            if session_result['thumbnails']:
+                st.markdown("### Frame Inspection")
+                try:
+                    store = ThumbnailStore(session_result['thumbnails'])
+                except (OSError, ValueError):
+                    store = None
+                    st.info("Frame thumbnails for this analysis are no longer available.")
                 
+                # Mapped for this script run only; get() copies each image out of the mapping
+                if store is not None:
+                    with store:
+                        inspectable = np.intersect1d(store.frames, report['altered_frames']).tolist()
+                        if inspectable:
+                            frame = st.selectbox("Altered frame", inspectable)
+                            before_col, frame_col, after_col = st.columns(3)
+                            for col, index, label in [(before_col, frame - 1, "Before"),
+                                                      (frame_col, frame, "Flagged"),
+                                                      (after_col, frame + 1, "After")]:
+                                with col:
+                                    image = store.get(index)
+                                    if image is not None:
+                                        st.image(image, caption=f"{label}: frame {index}")
+                                    else:
+                                        st.caption(f"{label}: no thumbnail for frame {index}")
+                        else:
+                            st.info("No thumbnails are stored for the frames flagged at this threshold.")
+
+        # Independent detectors that ran on the same decode pass
+        if report.get('detectors'):
+            st.markdown("### Detector Results")
+            for name, result in report['detectors'].items():
+                flagged = result['flagged_frames']
+                st.markdown(f"- **{name.replace('_', ' ').title()}**: {len(flagged)} flagged frames "
+                            f"(threshold {result['threshold']}, peak score {result['max_score']:.3f})")
+            with st.expander("Frames flagged by each detector"):
+                for name, result in report['detectors'].items():
+                    st.markdown(f"**{name.replace('_', ' ').title()}**")
+                    show_frame_list(result['flagged_frames'], key=f'{name}_flagged_page')
+
+        # Audio splices and level jumps, scored on the same frame timeline
+        audio = report.get('audio')
+        if audio:
+            st.markdown("### Audio Track")
+            if 'error' in audio:
+                st.caption(f"Audio was not analyzed: {audio['error']}")
+            else:
+                audio_flagged = np.union1d(audio['spectral']['flagged_frames'], audio['rms_jump']['flagged_frames'])
+                if len(audio_flagged) > 0:
+                    st.warning(f"**Audio discontinuities detected!** {len(audio_flagged)} frames coincide with abrupt changes in the soundtrack.")
+                else:
+                    st.success("**No audio discontinuities detected.**")
+                st.markdown(f"- **Spectral discontinuities**: {len(audio['spectral']['flagged_frames'])} flagged frames "
+                            f"(threshold {audio['spectral']['threshold']}, peak score {audio['spectral']['max_score']:.3f})")
+                st.markdown(f"- **Level jumps**: {len(audio['rms_jump']['flagged_frames'])} flagged frames "
+                            f"(threshold {audio['rms_jump']['threshold']} dB, peak {audio['rms_jump']['max_score']:.1f} dB)")
+                st.markdown(f"- **Audio / video duration**: {audio['duration']:.2f} s / {audio['video_duration']:.2f} s")
+                if abs(audio.get('start_offset', 0.0)) > 0.1:
+                    st.markdown(f"- **Audio start**: {audio['start_offset']:+.2f} s from the first frame")
+                if abs(audio['duration_mismatch']) > 1.0:
+                    st.warning(f"The audio track is {abs(audio['duration_mismatch']):.1f} s "
+                               f"{'longer' if audio['duration_mismatch'] > 0 else 'shorter'} than the video.")
+                if len(audio_flagged) > 0:
+                    with st.expander("Frames flagged by the audio analysis"):
+                        show_frame_list(audio_flagged, key='audio_flagged_page')
+
+        # Earlier footage that reappears later, matched by frame fingerprints
+        if report.get('repeated_segments'):
+            st.warning(f"**Repeated footage detected!** {len(report['repeated_segments'])} segments reappear later in the video.")
+            for segment in report['repeated_segments'][:20]:
+                if segment.get('copies', 2) > 2:
+                    st.markdown(f"- Frames {segment['source_start']}–{segment['repeat_end']} loop "
+                                f"{segment['copies']} times, every {segment['period']} frames")
+                else:
+                    st.markdown(f"- Frames {segment['source_start']}–{segment['source_end']} repeat at "
+                                f"frames {segment['repeat_start']}–{segment['repeat_end']}")
+
+        # Footage shared with videos analysed earlier on this server
+        if report.get('archive_matches'):
+            st.warning(f"**Known footage detected!** {len(report['archive_matches'])} previously analyzed videos share segments with this one.")
+            for match in report['archive_matches'][:10]:
+                name = match['info'].get('filename', match['key'])
+                for segment in match['segments'][:5]:
+                    st.markdown(f"- Frames {segment['query_start']}–{segment['query_end']} match frames "
+                                f"{segment['reference_start']}–{segment['reference_end']} of **{name}**")
+
+    elif 'job_id' in st.session_state:
+        show_partial_results()
     else:
         st.info("Please upload a video in the 'Home & Upload' tab to see analysis results.")
 
 with tab3:
-    if 'report' in st.session_state:
-        report = st.session_state.report
+    if session_result is not None:
+        report = session_result['report']
         
         st.markdown("## Forensic Report")
         
-        # Create JSON string from report
-        report_json = json.dumps(report, indent=4)
-        
-        # Display JSON in a code block
-        st.markdown("### Report Data (JSON)")
-        st.code(report_json, language="json")
+        # Frame lists are paged through rather than rendered as one JSON document
+        header, frame_lists = split_frame_lists(report)
+        show_report_viewer(header, {name: len(frames) for name, frames in frame_lists.items()},
+                           frame_lists.get, key='report')
         
-        # Provide download button for the report
         st.markdown("### Download Report")
         
-        # Function to create a download link for the report
-        def get_report_download_link(report_json, filename="vidguard_forensic_report.json"):
-            b64 = base64.b64encode(report_json.encode()).decode()
-            href = f'<a href="data:file/json;base64,{b64}" download="{filename}">Download Report (JSON)</a>'
-            return href
-        
-        st.markdown(get_report_download_link(report_json), unsafe_allow_html=True)
+        # Exports are built on request and kept until the report or threshold changes
+        downloads_key = (st.session_state.get('report_job_id'), report['threshold'])
+        if st.session_state.get('report_downloads', {}).get('key') != downloads_key:
+            if st.button("Prepare report downloads"):
+                st.session_state.report_downloads = {
+                    'key': downloads_key,
+                    **build_report_downloads(report, session_result['frame_scores'], session_result['result_dir']),
+                }
+                st.rerun()
+        else:
+            downloads = st.session_state.report_downloads
+            # Per-frame scores let the report be re-thresholded later without the video
+            buttons = [
+                ("Download Report (binary, with frame scores)", 'binary', "vidguard_forensic_report.vgr",
+                 "application/octet-stream"),
+                ("Download Report (JSON)", 'json', "vidguard_forensic_report.json", "application/json"),
+                ("Download Frame Scores (NumPy .npy)", 'scores', "vidguard_frame_scores.npy",
+                 "application/octet-stream"),
+            ]
+            try:
+                for label, name, file_name, mime in buttons:
+                    with open(downloads[name], 'rb') as f:
+                        st.download_button(label, data=f, file_name=file_name, mime=mime)
+            except OSError:
+                # The result was evicted from the store along with its exports
+                st.session_state.pop('report_downloads')
+                st.info("The report downloads are no longer available; prepare them again.")
         
         # Forensic summary
         st.markdown("### Forensic Analysis Summary")
@@ -215,8 +559,23 @@ with tab3:
             - Consider blockchain registration for immutable proof of integrity
             """)
             
+    elif 'job_id' in st.session_state:
+        st.info("The forensic report will be available once the analysis finishes.")
     else:
         st.info("Please upload a video in the 'Home & Upload' tab to generate a forensic report.")
+    
+    # Saved binary reports open with only their header decoded; frame lists load as they are viewed
+    with st.expander("Open a saved binary report"):
+        saved_report = st.file_uploader("VidGuard binary report", type=['vgr'])
+        if saved_report is not None:
+            try:
+                report_file = ReportFile(saved_report.getvalue())
+            except ValueError as e:
+                st.error(f"Could not open the report: {e}")
+            else:
+                counts = {name: report_file.count(name) for name, entry in report_file.arrays.items()
+                          if entry['path'] is not None}
+                show_report_viewer(report_file.report, counts, report_file.array, key='saved_report')
 
 with tab4:
     st.markdown("# Video Fraud Awareness")
@@ -477,10 +836,3 @@ with tab4:
 st.markdown("---")
 st.markdown("*VidGuard - Advanced Video Forensics Tool. For investigative and educational purposes only.*")
 st.markdown("*Created by Om Golesar*")
-
-# Clean up temporary files when the session ends
-if 'video_path' in st.session_state:
-    try:
-        os.unlink(st.session_state.video_path)
-    except:
-        pass  # We'll ignore errors in cleanup
@@ -0,0 +1,26 @@
+import numpy as np
+
+def save_array(path, array):
+    """
+    Write one array to a .npy file at exactly the given path
+
+    np.save appends .npy to a path without that extension; writing through a
+    file object keeps temporary and artifact names as the caller chose them.
+
+    Args:
+        path (str): Destination path
+        array (numpy.ndarray): Array to write
+    """
+    with open(path, 'wb') as f:
+        np.save(f, array)
+
+def save_arrays(path, arrays):
+    """
+    Write named arrays to an uncompressed .npz file at exactly the given path
+
+    Args:
+        path (str): Destination path
+        arrays (dict): Arrays by name
+    """
+    with open(path, 'wb') as f:
+        np.savez(f, **arrays)
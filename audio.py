@@ -0,0 +1,307 @@
+import subprocess
+import numpy as np
+
+from array_files import save_arrays
+from decoders import find_ffmpeg
+
+# Audio is downmixed to mono and resampled to this rate; splices show up well below 8 kHz
+AUDIO_SAMPLE_RATE = 16000
+
+# Samples per analysis window (32 ms at AUDIO_SAMPLE_RATE); windows overlap by half
+AUDIO_WINDOW = 512
+
+# Samples read from the demuxer and scored per vectorised step
+AUDIO_CHUNK_SAMPLES = AUDIO_SAMPLE_RATE * 10
+
+# Normalised spectral flux above which a window is flagged as a spectral discontinuity
+SPECTRAL_THRESHOLD = 0.6
+
+# Level change between neighbouring windows, in dB, above which a window is flagged
+RMS_JUMP_THRESHOLD = 24.0
+
+# Windows quieter than this (-60 dBFS) are treated as silence: neither score rises inside a pause,
+# and the spectrum of a sound starting out of silence is not compared with the silence
+SILENCE_RMS = 1e-3
+
+def audio_output_args(sample_rate=AUDIO_SAMPLE_RATE):
+    """
+    ffmpeg output options that emit the first audio stream as mono float32 samples
+
+    Args:
+        sample_rate (int): Sample rate to resample to
+
+    Returns:
+        list: ffmpeg arguments to place before the output URL
+    """
+    return ['-map', '0:a:0', '-ac', '1', '-ar', str(sample_rate), '-f', 'f32le']
+
+def has_audio_stream(video_path, ffmpeg=None):
+    """
+    Check whether a video has an audio stream, reading only its header
+
+    Args:
+        video_path (str): Path to the video file
+        ffmpeg (str): ffmpeg executable, None to look one up
+
+    Returns:
+        bool: True if ffmpeg finds an audio stream
+
+    Raises:
+        ValueError: If there is no ffmpeg executable
+    """
+    ffmpeg = ffmpeg or find_ffmpeg()
+    if ffmpeg is None:
+        raise ValueError("audio analysis needs an ffmpeg executable")
+    probe = subprocess.run(
+        [ffmpeg, '-v', 'error', '-nostdin', '-i', video_path, '-map', '0:a:0', '-t', '0', '-f', 'null', '-'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return probe.returncode == 0
+
+class AudioScanner:
+    """
+    Scores discontinuities in a stream of mono samples, one chunk at a time
+
+    Each chunk is cut into half-overlapping Hann windows that are
+    transformed together, and every window is compared with the closest
+    earlier window it does not overlap: the spectral score is the
+    normalised spectral flux, between 0 for an unchanged spectrum and 1 for
+    a disjoint one, and the RMS jump is the level change in dB. The flux
+    is only scored between two windows that are above silence throughout,
+    since any sound starting out of silence has a spectrum disjoint from
+    the noise floor's. Unfinished
+    samples and the last windows' statistics carry over to the next chunk,
+    so the scores do not depend on where chunks are cut.
+    """
+
+    def __init__(self, sample_rate=AUDIO_SAMPLE_RATE, window=AUDIO_WINDOW):
+        """
+        Args:
+            sample_rate (int): Sample rate of the fed samples
+            window (int): Samples per analysis window
+        """
+        self.sample_rate = sample_rate
+        self.window = window
+        self.hop = window // 2
+        # Windows back to the previous one that shares no samples with the current window
+        self.lag = window // self.hop
+        self.samples = 0
+        self._taper = np.hanning(window).astype(np.float32)
+        self._tail = np.zeros(0, dtype=np.float32)
+        self._prev_spectra = None
+        self._prev_rms = None
+        self._prev_quietest = None
+        self._spectral = []
+        self._rms_jump = []
+
+    def feed(self, samples):
+        """
+        Score every window completed by a chunk of samples
+
+        Args:
+            samples (numpy.ndarray): float32 samples following the previous chunk
+        """
+        self.samples += len(samples)
+        data = np.concatenate([self._tail, samples]) if len(self._tail) else samples
+        count = (len(data) - self.window) // self.hop + 1 if len(data) >= self.window else 0
+        # Copy the carried samples; the caller may reuse the chunk's buffer
+        if count == 0:
+            self._tail = data.copy()
+            return
+        self._tail = data[count * self.hop:].copy()
+
+        windows = np.lib.stride_tricks.sliding_window_view(data, self.window)[::self.hop][:count]
+        spectra = np.abs(np.fft.rfft(windows * self._taper, axis=1)).astype(np.float32)
+        power = np.square(windows, dtype=np.float32)
+        rms = np.sqrt(np.mean(power, axis=1))
+        # Level of the quieter hop of each window: a sound starting inside a window leaves one hop silent
+        quietest = np.sqrt(power.reshape(count, -1, self.hop).mean(axis=2).min(axis=1))
+
+        # Prepend the previous chunk's last windows so the first differences cross the boundary;
+        # the very first windows are compared with the first one and score 0
+        if self._prev_spectra is None:
+            self._prev_spectra = np.repeat(spectra[:1], self.lag, axis=0)
+            self._prev_rms = np.repeat(rms[:1], self.lag)
+            self._prev_quietest = np.repeat(quietest[:1], self.lag)
+        all_spectra = np.concatenate([self._prev_spectra, spectra])
+        all_rms = np.concatenate([self._prev_rms, rms])
+        all_quietest = np.concatenate([self._prev_quietest, quietest])
+        prev_spectra, prev_rms = all_spectra[:count], all_rms[:count]
+        self._prev_spectra, self._prev_rms = all_spectra[-self.lag:], all_rms[-self.lag:]
+        prev_quietest = all_quietest[:count]
+        self._prev_quietest = all_quietest[-self.lag:]
+
+        flux = np.abs(spectra - prev_spectra).sum(axis=1)
+        total = spectra.sum(axis=1) + prev_spectra.sum(axis=1)
+        spectral = np.divide(flux, total, out=np.zeros_like(flux), where=total > 0)
+        loud = np.maximum(rms, prev_rms) >= SILENCE_RMS
+        both_loud = np.minimum(quietest, prev_quietest) >= SILENCE_RMS
+        floor = np.float32(SILENCE_RMS / 10)
+        rms_jump = np.abs(20 * np.log10(np.maximum(rms, floor) / np.maximum(prev_rms, floor)))
+        self._spectral.append(np.where(both_loud, spectral, 0).astype(np.float32))
+        self._rms_jump.append(np.where(loud, rms_jump, 0).astype(np.float32))
+
+    def result(self):
+        """
+        Scores of all windows fed so far
+
+        Returns:
+            dict: 'times' (centre of each window in seconds), 'spectral' and
+                'rms_jump' float32 arrays, and 'duration' in seconds
+        """
+        spectral = np.concatenate(self._spectral) if self._spectral else np.zeros(0, dtype=np.float32)
+        rms_jump = np.concatenate(self._rms_jump) if self._rms_jump else np.zeros(0, dtype=np.float32)
+        times = (np.arange(len(spectral)) * self.hop + self.window / 2) / self.sample_rate
+        return {
+            'times': times,
+            'spectral': spectral,
+            'rms_jump': rms_jump,
+            'duration': self.samples / self.sample_rate,
+        }
+
+def scan_audio(stream, sample_rate=AUDIO_SAMPLE_RATE, chunk_samples=AUDIO_CHUNK_SAMPLES):
+    """
+    Read mono float32 samples from a pipe to its end and score their windows
+
+    Args:
+        stream: Binary file object yielding little-endian float32 samples
+        sample_rate (int): Sample rate of the samples
+        chunk_samples (int): Samples scored per step
+
+    Returns:
+        dict: AudioScanner.result of the whole stream
+    """
+    scanner = AudioScanner(sample_rate)
+    buffer = np.empty(chunk_samples, dtype='<f4')
+    view = memoryview(buffer).cast('B')
+    pending = 0
+    while True:
+        count = stream.readinto(view[pending:])
+        if count:
+            pending += count
+            if pending < len(view):
+                continue
+        # A sample can straddle two reads; keep its first bytes for the next chunk
+        whole = pending // 4
+        scanner.feed(buffer[:whole])
+        leftover = pending - whole * 4
+        view[:leftover] = view[whole * 4:pending]
+        pending = leftover
+        if not count:
+            break
+    return scanner.result()
+
+def frame_audio_times(frame_count, fps, container=None):
+    """
+    Presentation time of every frame, measured from the audio track's first sample
+
+    ffmpeg outputs the audio from its first sample on, so a track that
+    starts after the picture, or before it, shifts every window against the
+    frames. With the parse_container result the frames' own timestamps and
+    both streams' start times are used; frames beyond what it describes,
+    and every frame without it, are placed at a constant fps.
+
+    Args:
+        frame_count (int): Number of frames scored in the video
+        fps (float): Frame rate of the video
+        container (dict): Optional result of container.parse_container
+
+    Returns:
+        numpy.ndarray: float64 seconds per frame, negative for frames before the audio starts
+    """
+    period = 1.0 / fps if fps > 0 else 0.0
+    if container is None:
+        return np.arange(frame_count) * period
+    timestamps = container['timestamps_ms'][:frame_count] / 1000.0
+    if len(timestamps) < frame_count:
+        last = timestamps[-1] if len(timestamps) else -period
+        extra = last + np.arange(1, frame_count - len(timestamps) + 1) * period
+        timestamps = np.concatenate([timestamps, extra])
+    audio_start = container.get('audio_start_seconds', container['start_seconds'])
+    return timestamps + (container['start_seconds'] - audio_start)
+
+def align_audio_scores(audio, frame_times):
+    """
+    Put window scores on the video's frame timeline
+
+    Each frame gets the highest score of the windows centred between its
+    timestamp and the next frame's; frames with no window centred in them
+    score 0, and windows before the first frame or past the last are dropped.
+
+    Args:
+        audio (dict): Result of scan_audio
+        frame_times (numpy.ndarray): Result of frame_audio_times
+
+    Returns:
+        dict: float32 'spectral' and 'rms_jump' score per frame
+    """
+    frame_count = len(frame_times)
+    frames = np.searchsorted(frame_times, audio['times'], side='right') - 1
+    # The last frame lasts as long as the typical frame before it
+    last_duration = np.median(np.diff(frame_times)) if frame_count > 1 else 0.0
+    end = frame_times[-1] + last_duration if frame_count else 0.0
+    inside = (frames >= 0) & (audio['times'] < end)
+    aligned = {}
+    for name in ('spectral', 'rms_jump'):
+        per_frame = np.zeros(frame_count, dtype=np.float32)
+        np.maximum.at(per_frame, frames[inside], audio[name][inside])
+        aligned[name] = per_frame
+    return aligned
+
+def summarize_audio(audio, aligned, fps, frame_count, thresholds=None, frame_times=None):
+    """
+    JSON-serialisable audio results for the report
+
+    Args:
+        audio (dict): Result of scan_audio
+        aligned (dict): Result of align_audio_scores
+        fps (float): Frame rate of the video
+        frame_count (int): Number of frames scored in the video
+        thresholds (dict): Optional 'spectral' and 'rms_jump' thresholds
+        frame_times (numpy.ndarray): Result of frame_audio_times the scores were aligned with
+
+    Returns:
+        dict: Durations, their mismatch, how many seconds the audio starts
+            after the first frame, and per score the threshold, flagged
+            frames and peak score
+    """
+    thresholds = dict({'spectral': SPECTRAL_THRESHOLD, 'rms_jump': RMS_JUMP_THRESHOLD}, **(thresholds or {}))
+    video_duration = frame_count / fps if fps > 0 else 0.0
+    summary = {
+        'sample_rate': AUDIO_SAMPLE_RATE,
+        'duration': audio['duration'],
+        'video_duration': video_duration,
+        # A track much longer or shorter than the picture hints at edits or re-muxed streams
+        'duration_mismatch': audio['duration'] - video_duration,
+        'start_offset': float(0.0 - frame_times[0]) if frame_times is not None and len(frame_times) else 0.0,
+    }
+    for name, scores in aligned.items():
+        summary[name] = {
+            'threshold': thresholds[name],
+            'flagged_frames': np.flatnonzero(scores > thresholds[name]).tolist(),
+            'max_score': float(np.max(scores)) if len(scores) else 0.0,
+        }
+    return summary
+
+def save_audio_scores(audio_scores, path):
+    """
+    Write the per-frame audio score arrays to an .npz file
+
+    Args:
+        audio_scores (dict): Result of align_audio_scores
+        path (str): Destination path
+    """
+    save_arrays(path, audio_scores)
+
+def load_audio_scores(path):
+    """
+    Read score arrays written by save_audio_scores
+
+    Args:
+        path (str): Path of the .npz file
+
+    Returns:
+        dict: float32 'spectral' and 'rms_jump' score per frame
+    """
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
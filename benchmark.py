@@ -0,0 +1,309 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue as queue_module
+import resource
+import sys
+import tempfile
+import time
+import cv2
+import numpy as np
+
+import utils
+from decoders import measure_decoders
+
+# Stages timed for every synthetic clip, in the order they are reported
+STAGES = ('extract_metadata', 'calculate_hash', 'calculate_hashes', 'analyze_frames', 'analyze_video')
+
+# Seconds between checks that a stage process is still alive while waiting for its measurement
+STAGE_POLL_SECONDS = 1.0
+
+CODEC_EXTENSIONS = {'mp4v': '.mp4', 'MJPG': '.avi', 'XVID': '.avi', 'avc1': '.mp4'}
+
+def generate_video(path, width, height, frames, fourcc='mp4v', fps=30, cut_every=None, seed=0):
+    """
+    Write a synthetic clip with a moving object and known injected cuts
+
+    Between cuts the clip shows a fixed noisy background with a small square
+    drifting across it, which stays well below the default detection
+    threshold. At every cut the background is replaced, which a working
+    detector must flag.
+
+    Args:
+        path (str): Destination path, its extension must suit the codec
+        width (int): Frame width in pixels
+        height (int): Frame height in pixels
+        frames (int): Number of frames to write
+        fourcc (str): Four-character codec code passed to cv2.VideoWriter
+        fps (float): Frame rate stored in the container
+        cut_every (int): Distance between injected cuts, None for a third of the clip
+        seed (int): Seed for the background noise
+
+    Returns:
+        list: Frame indices at which cuts were injected
+    """
+    if cut_every is None:
+        cut_every = max(2, frames // 3)
+    cuts = list(range(cut_every, frames, cut_every))
+
+    rng = np.random.default_rng(seed)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"OpenCV cannot encode {fourcc} into {path}")
+
+    def background():
+        # Blurred noise compresses like real footage instead of like pure static
+        noise = rng.integers(0, 256, (height // 8 + 1, width // 8 + 1, 3), dtype=np.uint8)
+        return cv2.resize(noise, (width, height), interpolation=cv2.INTER_LINEAR)
+
+    scene = background()
+    size = max(8, min(width, height) // 10)
+    for i in range(frames):
+        if i in cuts:
+            scene = background()
+        frame = scene.copy()
+        x = (i * 4) % max(1, width - size)
+        y = height // 2 - size // 2
+        cv2.rectangle(frame, (x, y), (x + size, y + size), (255, 255, 255), -1)
+        writer.write(frame)
+
+    writer.release()
+    return cuts
+
+def _run_stage(stage, video_path, queue):
+    """
+    Child process entry point: time one stage and report its peak memory
+
+    Args:
+        stage (str): Name of the utils function to run
+        video_path (str): Path to the video file
+        queue (multiprocessing.Queue): Receives the measurement dict
+    """
+    start = time.perf_counter()
+    result = getattr(utils, stage)(video_path)
+    seconds = time.perf_counter() - start
+
+    if stage == 'analyze_video':
+        altered_frames = result['altered_frames']
+    elif stage == 'analyze_frames':
+        altered_frames = result
+    else:
+        altered_frames = None
+
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_bytes = peak if sys.platform == 'darwin' else peak * 1024
+
+    queue.put({'seconds': seconds, 'peak_rss_mb': peak_bytes / 1024 / 1024,
+               'altered_frames': altered_frames})
+
+def measure_stage(stage, video_path):
+    """
+    Run one stage in a fresh process so its peak RSS is not inflated by earlier stages
+
+    Args:
+        stage (str): Name of the utils function to run
+        video_path (str): Path to the video file
+
+    Returns:
+        dict: Seconds, peak RSS in MB and, for frame analysis stages, altered frames
+
+    Raises:
+        RuntimeError: If the stage process exits without a measurement, e.g. after an exception
+    """
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_run_stage, args=(stage, video_path, queue))
+    process.start()
+    while True:
+        try:
+            measurement = queue.get(timeout=STAGE_POLL_SECONDS)
+            break
+        except queue_module.Empty:
+            if process.is_alive():
+                continue
+        # The measurement may have been put just before the process exited
+        try:
+            measurement = queue.get(timeout=STAGE_POLL_SECONDS)
+            break
+        except queue_module.Empty:
+            raise RuntimeError(f"stage {stage} exited with code {process.exitcode} before reporting") from None
+    process.join()
+    return measurement
+
+def benchmark_case(video_path, frames, cuts, repeat=1):
+    """
+    Time every stage on one clip, keeping the fastest of several runs
+
+    Args:
+        video_path (str): Path to the synthetic clip
+        frames (int): Number of frames in the clip
+        cuts (list): Frame indices of the injected cuts
+        repeat (int): Number of runs per stage
+
+    Returns:
+        dict: Per-stage seconds, frames/sec, MB/s, peak RSS and cut recall
+    """
+    size_mb = os.path.getsize(video_path) / 1024 / 1024
+    stages = {}
+    for stage in STAGES:
+        runs = [measure_stage(stage, video_path) for _ in range(max(1, repeat))]
+        best = min(runs, key=lambda run: run['seconds'])
+        entry = {
+            'seconds': best['seconds'],
+            'frames_per_second': frames / best['seconds'] if best['seconds'] > 0 else None,
+            'mb_per_second': size_mb / best['seconds'] if best['seconds'] > 0 else None,
+            'peak_rss_mb': max(run['peak_rss_mb'] for run in runs),
+        }
+        if best['altered_frames'] is not None:
+            found = set(best['altered_frames'])
+            entry['cut_recall'] = len(found & set(cuts)) / len(cuts) if cuts else 1.0
+            entry['false_positives'] = len(found - set(cuts))
+        stages[stage] = entry
+    return {'file_mb': size_mb, 'stages': stages}
+
+def run_suite(resolutions, lengths, codecs, repeat=1, workdir=None, decode_threads=(None,),
+              log=sys.stderr):
+    """
+    Generate every resolution/length/codec combination and benchmark it
+
+    Args:
+        resolutions (list): (width, height) tuples
+        lengths (list): Frame counts
+        codecs (list): Four-character codec codes
+        repeat (int): Number of runs per stage
+        workdir (str): Directory for the synthetic clips, a temporary one when None
+        decode_threads (list): Thread counts every available decoder's throughput is measured at
+        log: Stream progress lines are written to
+
+    Returns:
+        dict: Environment description and one result per case
+    """
+    results = {
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+        },
+        'cases': [],
+    }
+
+    with tempfile.TemporaryDirectory(dir=workdir) as clip_dir:
+        for width, height in resolutions:
+            for frames in lengths:
+                for codec in codecs:
+                    name = f"{width}x{height}-{frames}f-{codec}"
+                    path = os.path.join(clip_dir, name + CODEC_EXTENSIONS.get(codec, '.avi'))
+                    try:
+                        cuts = generate_video(path, width, height, frames, codec)
+                    except RuntimeError as e:
+                        print(f"{name}: skipped ({e})", file=log)
+                        continue
+
+                    print(f"{name}: benchmarking", file=log)
+                    case = {'name': name, 'width': width, 'height': height,
+                            'frames': frames, 'codec': codec, 'cuts': cuts}
+                    case.update(benchmark_case(path, frames, cuts, repeat))
+                    case['decoders'] = measure_decoders(path, threads=decode_threads)
+                    results['cases'].append(case)
+                    os.unlink(path)
+
+    return results
+
+def compare_results(baseline, current, tolerance=0.10):
+    """
+    Compare two result files case by case and flag slower stages
+
+    Args:
+        baseline (dict): Earlier results from run_suite
+        current (dict): New results from run_suite
+        tolerance (float): Allowed relative slowdown before a stage counts as regressed
+
+    Returns:
+        list: One dict per stage present in both runs, with the time ratio and a regression flag
+    """
+    baseline_cases = {case['name']: case for case in baseline['cases']}
+    rows = []
+    for case in current['cases']:
+        old_case = baseline_cases.get(case['name'])
+        if old_case is None:
+            continue
+        for stage, entry in case['stages'].items():
+            old_entry = old_case['stages'].get(stage)
+            if old_entry is None or not old_entry['seconds']:
+                continue
+            ratio = entry['seconds'] / old_entry['seconds']
+            rows.append({
+                'case': case['name'],
+                'stage': stage,
+                'baseline_seconds': old_entry['seconds'],
+                'seconds': entry['seconds'],
+                'ratio': ratio,
+                'regressed': ratio > 1 + tolerance,
+            })
+    return rows
+
+def _parse_resolution(value):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+def _format_rate(value, width):
+    """
+    Right-align a rate to one decimal, or 'n/a' when a run was too fast to time
+    """
+    return f"{value:{width}.1f}" if value is not None else f"{'n/a':>{width}}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the VidGuard analysis pipeline.")
+    parser.add_argument('--resolutions', default='640x360,1280x720,1920x1080',
+                        help="comma-separated WIDTHxHEIGHT list")
+    parser.add_argument('--frames', default='150,600', help="comma-separated clip lengths in frames")
+    parser.add_argument('--codecs', default='mp4v,MJPG', help="comma-separated fourcc codes")
+    parser.add_argument('--repeat', type=int, default=1, help="runs per stage, the fastest is kept")
+    parser.add_argument('--decode-threads', default='0',
+                        help="comma-separated decoder thread counts to measure, 0 for the decoder's choice")
+    parser.add_argument('-o', '--output', default='benchmark.json', help="where to save the results")
+    parser.add_argument('--compare', metavar='BASELINE', help="compare against an earlier results file")
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help="relative slowdown reported as a regression (default: 0.10)")
+    args = parser.parse_args(argv)
+
+    results = run_suite(
+        [_parse_resolution(r) for r in args.resolutions.split(',')],
+        [int(n) for n in args.frames.split(',')],
+        args.codecs.split(','),
+        repeat=args.repeat,
+        decode_threads=[int(n) or None for n in args.decode_threads.split(',')],
+    )
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=4)
+
+    for case in results['cases']:
+        for stage, entry in case['stages'].items():
+            print(f"{case['name']:<28} {stage:<18} {entry['seconds']:8.3f}s "
+                  f"{_format_rate(entry['frames_per_second'], 9)} fps {_format_rate(entry['mb_per_second'], 8)} MB/s "
+                  f"{entry['peak_rss_mb']:7.1f} MB")
+        for run in case['decoders']:
+            label = f"decode:{run['decoder']}/{run['threads'] or 'auto'}"
+            print(f"{case['name']:<28} {label:<18} {run['seconds']:8.3f}s "
+                  f"{_format_rate(run['frames_per_second'], 9)} fps")
+    print(f"Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare_results(baseline, results, args.tolerance)
+        for row in rows:
+            marker = "REGRESSION" if row['regressed'] else ""
+            print(f"{row['case']:<28} {row['stage']:<18} {row['baseline_seconds']:8.3f}s -> "
+                  f"{row['seconds']:8.3f}s ({row['ratio']:.2f}x) {marker}")
+        return 1 if any(row['regressed'] for row in rows) else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
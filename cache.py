@@ -0,0 +1,332 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
+
+from utils import analyze_video, calculate_hashes, threshold_frames
+from thumbnails import ThumbnailWriter
+from detectors import (
+    DetectorSet, attach_detector_results, create_detectors, load_detector_scores,
+    save_detector_scores
+)
+from fingerprints import load_fingerprints, save_fingerprints
+from audio import load_audio_scores, save_audio_scores
+from seek_index import build_seek_index
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    'VIDGUARD_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'vidguard')
+)
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# Entry file name of the flagged-frame thumbnails written by ThumbnailWriter
+THUMBNAIL_ARTIFACT = 'thumbnails.vgt'
+
+# Entry file name of the keyframe/timestamp index saved by SeekIndex.save
+SEEK_INDEX_ARTIFACT = 'seek_index.npz'
+
+# Entry file name of the per-detector scores saved by save_detector_scores
+DETECTOR_ARTIFACT = 'detector_scores.npz'
+
+# Entry file name of the per-frame dHash array saved by save_fingerprints
+FINGERPRINT_ARTIFACT = 'fingerprints.npy'
+
+# Entry file name of the per-frame audio scores saved by save_audio_scores
+AUDIO_ARTIFACT = 'audio_scores.npz'
+
+class AnalysisCache:
+    """
+    On-disk cache of analysis results keyed by file content hash and parameters
+
+    Each entry is a directory holding the metadata, altered frames, the
+    per-frame score array and any artifact files produced by the scan. An entry's modification time is bumped on every
+    hit, and the least recently used entries are evicted once the cache
+    grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Args:
+            cache_dir (str): Directory the cache entries are stored in
+            max_bytes (int): Size cap of the cache directory in bytes
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, video_hash, params):
+        """
+        Build the cache key for a file and a set of analysis parameters
+
+        Args:
+            video_hash (str): Content hash of the video file
+            params (dict): Parameters that influence the frame scores
+
+        Returns:
+            str: Hex digest identifying the cache entry
+        """
+        encoded = json.dumps(params, sort_keys=True, default=list)
+        return hashlib.sha1(f"{video_hash}:{encoded}".encode()).hexdigest()
+
+    def get(self, video_hash, params):
+        """
+        Look up a cached analysis
+
+        Args:
+            video_hash (str): Content hash of the video file
+            params (dict): Parameters that influence the frame scores
+
+        Returns:
+            dict: Cached analysis with memory-mapped 'frame_scores' and 'artifacts'
+                paths inside the entry, or None on a miss
+        """
+        entry_dir = os.path.join(self.cache_dir, self.key(video_hash, params))
+        try:
+            with open(os.path.join(entry_dir, 'analysis.json')) as f:
+                analysis = json.load(f)
+            analysis['frame_scores'] = np.load(
+                os.path.join(entry_dir, 'frame_scores.npy'), mmap_mode='r'
+            )
+            analysis['artifacts'] = {
+                name: os.path.join(entry_dir, name) for name in analysis.get('artifacts', [])
+            }
+            os.utime(entry_dir)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return analysis
+
+    def put(self, video_hash, params, analysis):
+        """
+        Store an analysis and evict old entries if the cache is over its cap
+
+        Files listed in analysis['artifacts'] (entry file name to current path)
+        are moved into the entry, and the dict is updated to their new paths.
+
+        Args:
+            video_hash (str): Content hash of the video file
+            params (dict): Parameters that influence the frame scores
+            analysis (dict): Result of analyze_video
+        """
+        entry_dir = os.path.join(self.cache_dir, self.key(video_hash, params))
+        artifacts = analysis.get('artifacts', {})
+
+        # Write into a scratch directory and rename it so readers never see half an entry
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp-')
+        try:
+            stored = {k: v for k, v in analysis.items()
+                      if k not in ('frame_scores', 'detector_scores', 'fingerprints', 'audio_scores', 'artifacts')}
+            stored['artifacts'] = sorted(artifacts)
+            with open(os.path.join(tmp_dir, 'analysis.json'), 'w') as f:
+                json.dump(stored, f)
+            for name, path in artifacts.items():
+                shutil.move(path, os.path.join(tmp_dir, name))
+            np.save(
+                os.path.join(tmp_dir, 'frame_scores.npy'),
+                np.asarray(analysis['frame_scores'], dtype=np.float32),
+            )
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        analysis['artifacts'] = {name: os.path.join(entry_dir, name) for name in artifacts}
+        self._evict()
+
+    def stats(self):
+        """
+        Report cache usage and hit/miss statistics
+
+        Returns:
+            dict: Hits, misses, hit rate, entry count and total size in bytes
+        """
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(entries),
+            'bytes': sum(size for _, _, size in entries),
+            'max_bytes': self.max_bytes,
+        }
+
+    def clear(self):
+        """
+        Remove every cache entry
+        """
+        for entry_dir, _, _ in self._entries():
+            shutil.rmtree(entry_dir, ignore_errors=True)
+
+    def artifact_path(self, name):
+        """
+        Scratch path inside the cache directory for an artifact that put will adopt
+
+        Keeping scratch files on the same filesystem makes moving them into the
+        entry a cheap rename.
+
+        Args:
+            name (str): File name the artifact will have inside the entry
+
+        Returns:
+            str: Unused path in the cache directory
+        """
+        fd, path = tempfile.mkstemp(dir=self.cache_dir, prefix='.tmp-', suffix=f"-{name}")
+        os.close(fd)
+        return path
+
+    def _entries(self):
+        """
+        List cache entries with their last access time and size
+
+        Returns:
+            list: (path, mtime, size in bytes) tuples
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, name)
+            if name.startswith('.') or not os.path.isdir(entry_dir):
+                continue
+            try:
+                size = sum(
+                    os.path.getsize(os.path.join(entry_dir, f)) for f in os.listdir(entry_dir)
+                )
+                entries.append((entry_dir, os.path.getmtime(entry_dir), size))
+            except OSError:
+                # Entry was evicted or replaced by another process meanwhile
+                continue
+        return entries
+
+    def _evict(self):
+        """
+        Delete least recently used entries until the cache fits within max_bytes
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+        for entry_dir, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+
+def analyze_video_cached(cache, video_path, threshold=0.05, workers=1, scale=1.0, roi=None,
+                         hashes=None, progress_callback=None, thumbnails=False, detectors=None,
+                         decoder='opencv', decode_threads=None, audio=False):
+    """
+    analyze_video with results looked up in and stored to an AnalysisCache
+
+    The threshold is not part of the key: altered frames are re-derived from
+    the cached scores, so one entry serves every sensitivity setting.
+
+    Args:
+        cache (AnalysisCache): Cache to consult
+        video_path (str): Path to the video file
+        threshold (float): Threshold for frame difference detection
+        workers (int): Number of frame analysis processes, None for one per CPU core
+        scale (float): Resolution factor frames are diffed at, 1.0 for full resolution
+        roi (tuple): Optional (x, y, width, height) region to restrict the diff to
+        hashes (dict): Digests of the file if already known, must include 'md5'
+        progress_callback (callable): Passed on to analyze_video on a miss
+        thumbnails (bool): Store thumbnails of flagged frames as the
+            'thumbnails.vgt' artifact on a miss; forces a serial scan
+        detectors (list): Names of detectors to run alongside the scan on a miss;
+            forces a serial scan. Their scores are kept as the
+            'detector_scores.npz' artifact
+        decoder (str): Frame source from decoders.DECODERS; part of the key
+            because the gray decoders round slightly differently from cvtColor
+        decode_threads (int): Threads the decoder uses on a miss, None for its default
+        audio (bool): Score the audio track on a miss; its per-frame scores
+            are kept as the 'audio_scores.npz' artifact
+
+    Returns:
+        dict: Same structure as analyze_video, plus 'cache_hit' and 'artifacts';
+            the artifacts always include the video's seek index and fingerprints.
+            With detectors there are also 'detector_scores' arrays and a 'detectors'
+            summary. With audio there are 'audio' and, for a video with sound, 'audio_scores'
+    """
+    if hashes is None:
+        hashes = calculate_hashes(video_path)['digests']
+    video_hash = hashes['md5']
+    params = {'scale': scale, 'roi': roi}
+    if decoder != 'opencv':
+        params['decoder'] = decoder
+
+    analysis = cache.get(video_hash, params)
+    # An entry made without thumbnails, detectors or audio cannot serve a request that needs them,
+    # nor one from before every scan kept fingerprints
+    if analysis is not None and FINGERPRINT_ARTIFACT in analysis['artifacts'] \
+            and (not thumbnails or THUMBNAIL_ARTIFACT in analysis['artifacts']) \
+            and set(detectors or ()) <= set(analysis.get('detectors', {})) \
+            and (not audio or 'audio' in analysis):
+        analysis['altered_frames'] = threshold_frames(analysis['frame_scores'], threshold)
+        if DETECTOR_ARTIFACT in analysis['artifacts']:
+            analysis['detector_scores'] = load_detector_scores(analysis['artifacts'][DETECTOR_ARTIFACT])
+        if FINGERPRINT_ARTIFACT in analysis['artifacts']:
+            analysis['fingerprints'] = load_fingerprints(analysis['artifacts'][FINGERPRINT_ARTIFACT])
+        if AUDIO_ARTIFACT in analysis['artifacts']:
+            analysis['audio_scores'] = load_audio_scores(analysis['artifacts'][AUDIO_ARTIFACT])
+        analysis['cache_hit'] = True
+        return analysis
+
+    # The seek index places parallel segments on keyframes and is kept for later random access
+    seek_index = build_seek_index(video_path)
+    artifacts = {SEEK_INDEX_ARTIFACT: cache.artifact_path(SEEK_INDEX_ARTIFACT)}
+    seek_index.save(artifacts[SEEK_INDEX_ARTIFACT])
+
+    sinks = []
+    if thumbnails:
+        artifacts[THUMBNAIL_ARTIFACT] = cache.artifact_path(THUMBNAIL_ARTIFACT)
+        sinks.append(ThumbnailWriter(artifacts[THUMBNAIL_ARTIFACT], threshold))
+    detector_set = DetectorSet(create_detectors(detectors)) if detectors else None
+    if detector_set is not None:
+        sinks.append(detector_set)
+
+    try:
+        analysis = analyze_video(
+            video_path, threshold, workers, scale, roi, hashes=hashes,
+            progress_callback=progress_callback, sinks=sinks, seek_index=seek_index,
+            decoder=decoder, decode_threads=decode_threads, audio=audio,
+        )
+    except Exception:
+        _discard_artifacts(artifacts)
+        raise
+    finally:
+        for sink in sinks:
+            sink.close()
+
+    if detector_set is not None:
+        attach_detector_results(analysis, detector_set.detectors)
+        artifacts[DETECTOR_ARTIFACT] = cache.artifact_path(DETECTOR_ARTIFACT)
+        save_detector_scores(analysis['detector_scores'], artifacts[DETECTOR_ARTIFACT])
+    if 'fingerprints' in analysis:
+        artifacts[FINGERPRINT_ARTIFACT] = cache.artifact_path(FINGERPRINT_ARTIFACT)
+        save_fingerprints(analysis['fingerprints'], artifacts[FINGERPRINT_ARTIFACT])
+    if 'audio_scores' in analysis:
+        artifacts[AUDIO_ARTIFACT] = cache.artifact_path(AUDIO_ARTIFACT)
+        save_audio_scores(analysis['audio_scores'], artifacts[AUDIO_ARTIFACT])
+    analysis['artifacts'] = artifacts
+
+    if 'error' not in analysis['metadata']:
+        cache.put(video_hash, params, analysis)
+    else:
+        _discard_artifacts(artifacts)
+        analysis['artifacts'] = {}
+    analysis['cache_hit'] = False
+    return analysis
+
+def _discard_artifacts(artifacts):
+    for path in artifacts.values():
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+# A video is recognised by the digest of its first bytes, which stay the same while a recording grows
+IDENTITY_BYTES = 1024 * 1024
+
+def frame_digest(gray_frame):
+    """
+    Digest of a grayscale frame, used to check a resumed decode lines up with the checkpoint
+
+    Args:
+        gray_frame (numpy.ndarray): Contiguous grayscale frame
+
+    Returns:
+        str: Hex MD5 of the pixel data
+    """
+    return hashlib.md5(np.ascontiguousarray(gray_frame)).hexdigest()
+
+def _head_digest(video_path, length):
+    with open(video_path, 'rb') as f:
+        head = f.read(length)
+    return hashlib.md5(head).hexdigest() if len(head) == length else None
+
+class ScanCheckpoint:
+    """
+    On-disk state of a resumable frame scan
+
+    Scores are appended to a raw float32 file next to a small JSON state
+    holding the number of frames scored and the digest of the last frame.
+    The state is replaced atomically and is authoritative: scores appended
+    after the last save are cut off when the scan resumes, so a process
+    killed at any point leaves a consistent checkpoint.
+    """
+
+    def __init__(self, path, video_path, params):
+        """
+        Args:
+            path (str): Path of the JSON state; scores go to path + '.scores'
+            video_path (str): Video being scanned
+            params (dict): Scan parameters the checkpoint is only valid for, e.g. scale and roi
+        """
+        self.path = path
+        self.scores_path = f"{path}.scores"
+        self.video_path = video_path
+        self.params = params
+        self._identity = None
+
+    def load(self):
+        """
+        Read the state left by an earlier scan of the same video with the same parameters
+
+        Returns:
+            tuple: (frames scored, digest of the last scored frame), (0, None) to start over
+        """
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            scores_size = os.path.getsize(self.scores_path)
+        except (OSError, ValueError):
+            return self.reset()
+
+        identity = state.get('identity', {})
+        frames = state.get('frames', 0)
+        if state.get('params') != json.loads(json.dumps(self.params)) \
+                or _head_digest(self.video_path, identity.get('length', 0)) != identity.get('md5') \
+                or scores_size < frames * 4:
+            return self.reset()
+
+        self._identity = identity
+        os.truncate(self.scores_path, frames * 4)
+        return frames, state.get('digest')
+
+    def reset(self):
+        """
+        Discard any saved progress
+
+        Returns:
+            tuple: (0, None), the state of a scan that has not started
+        """
+        self._identity = None
+        open(self.scores_path, 'wb').close()
+        self.save(0, None)
+        return 0, None
+
+    def append(self, scores):
+        """
+        Append scores of newly decoded frames; they count once save is called
+
+        Args:
+            scores (list): Change scores in frame order
+        """
+        if len(scores):
+            with open(self.scores_path, 'ab') as f:
+                f.write(np.asarray(scores, dtype=np.float32).tobytes())
+
+    def save(self, frames, digest):
+        """
+        Record how far the scan has got
+
+        Args:
+            frames (int): Number of frames scored, all of them already appended
+            digest (str): frame_digest of the last scored frame
+        """
+        # Pin the identity to as many leading bytes as exist, up to IDENTITY_BYTES,
+        # widening it while a recording that started small grows
+        length = min(os.path.getsize(self.video_path), IDENTITY_BYTES)
+        if self._identity is None or self._identity['length'] < length:
+            self._identity = {'length': length, 'md5': _head_digest(self.video_path, length)}
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'video_path': self.video_path,
+                'params': self.params,
+                'identity': self._identity,
+                'frames': frames,
+                'digest': digest,
+            }, f)
+        os.replace(tmp_path, self.path)
+
+    def scores(self):
+        """
+        Scores saved so far
+
+        Returns:
+            numpy.ndarray: float32 score per scored frame
+        """
+        return np.fromfile(self.scores_path, dtype=np.float32)
+
+    def remove(self):
+        """
+        Delete the checkpoint files
+        """
+        remove_checkpoint(self.path)
+
+def remove_checkpoint(path):
+    """
+    Delete a checkpoint's state and scores, ignoring files that do not exist
+
+    Args:
+        path (str): Path of the checkpoint state
+    """
+    for checkpoint_file in (path, f"{path}.scores"):
+        try:
+            os.unlink(checkpoint_file)
+        except OSError:
+            pass
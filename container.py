@@ -0,0 +1,723 @@
+import datetime
+import os
+import struct
+import numpy as np
+
+# MP4 times count seconds from 1904-01-01, Matroska DateUTC nanoseconds from 2001-01-01
+MP4_EPOCH = datetime.datetime(1904, 1, 1, tzinfo=datetime.timezone.utc)
+MATROSKA_EPOCH = datetime.datetime(2001, 1, 1, tzinfo=datetime.timezone.utc)
+
+# A frame interval this many times the median interval is reported as a gap
+GAP_FACTOR = 1.5
+
+# Anomaly lists in the JSON summary are cut to this many entries
+MAX_REPORTED_ANOMALIES = 100
+
+# MP4 boxes that only contain other boxes
+MP4_CONTAINERS = {b'moov', b'trak', b'mdia', b'minf', b'stbl', b'edts', b'udta', b'mvex',
+                  b'moof', b'traf', b'ilst'}
+
+# Matroska element ids
+EBML_HEADER = 0x1A45DFA3
+MKV_SEGMENT = 0x18538067
+MKV_INFO = 0x1549A966
+MKV_TIMESTAMP_SCALE = 0x2AD7B1
+MKV_DATE_UTC = 0x4461
+MKV_MUXING_APP = 0x4D80
+MKV_WRITING_APP = 0x5741
+MKV_TRACKS = 0x1654AE6B
+MKV_TRACK_ENTRY = 0xAE
+MKV_TRACK_NUMBER = 0xD7
+MKV_TRACK_TYPE = 0x83
+MKV_CODEC_ID = 0x86
+MKV_DEFAULT_DURATION = 0x23E383
+MKV_CLUSTER = 0x1F43B675
+MKV_CLUSTER_TIMESTAMP = 0xE7
+MKV_SIMPLE_BLOCK = 0xA3
+MKV_BLOCK_GROUP = 0xA0
+MKV_BLOCK = 0xA1
+MKV_REFERENCE_BLOCK = 0xFB
+MKV_UNKNOWN_SIZE = -1
+
+def parse_container(video_path):
+    """
+    Read frame timing and file metadata from the container, without decoding
+
+    MP4/MOV files are read from their sample tables (and movie fragments),
+    Matroska/WebM files from their block headers. Only box and element
+    headers are read; sample data is skipped with seeks. MP4 samples that
+    the edit list leaves out are dropped, as decoders drop them, and
+    counted as 'trimmed_samples'.
+
+    Args:
+        video_path (str): Path to the video file
+
+    Returns:
+        dict: Container description with numpy 'timestamps_ms' (presentation
+            order, relative to the first frame) and 'keyframes' arrays, the
+            first frame's 'start_seconds' on the presentation timeline and,
+            when there is an audio track, where its first sample plays as
+            'audio_start_seconds'; or None if the format is not recognised or
+            has no video track
+
+    Raises:
+        ValueError: If the container structure is truncated or corrupt
+    """
+    with open(video_path, 'rb') as f:
+        head = f.read(12)
+        f.seek(0)
+        try:
+            if int.from_bytes(head[:4], 'big') == EBML_HEADER:
+                info = _parse_matroska(f)
+            elif head[4:8] in (b'ftyp', b'moov', b'mdat', b'free', b'wide', b'skip'):
+                info = _parse_mp4(f, os.fstat(f.fileno()).st_size)
+            else:
+                return None
+        except (struct.error, IndexError, ValueError) as e:
+            raise ValueError(f"{video_path}: malformed container ({e})") from e
+
+    if info is None or len(info['pts']) == 0:
+        return None
+    return _finish(info)
+
+def container_summary(info):
+    """
+    JSON-serialisable summary of parse_container output for the report
+
+    Args:
+        info (dict): Result of parse_container
+
+    Returns:
+        dict: Everything except the per-frame arrays, with anomaly lists truncated
+    """
+    summary = {k: v for k, v in info.items() if k not in ('timestamps_ms', 'keyframes', 'anomalies')}
+    summary['keyframe_count'] = int(len(info['keyframes']))
+    summary['anomalies'] = {
+        name: {'count': len(items), 'items': items[:MAX_REPORTED_ANOMALIES]}
+        for name, items in info['anomalies'].items()
+    }
+    return summary
+
+def find_timestamp_anomalies(timestamps_ms, gap_factor=GAP_FACTOR):
+    """
+    Flag timestamp gaps and duplicate presentation times
+
+    A gap (missing frames) shows up as one interval much longer than the
+    typical one; duplicates (inserted frames) as two frames with the same
+    presentation time.
+
+    Args:
+        timestamps_ms (numpy.ndarray): Presentation times in presentation order
+        gap_factor (float): Interval relative to the median that counts as a gap
+
+    Returns:
+        dict: 'timestamp_gaps' and 'duplicate_pts' lists
+    """
+    timestamps_ms = np.asarray(timestamps_ms, dtype=np.float64)
+    if len(timestamps_ms) < 3:
+        return {'timestamp_gaps': [], 'duplicate_pts': []}
+
+    intervals = np.diff(timestamps_ms)
+    positive = intervals[intervals > 0]
+    expected = float(np.median(positive)) if len(positive) else 0.0
+
+    gaps = []
+    if expected > 0:
+        for i in np.flatnonzero(intervals > expected * gap_factor):
+            gaps.append({
+                'frame': int(i + 1),
+                'interval_ms': float(intervals[i]),
+                'expected_ms': expected,
+                'missing_frames': int(round(intervals[i] / expected)) - 1,
+            })
+
+    duplicates = [
+        {'frame': int(i + 1), 'pts_ms': float(timestamps_ms[i + 1])}
+        for i in np.flatnonzero(intervals == 0)
+    ]
+    return {'timestamp_gaps': gaps, 'duplicate_pts': duplicates}
+
+def _finish(info):
+    """
+    Sort raw per-sample data into presentation order and derive the summary fields
+    """
+    pts = np.asarray(info.pop('pts'), dtype=np.float64)
+    is_keyframe = np.asarray(info.pop('is_keyframe'), dtype=bool)
+    dts = info.pop('dts', None)
+
+    order = np.argsort(pts, kind='stable')
+    pts_sorted = pts[order]
+    info['timestamps_ms'] = (pts_sorted - pts_sorted[0]) * 1000.0
+    info['start_seconds'] = float(pts_sorted[0])
+    info['keyframes'] = np.flatnonzero(is_keyframe[order])
+    info['frame_count'] = int(len(pts))
+    if len(pts) > 1:
+        info['duration_seconds'] = float(pts_sorted[-1] - pts_sorted[0]) + \
+            float(np.median(np.diff(pts_sorted)))
+    else:
+        info['duration_seconds'] = 0.0
+    info['frame_rate'] = (
+        info['frame_count'] / info['duration_seconds'] if info['duration_seconds'] > 0 else None
+    )
+
+    anomalies = find_timestamp_anomalies(info['timestamps_ms'])
+    if dts is not None:
+        # Decode timestamps must never go backwards
+        dts = np.asarray(dts, dtype=np.float64)
+        anomalies['non_monotonic_dts'] = [
+            {'sample': int(i + 1), 'dts_ms': float(dts[i + 1] * 1000.0)}
+            for i in np.flatnonzero(np.diff(dts) < 0)
+        ]
+    info['anomalies'] = anomalies
+    return info
+
+def _mp4_time(seconds):
+    if not seconds:
+        return None
+    try:
+        return (MP4_EPOCH + datetime.timedelta(seconds=seconds)).isoformat()
+    except OverflowError:
+        return None
+
+def _iter_boxes(f, start, end):
+    """
+    Yield (type, payload offset, payload size) of the boxes between start and end
+    """
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack('>I4s', header)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size:
+            return
+        yield box_type, offset + header_size, size - header_size
+        offset += size
+
+def _walk_mp4(f, start, end, path=()):
+    """
+    Yield (path, payload offset, payload size) for every box, descending into containers
+    """
+    for box_type, payload, size in _iter_boxes(f, start, end):
+        box_path = path + (box_type,)
+        yield box_path, payload, size
+        if box_type in MP4_CONTAINERS:
+            yield from _walk_mp4(f, payload, payload + size, box_path)
+        elif box_type == b'meta':
+            # ISO meta is a full box, with 4 bytes of version and flags before its
+            # children; QuickTime's is a plain box whose first child starts at once
+            f.seek(payload)
+            head = f.read(8)
+            plain = len(head) == 8 and 8 <= struct.unpack('>I', head[:4])[0] <= size and \
+                head[4:8].isalnum()
+            yield from _walk_mp4(f, payload if plain else payload + 4, payload + size, box_path)
+
+def _read_full_box(f, payload, size):
+    f.seek(payload)
+    data = f.read(size)
+    return data[0], data[4:]
+
+def _parse_mp4(f, file_size):
+    info = {'format': 'mp4', 'fragmented': False, 'tags': {}}
+    tracks = {}
+    current = None
+    fragments = []
+
+    for box_type, payload, size in _iter_boxes(f, 0, file_size):
+        if box_type == b'ftyp':
+            f.seek(payload)
+            info['brand'] = f.read(4).decode('latin-1')
+        elif box_type == b'moov':
+            for path, box_payload, box_size in _walk_mp4(f, payload, payload + size, (b'moov',)):
+                name = path[-1]
+                if name == b'trak':
+                    current = {'edits': []}
+                    tracks[len(tracks)] = current
+                elif name == b'mvhd':
+                    version, data = _read_full_box(f, box_payload, box_size)
+                    if version == 1:
+                        created, modified, timescale, duration = struct.unpack('>QQIQ', data[:28])
+                    else:
+                        created, modified, timescale, duration = struct.unpack('>IIII', data[:16])
+                    info['creation_time'] = _mp4_time(created)
+                    info['modification_time'] = _mp4_time(modified)
+                    info['movie_timescale'] = timescale
+                elif current is not None and b'trak' in path:
+                    _parse_mp4_track_box(f, name, box_payload, box_size, current)
+                elif name == b'trex':
+                    _, data = _read_full_box(f, box_payload, box_size)
+                    track_id, _, default_duration = struct.unpack('>III', data[:12])
+                    info.setdefault('trex', {})[track_id] = default_duration
+                elif len(path) >= 2 and path[-2] == b'ilst':
+                    value = _read_ilst_value(f, box_payload, box_size)
+                    if value is not None:
+                        info['tags'][name.decode('latin-1')] = value
+                elif name[:1] == b'\xa9' and b'udta' in path and b'ilst' not in path:
+                    # QuickTime user data string: 2-byte length, 2-byte language, text
+                    f.seek(box_payload)
+                    data = f.read(box_size)
+                    if len(data) >= 4:
+                        length = struct.unpack('>H', data[:2])[0]
+                        info['tags'][name.decode('latin-1')] = \
+                            data[4:4 + length].decode('utf-8', 'replace')
+        elif box_type == b'moof':
+            info['fragmented'] = True
+            fragments.append((payload, size))
+
+    video = next((t for t in tracks.values() if t.get('handler') == 'vide'), None)
+    if video is None or not video.get('timescale'):
+        return None
+    movie_timescale = info.get('movie_timescale')
+    sound = next((t for t in tracks.values() if t.get('handler') == 'soun'), None)
+    if sound is not None:
+        # Decoders drop the samples before the edit's media time, so the first
+        # sample they output plays once the leading empty edits are over
+        info['audio_start_seconds'] = _empty_edit_seconds(sound['edits'], movie_timescale)
+
+    info['video_codec'] = video.get('codec')
+    info['timescale'] = video['timescale']
+    info['track_creation_time'] = video.get('creation_time')
+    info['edit_list'] = video['edits']
+    info['encoder'] = info['tags'].get('\xa9too') or info['tags'].get('\xa9enc') or \
+        info['tags'].get('\xa9swr')
+
+    _check_sample_tables(video, file_size)
+    durations = np.repeat(
+        np.array([d for _, d in video.get('stts', [])], dtype=np.int64),
+        np.array([c for c, _ in video.get('stts', [])], dtype=np.int64),
+    )
+    offsets = np.repeat(
+        np.array([o for _, o in video.get('ctts', [])], dtype=np.int64),
+        np.array([c for c, _ in video.get('ctts', [])], dtype=np.int64),
+    )
+    sync = video.get('stss')
+
+    for payload, size in fragments:
+        default_duration = info.get('trex', {}).get(video.get('track_id'), 0)
+        fragment = _parse_mp4_fragment(f, payload, size, video.get('track_id'), default_duration, file_size)
+        if fragment is None:
+            continue
+        frag_durations, frag_offsets, frag_sync = fragment
+        base = len(durations)
+        if sync is None and len(frag_sync) != len(frag_durations):
+            sync = np.arange(1, base + 1)
+        durations = np.concatenate([durations, frag_durations])
+        if len(frag_offsets) and len(offsets) < base:
+            offsets = np.concatenate([offsets, np.zeros(base - len(offsets), dtype=np.int64)])
+        offsets = np.concatenate([offsets, frag_offsets])
+        if sync is not None:
+            sync = np.concatenate([np.asarray(sync), frag_sync + base + 1])
+
+    sample_count = len(durations)
+    if sample_count == 0:
+        return None
+    dts = np.concatenate([[0], np.cumsum(durations[:-1])]).astype(np.int64)
+    if len(offsets) < sample_count:
+        offsets = np.concatenate([offsets, np.zeros(sample_count - len(offsets), dtype=np.int64)])
+    pts = dts + offsets[:sample_count]
+
+    is_keyframe = np.ones(sample_count, dtype=bool)
+    if sync is not None:
+        is_keyframe[:] = False
+        sync = np.asarray(sync, dtype=np.int64) - 1
+        is_keyframe[sync[(sync >= 0) & (sync < sample_count)]] = True
+
+    # Samples outside every edit are decoded as references but never output, so they are not frames
+    presented = _presented_samples(pts, video['edits'], video['timescale'], movie_timescale)
+    info['trimmed_samples'] = int(sample_count - presented.sum())
+    pts, is_keyframe = pts[presented], is_keyframe[presented]
+
+    # The first edit with a media time says where presentation starts in the media
+    media_start = next((e['media_time'] for e in video['edits'] if e['media_time'] >= 0), 0)
+    timescale = float(video['timescale'])
+    info['pts'] = (pts - media_start) / timescale + _empty_edit_seconds(video['edits'], movie_timescale)
+    info['dts'] = dts / timescale
+    info['is_keyframe'] = is_keyframe
+
+    info.pop('trex', None)
+    return info
+
+def _presented_samples(pts, edits, timescale, movie_timescale):
+    """
+    Mask of the samples whose composition time falls inside an edit that shows media
+
+    An edit covers its media time plus its duration, converted from the movie
+    timescale; one without a duration, as fragmented files write, covers the
+    rest of the media. Without such edits every sample is presented.
+    """
+    edits = [edit for edit in edits if edit['media_time'] >= 0]
+    if not edits or not movie_timescale:
+        return np.ones(len(pts), dtype=bool)
+    presented = np.zeros(len(pts), dtype=bool)
+    for edit in edits:
+        end = edit['media_time'] + edit['duration'] * timescale / movie_timescale if edit['duration'] else np.inf
+        presented |= (pts >= edit['media_time']) & (pts < end)
+    # An edit list that presents nothing is more likely wrong than the samples
+    return presented if presented.any() else np.ones(len(pts), dtype=bool)
+
+def _empty_edit_seconds(edits, movie_timescale):
+    """
+    Seconds of the empty edits a track starts with, the delay before it plays
+    """
+    delay = 0
+    for edit in edits:
+        if edit['media_time'] != -1:
+            break
+        delay += edit['duration']
+    return delay / movie_timescale if movie_timescale else 0.0
+
+def _check_sample_tables(track, file_size):
+    """
+    Check that the sample tables of a track agree before they are expanded
+
+    The run-length counts in stts and ctts are expanded into one entry per
+    sample, so a corrupt count would allocate gigabytes; they must add up
+    to the stsz sample count, whose samples must fit in the file.
+
+    Raises:
+        ValueError: If the counts disagree or the samples do not fit in the file
+    """
+    sample_count = track.get('sample_count', 0)
+    if track.get('sample_bytes', 0) > file_size:
+        raise ValueError(f"{sample_count} samples of {track['sample_bytes']} bytes do not fit "
+                         f"in a file of {file_size} bytes")
+    for table in ('stts', 'ctts'):
+        if table not in track:
+            continue
+        total = sum(count for count, _ in track[table])
+        if total != sample_count:
+            raise ValueError(f"{table} covers {total} samples, stsz has {sample_count}")
+
+def _parse_mp4_track_box(f, name, payload, size, track):
+    if name == b'tkhd':
+        version, data = _read_full_box(f, payload, size)
+        track['track_id'] = struct.unpack('>I', data[16:20] if version == 1 else data[8:12])[0]
+    elif name == b'mdhd':
+        version, data = _read_full_box(f, payload, size)
+        if version == 1:
+            created, _, timescale, _ = struct.unpack('>QQIQ', data[:28])
+        else:
+            created, _, timescale, _ = struct.unpack('>IIII', data[:16])
+        track['timescale'] = timescale
+        track['creation_time'] = _mp4_time(created)
+    elif name == b'hdlr':
+        _, data = _read_full_box(f, payload, size)
+        track['handler'] = data[4:8].decode('latin-1')
+    elif name == b'stsd':
+        _, data = _read_full_box(f, payload, size)
+        if len(data) >= 12:
+            track['codec'] = data[8:12].decode('latin-1')
+    elif name == b'stts':
+        _, data = _read_full_box(f, payload, size)
+        count = struct.unpack('>I', data[:4])[0]
+        entries = np.frombuffer(data, dtype='>u4', count=count * 2, offset=4).reshape(-1, 2)
+        track['stts'] = [(int(c), int(d)) for c, d in entries]
+    elif name == b'ctts':
+        version, data = _read_full_box(f, payload, size)
+        count = struct.unpack('>I', data[:4])[0]
+        dtype = '>i4' if version == 1 else '>u4'
+        counts = np.frombuffer(data, dtype='>u4', count=count * 2, offset=4)[0::2]
+        values = np.frombuffer(data, dtype=dtype, count=count * 2, offset=4)[1::2]
+        track['ctts'] = list(zip(counts.tolist(), values.astype(np.int64).tolist()))
+    elif name == b'stsz':
+        _, data = _read_full_box(f, payload, size)
+        sample_size, count = struct.unpack('>II', data[:8])
+        track['sample_count'] = count
+        if sample_size:
+            track['sample_bytes'] = sample_size * count
+        else:
+            track['sample_bytes'] = int(np.frombuffer(data, dtype='>u4', count=count, offset=8).sum(dtype=np.int64))
+    elif name == b'stz2':
+        # Compact sample sizes: only the count is needed, and each sample takes at least a byte
+        _, data = _read_full_box(f, payload, size)
+        track['sample_count'] = track['sample_bytes'] = struct.unpack('>I', data[4:8])[0]
+    elif name == b'stss':
+        _, data = _read_full_box(f, payload, size)
+        count = struct.unpack('>I', data[:4])[0]
+        track['stss'] = np.frombuffer(data, dtype='>u4', count=count, offset=4).astype(np.int64)
+    elif name == b'elst':
+        version, data = _read_full_box(f, payload, size)
+        count = struct.unpack('>I', data[:4])[0]
+        entry_format, entry_size = ('>Qqhh', 20) if version == 1 else ('>Iihh', 12)
+        for i in range(count):
+            duration, media_time, rate, _ = struct.unpack_from(entry_format, data, 4 + i * entry_size)
+            track['edits'].append({'duration': duration, 'media_time': media_time, 'rate': rate})
+
+def _read_ilst_value(f, payload, size):
+    for box_type, data_payload, data_size in _iter_boxes(f, payload, payload + size):
+        if box_type == b'data':
+            f.seek(data_payload)
+            data = f.read(data_size)
+            # 4 bytes of type, 4 bytes of locale, then the value
+            return data[8:].decode('utf-8', 'replace')
+    return None
+
+def _parse_mp4_fragment(f, payload, size, track_id, default_duration, file_size):
+    """
+    Sample durations, composition offsets and sync samples of one moof for a track
+
+    Raises:
+        ValueError: If a trun claims more samples than the file could hold
+    """
+    durations, offsets, sync = [], [], []
+    found = False
+    for path, box_payload, box_size in _walk_mp4(f, payload, payload + size, (b'moof',)):
+        name = path[-1]
+        if name == b'tfhd':
+            f.seek(box_payload)
+            data = f.read(box_size)
+            flags = int.from_bytes(data[1:4], 'big')
+            data = data[4:]
+            fragment_track = struct.unpack('>I', data[:4])[0]
+            found = fragment_track == track_id
+            position = 4
+            if flags & 0x01:
+                position += 8
+            if flags & 0x02:
+                position += 4
+            fragment_default = default_duration
+            if flags & 0x08:
+                fragment_default = struct.unpack('>I', data[position:position + 4])[0]
+        elif name == b'trun' and found:
+            f.seek(box_payload)
+            data = f.read(box_size)
+            flags = int.from_bytes(data[1:4], 'big')
+            version = data[0]
+            count = struct.unpack('>I', data[4:8])[0]
+            # Every sample takes at least a byte of media data
+            if count > file_size:
+                raise ValueError(f"trun claims {count} samples in a file of {file_size} bytes")
+            position = 8
+            if flags & 0x01:
+                position += 4
+            first_sample_flags = None
+            if flags & 0x04:
+                first_sample_flags = struct.unpack('>I', data[position:position + 4])[0]
+                position += 4
+            for i in range(count):
+                duration = fragment_default
+                sample_flags = None
+                offset = 0
+                if flags & 0x100:
+                    duration = struct.unpack('>I', data[position:position + 4])[0]
+                    position += 4
+                if flags & 0x200:
+                    position += 4
+                if flags & 0x400:
+                    sample_flags = struct.unpack('>I', data[position:position + 4])[0]
+                    position += 4
+                if flags & 0x800:
+                    offset = struct.unpack('>i' if version else '>I', data[position:position + 4])[0]
+                    position += 4
+                if i == 0 and first_sample_flags is not None:
+                    sample_flags = first_sample_flags
+                durations.append(duration)
+                offsets.append(offset)
+                # sample_is_non_sync_sample is bit 16 of the sample flags
+                if sample_flags is not None and not sample_flags & 0x10000:
+                    sync.append(len(durations) - 1)
+    if not durations:
+        return None
+    return (np.array(durations, dtype=np.int64), np.array(offsets, dtype=np.int64),
+            np.array(sync, dtype=np.int64))
+
+def _read_vint(f):
+    """
+    Read an EBML variable-length integer
+
+    Returns:
+        tuple: (value with the length marker removed, number of bytes), or (None, 0) at EOF
+    """
+    first = f.read(1)
+    if not first:
+        return None, 0
+    byte = first[0]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not byte & mask:
+        mask >>= 1
+        length += 1
+    if length > 8:
+        raise ValueError("invalid EBML variable-length integer")
+    value = byte & (mask - 1)
+    rest = f.read(length - 1)
+    for b in rest:
+        value = (value << 8) | b
+    if value == (1 << (7 * length)) - 1:
+        value = MKV_UNKNOWN_SIZE
+    return value, length
+
+def _read_element_id(f):
+    first = f.read(1)
+    if not first:
+        return None
+    byte = first[0]
+    length = 1
+    mask = 0x80
+    while length <= 4 and not byte & mask:
+        mask >>= 1
+        length += 1
+    if length > 4:
+        raise ValueError("invalid EBML element id")
+    return int.from_bytes(first + f.read(length - 1), 'big')
+
+def _iter_elements(f, start, end):
+    """
+    Yield (id, data offset, data size) of the EBML elements between start and end
+    """
+    offset = start
+    while end is None or offset < end:
+        f.seek(offset)
+        element_id = _read_element_id(f)
+        if element_id is None:
+            return
+        size, _ = _read_vint(f)
+        if size is None:
+            return
+        data = f.tell()
+        yield element_id, data, size
+        if size == MKV_UNKNOWN_SIZE:
+            # Only masters (Segment, Cluster) have unknown sizes; their children follow directly
+            offset = data
+            if element_id not in (MKV_SEGMENT, MKV_CLUSTER):
+                return
+            continue
+        offset = data + size
+
+def _read_uint(f, offset, size):
+    f.seek(offset)
+    return int.from_bytes(f.read(size), 'big')
+
+def _read_string(f, offset, size):
+    f.seek(offset)
+    return f.read(size).rstrip(b'\x00').decode('utf-8', 'replace')
+
+def _parse_matroska(f):
+    f.seek(0, os.SEEK_END)
+    file_size = f.tell()
+    info = {'format': 'matroska', 'fragmented': False, 'tags': {}, 'edit_list': []}
+    timestamp_scale = 1000000
+    video_track = None
+    default_duration = None
+    pts, is_keyframe = [], []
+    # Number of the first audio track and the earliest timestamp of its blocks
+    audio = {'track': None, 'start': None}
+    cluster_time = 0
+
+    segment = None
+    for element_id, data, size in _iter_elements(f, 0, file_size):
+        if element_id == MKV_SEGMENT:
+            segment = (data, file_size if size == MKV_UNKNOWN_SIZE else data + size)
+            break
+    if segment is None:
+        return None
+
+    # Walk the segment flat: unknown-size clusters make their children appear inline
+    for element_id, data, size in _iter_elements(f, segment[0], segment[1]):
+        if element_id == MKV_INFO:
+            for child_id, child_data, child_size in _iter_elements(f, data, data + size):
+                if child_id == MKV_TIMESTAMP_SCALE:
+                    timestamp_scale = _read_uint(f, child_data, child_size)
+                elif child_id == MKV_DATE_UTC:
+                    f.seek(child_data)
+                    nanoseconds = int.from_bytes(f.read(child_size), 'big', signed=True)
+                    info['creation_time'] = (
+                        MATROSKA_EPOCH + datetime.timedelta(microseconds=nanoseconds / 1000)
+                    ).isoformat()
+                elif child_id == MKV_MUXING_APP:
+                    info['tags']['MuxingApp'] = _read_string(f, child_data, child_size)
+                elif child_id == MKV_WRITING_APP:
+                    info['tags']['WritingApp'] = _read_string(f, child_data, child_size)
+        elif element_id == MKV_TRACKS:
+            for entry_id, entry_data, entry_size in _iter_elements(f, data, data + size):
+                if entry_id != MKV_TRACK_ENTRY:
+                    continue
+                track = {}
+                for child_id, child_data, child_size in _iter_elements(f, entry_data, entry_data + entry_size):
+                    if child_id == MKV_TRACK_NUMBER:
+                        track['number'] = _read_uint(f, child_data, child_size)
+                    elif child_id == MKV_TRACK_TYPE:
+                        track['type'] = _read_uint(f, child_data, child_size)
+                    elif child_id == MKV_CODEC_ID:
+                        track['codec'] = _read_string(f, child_data, child_size)
+                    elif child_id == MKV_DEFAULT_DURATION:
+                        track['default_duration'] = _read_uint(f, child_data, child_size)
+                if track.get('type') == 1 and video_track is None:
+                    video_track = track['number']
+                    info['video_codec'] = track.get('codec')
+                    default_duration = track.get('default_duration')
+                elif track.get('type') == 2 and audio['track'] is None:
+                    audio['track'] = track.get('number')
+        elif element_id == MKV_CLUSTER:
+            if size == MKV_UNKNOWN_SIZE:
+                continue
+            cluster_time = _read_matroska_cluster(
+                f, data, data + size, video_track, cluster_time, pts, is_keyframe, audio
+            )
+        elif element_id == MKV_CLUSTER_TIMESTAMP:
+            cluster_time = _read_uint(f, data, size)
+        elif element_id in (MKV_SIMPLE_BLOCK, MKV_BLOCK_GROUP):
+            _read_matroska_block(f, element_id, data, size, video_track, cluster_time, pts, is_keyframe, audio)
+
+    if video_track is None:
+        return None
+
+    info['encoder'] = info['tags'].get('WritingApp') or info['tags'].get('MuxingApp')
+    info['timescale'] = 1e9 / timestamp_scale
+    if default_duration:
+        info['nominal_frame_rate'] = 1e9 / default_duration
+    info['pts'] = np.array(pts, dtype=np.float64) * timestamp_scale / 1e9
+    info['is_keyframe'] = np.array(is_keyframe, dtype=bool)
+    if audio['start'] is not None:
+        info['audio_start_seconds'] = audio['start'] * timestamp_scale / 1e9
+    return info
+
+def _read_matroska_cluster(f, start, end, video_track, cluster_time, pts, is_keyframe, audio):
+    for element_id, data, size in _iter_elements(f, start, end):
+        if element_id == MKV_CLUSTER_TIMESTAMP:
+            cluster_time = _read_uint(f, data, size)
+        elif element_id in (MKV_SIMPLE_BLOCK, MKV_BLOCK_GROUP):
+            _read_matroska_block(f, element_id, data, size, video_track, cluster_time, pts, is_keyframe, audio)
+    return cluster_time
+
+def _read_matroska_block(f, element_id, data, size, video_track, cluster_time, pts, is_keyframe, audio):
+    """
+    Append the timestamp and keyframe flag of one block if it belongs to the video track,
+    or lower the audio start if it belongs to the audio track
+    """
+    keyframe = None
+    if element_id == MKV_BLOCK_GROUP:
+        block = None
+        keyframe = True
+        for child_id, child_data, child_size in _iter_elements(f, data, data + size):
+            if child_id == MKV_BLOCK:
+                block = child_data
+            elif child_id == MKV_REFERENCE_BLOCK:
+                keyframe = False
+        if block is None:
+            return
+        data = block
+
+    f.seek(data)
+    track, _ = _read_vint(f)
+    if track != video_track and track != audio['track']:
+        return
+    header = f.read(3)
+    if len(header) < 3:
+        return
+    relative_time = struct.unpack('>h', header[:2])[0]
+    if track != video_track:
+        if audio['start'] is None or cluster_time + relative_time < audio['start']:
+            audio['start'] = cluster_time + relative_time
+        return
+    if keyframe is None:
+        keyframe = bool(header[2] & 0x80)
+    pts.append(cluster_time + relative_time)
+    is_keyframe.append(keyframe)
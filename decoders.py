@@ -0,0 +1,350 @@
+import functools
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+import cv2
+import numpy as np
+
+try:
+    import av
+except ImportError:  # PyAV is optional, the OpenCV and ffmpeg backends work without it
+    av = None
+
+try:
+    import imageio_ffmpeg
+except ImportError:  # Only used to find an ffmpeg binary when none is on PATH
+    imageio_ffmpeg = None
+
+# Frame sources analyze_video can decode with; the first is the default
+DECODERS = ('opencv', 'pyav', 'ffmpeg')
+
+# Bytes of unread frames discarded at a time when an ffmpeg reader sharing its audio is released
+DRAIN_BLOCK_SIZE = 1024 * 1024
+
+def find_ffmpeg():
+    """
+    Locate an ffmpeg executable
+
+    Returns:
+        str: Path to ffmpeg on PATH or the one bundled with imageio-ffmpeg, None if there is neither
+    """
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None and imageio_ffmpeg is not None:
+        try:
+            ffmpeg = imageio_ffmpeg.get_ffmpeg_exe()
+        except RuntimeError:
+            pass
+    return ffmpeg
+
+@functools.lru_cache(maxsize=None)
+def _passthrough_option(ffmpeg):
+    """
+    Option that keeps ffmpeg from duplicating or dropping frames: -fps_mode from 5.1 on, -vsync before
+    """
+    try:
+        banner = subprocess.run([ffmpeg, '-version'], capture_output=True, text=True).stdout
+    except OSError:
+        return '-fps_mode'
+    # Release builds print "ffmpeg version 6.1.1"; git builds print a revision and are recent
+    match = re.match(r'ffmpeg version n?(\d+)\.(\d+)', banner)
+    if match and (int(match.group(1)), int(match.group(2))) < (5, 1):
+        return '-vsync'
+    return '-fps_mode'
+
+def available_decoders():
+    """
+    Decoders usable in this environment
+
+    Returns:
+        list: Names from DECODERS whose dependencies are installed
+    """
+    available = ['opencv']
+    if av is not None:
+        available.append('pyav')
+    if find_ffmpeg() is not None:
+        available.append('ffmpeg')
+    return available
+
+def open_decoder(video_path, decoder='opencv', threads=None, audio_output=None, color=False):
+    """
+    Open a frame source with the cv2.VideoCapture read/release interface
+
+    'opencv' is a plain cv2.VideoCapture yielding BGR frames; with threads
+    set it is opened on the FFmpeg backend with that many decode threads.
+    'pyav' and 'ffmpeg' yield 2-D grayscale frames converted by the
+    decoder's own scaler, so the BGR frame is never built and analysis
+    skips cvtColor. They read sequentially and cannot seek.
+
+    Args:
+        video_path (str): Path to the video file
+        decoder (str): One of DECODERS
+        threads (int): Decode threads, None or 0 to let the decoder choose
+        audio_output (list): ffmpeg output options for a second, audio output
+            of the same process; only the 'ffmpeg' decoder supports it
+        color (bool): Have the 'ffmpeg' decoder yield BGR frames like OpenCV instead of gray
+
+    Returns:
+        cv2.VideoCapture, PyAVReader or FFmpegReader: Opened frame source
+
+    Raises:
+        ValueError: If the decoder is unknown or not installed
+    """
+    if decoder == 'opencv':
+        if threads:
+            return cv2.VideoCapture(video_path, cv2.CAP_FFMPEG, [cv2.CAP_PROP_N_THREADS, threads])
+        return cv2.VideoCapture(video_path)
+    if decoder == 'pyav':
+        if av is None:
+            raise ValueError("the pyav decoder needs PyAV installed")
+        return PyAVReader(video_path, threads)
+    if decoder == 'ffmpeg':
+        ffmpeg = find_ffmpeg()
+        if ffmpeg is None:
+            raise ValueError("the ffmpeg decoder needs an ffmpeg executable")
+        return FFmpegReader(video_path, threads, ffmpeg, audio_output, color)
+    raise ValueError(f"unknown decoder: {decoder}")
+
+def iter_keyframes(video_path):
+    """
+    Decode only the keyframes of a video
+
+    The decoder is told to skip every other frame, so the cost is demuxing
+    the file plus decoding one frame per group of pictures.
+
+    Args:
+        video_path (str): Path to the video file
+
+    Yields:
+        tuple: (seconds from the start of the stream, BGR frame) per keyframe, in decode order
+
+    Raises:
+        ValueError: If PyAV is not installed or cannot open the video
+    """
+    if av is None:
+        raise ValueError("decoding keyframes only needs PyAV installed")
+    try:
+        container = av.open(video_path)
+        stream = container.streams.video[0]
+    except (av.FFmpegError, IndexError) as e:
+        raise ValueError(f"{video_path}: cannot be opened with PyAV ({e})") from e
+    try:
+        stream.codec_context.skip_frame = 'NONKEY'
+        start = stream.start_time or 0
+        for frame in container.decode(stream):
+            if frame.pts is None:
+                continue
+            yield float((frame.pts - start) * stream.time_base), frame.to_ndarray(format='bgr24')
+    except av.FFmpegError:
+        return
+    finally:
+        container.close()
+
+class PyAVReader:
+    """
+    Sequential grayscale frame source decoding with PyAV
+    """
+
+    def __init__(self, video_path, threads=None):
+        """
+        Args:
+            video_path (str): Path to the video file
+            threads (int): Decode threads, None or 0 to let libavcodec choose
+        """
+        try:
+            self._container = av.open(video_path)
+            stream = self._container.streams.video[0]
+        except (av.FFmpegError, IndexError):
+            self._container = None
+            return
+        # Frame threading decodes several frames at once; slice threading splits each frame
+        stream.thread_type = 'AUTO'
+        stream.thread_count = threads or 0
+        self._frames = self._container.decode(stream)
+
+    def isOpened(self):
+        return self._container is not None
+
+    def read(self, image=None):
+        """
+        Decode the next frame
+
+        Args:
+            image (numpy.ndarray): Ignored, accepted for cv2.VideoCapture compatibility
+
+        Returns:
+            tuple: (True, 2-D uint8 grayscale frame), or (False, None) at the end
+        """
+        if self._container is None:
+            return False, None
+        try:
+            frame = next(self._frames)
+        except (StopIteration, av.FFmpegError):
+            return False, None
+        return True, frame.to_ndarray(format='gray')
+
+    def release(self):
+        if self._container is not None:
+            self._container.close()
+            self._container = None
+
+class FFmpegReader:
+    """
+    Sequential grayscale frame source reading raw frames from an ffmpeg subprocess
+
+    ffmpeg decodes and converts to 8-bit gray on its own threads while
+    frames are copied out of the pipe straight into the caller's buffer.
+    With audio_output the same process also writes the audio stream to a
+    second pipe, exposed as the audio attribute, so both streams come from
+    a single read of the file. That pipe must be drained concurrently with
+    the frames, or ffmpeg stalls once it fills. With color the frames are
+    BGR instead, for callers that need what cv2.VideoCapture returns.
+
+    A stream that ends because ffmpeg failed, rather than at the end of the
+    video, raises ValueError with ffmpeg's error output instead of looking
+    like a short video.
+    """
+
+    def __init__(self, video_path, threads=None, ffmpeg='ffmpeg', audio_output=None, color=False):
+        """
+        Args:
+            video_path (str): Path to the video file
+            threads (int): Decode threads, None or 0 to let ffmpeg choose
+            ffmpeg (str): ffmpeg executable
+            audio_output (list): ffmpeg output options for the audio pipe, None for video only
+            color (bool): Output BGR frames instead of gray
+        """
+        self._process = None
+        self._stderr = None
+        self.audio = None
+        self.video_path = video_path
+        self.frames_read = 0
+        # Probe the size from OpenCV, which applies the same display rotation as ffmpeg
+        cap = cv2.VideoCapture(video_path)
+        self.width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        opened = cap.isOpened()
+        cap.release()
+        if not opened or self.width <= 0 or self.height <= 0:
+            return
+        self.shape = (self.height, self.width, 3) if color else (self.height, self.width)
+
+        command = [ffmpeg, '-v', 'error', '-nostdin', '-threads', str(threads or 0), '-i', video_path,
+                   '-map', '0:v:0', _passthrough_option(ffmpeg), 'passthrough',
+                   '-f', 'rawvideo', '-pix_fmt', 'bgr24' if color else 'gray', 'pipe:1']
+        audio_read = audio_write = None
+        if audio_output is not None:
+            # The child inherits the write end under the same descriptor number
+            audio_read, audio_write = os.pipe()
+            command += audio_output + [f'pipe:{audio_write}']
+        # A file rather than a pipe, so ffmpeg never blocks on error output nobody is reading yet
+        self._stderr = tempfile.TemporaryFile()
+        try:
+            self._process = subprocess.Popen(
+                command, stdout=subprocess.PIPE, stderr=self._stderr,
+                bufsize=int(np.prod(self.shape)), pass_fds=(audio_write,) if audio_write is not None else (),
+            )
+        finally:
+            if audio_write is not None:
+                os.close(audio_write)
+        if audio_read is not None:
+            self.audio = os.fdopen(audio_read, 'rb')
+
+    def isOpened(self):
+        return self._process is not None
+
+    def read(self, image=None):
+        """
+        Read the next frame
+
+        Args:
+            image (numpy.ndarray): Optional buffer of the frame's shape to read into
+
+        Returns:
+            tuple: (True, uint8 gray or BGR frame), or (False, None) at the end
+
+        Raises:
+            ValueError: If ffmpeg exited with an error
+        """
+        if self._process is None:
+            return False, None
+        if image is None or image.shape != self.shape:
+            image = np.empty(self.shape, dtype=np.uint8)
+        view = memoryview(image).cast('B')
+        filled = 0
+        while filled < len(view):
+            count = self._process.stdout.readinto(view[filled:])
+            if not count:
+                self._check_exit()
+                return False, None
+            filled += count
+        self.frames_read += 1
+        return True, image
+
+    def _check_exit(self):
+        """
+        Raise ffmpeg's error output if the process behind an ended stream failed
+        """
+        if self._process.wait() == 0:
+            return
+        self._stderr.seek(0)
+        lines = self._stderr.read().decode('utf-8', 'replace').strip().splitlines()
+        # The cause comes first and ffmpeg's summary of it last; the middle can be one line per bad packet
+        message = '; '.join(lines[:1] + lines[-1:] if len(lines) > 1 else lines) or f"exit code {self._process.returncode}"
+        raise ValueError(f"ffmpeg failed on {self.video_path} after {self.frames_read} frames: {message}")
+
+    def release(self):
+        if self._process is not None:
+            if self.audio is not None:
+                # Let ffmpeg finish so the audio reader gets the whole track, not one cut at the last frame read
+                while self._process.stdout.read(DRAIN_BLOCK_SIZE):
+                    pass
+            self._process.stdout.close()
+            self._process.kill()
+            self._process.wait()
+            self._process = None
+        if self._stderr is not None:
+            self._stderr.close()
+            self._stderr = None
+
+def measure_decoders(video_path, decoders=None, threads=(None,), max_frames=None):
+    """
+    Measure the decode throughput of every decoder and thread count on one video
+
+    Args:
+        video_path (str): Path to the video file
+        decoders (list): Decoder names, None for every available one
+        threads (list): Thread counts to try, None meaning the decoder's default
+        max_frames (int): Stop each run after this many frames, None to read the whole video
+
+    Returns:
+        list: One dict per run with 'decoder', 'threads', 'gray', 'frames',
+            'seconds' and 'frames_per_second'
+    """
+    results = []
+    for decoder in decoders or available_decoders():
+        for thread_count in threads:
+            start = time.perf_counter()
+            source = open_decoder(video_path, decoder, thread_count)
+            frames = 0
+            frame = None
+            gray = False
+            while max_frames is None or frames < max_frames:
+                ret, frame = source.read(frame)
+                if not ret:
+                    break
+                gray = frame.ndim == 2
+                frames += 1
+            source.release()
+            seconds = time.perf_counter() - start
+            results.append({
+                'decoder': decoder,
+                'threads': thread_count,
+                'gray': gray,
+                'frames': frames,
+                'seconds': seconds,
+                'frames_per_second': frames / seconds if seconds > 0 else None,
+            })
+    return results
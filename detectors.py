@@ -0,0 +1,382 @@
+import collections
+import math
+import cv2
+import numpy as np
+
+from array_files import save_arrays
+from utils import threshold_frames
+from fingerprints import dhash, hamming_distance
+
+# Width of the shared thumbnail most detectors work on; they only need coarse structure
+DETECTOR_WIDTH = 160
+
+# The noise estimate subsamples frames wider than this instead of smoothing them
+NOISE_MAX_WIDTH = 640
+
+# Frames of history the motion and noise detectors compare the current frame against
+HISTORY_FRAMES = 30
+
+class Detector:
+    """
+    Frame sink that turns the decoded stream into one suspicion score per frame
+
+    Detectors are fed by the same scan that computes the pixel change
+    scores, so any number of them share a single decode pass; wrap them in
+    a DetectorSet so they also share one downscaled copy of each frame.
+    Subclasses set name and default_threshold and implement score(); higher
+    scores are more suspicious unless flag() says otherwise.
+    """
+
+    name = None
+    default_threshold = 0.5
+
+    def __init__(self, threshold=None):
+        """
+        Args:
+            threshold (float): Score above which a frame is flagged, None for the default
+        """
+        self.threshold = self.default_threshold if threshold is None else threshold
+        self._scores = []
+
+    def update(self, index, frame, gray_frame, score, small=None):
+        """
+        Consume one decoded frame of the scan
+
+        Args:
+            index (int): Frame index in the video
+            frame (numpy.ndarray): Decoded BGR frame
+            gray_frame (numpy.ndarray): Grayscale frame used for differencing
+            score (float): Pixel change score of the frame against its predecessor
+            small (numpy.ndarray): gray_frame shrunk to DETECTOR_WIDTH, computed when None
+        """
+        if small is None:
+            small = shrink_frame(gray_frame)
+        self._scores.append(float(self.score(frame, gray_frame, small)))
+
+    def score(self, frame, gray_frame, small):
+        """
+        Score one frame; called in frame order and expected to return 0 for the first
+
+        Args:
+            frame (numpy.ndarray): Decoded BGR frame, reused by the scan afterwards
+            gray_frame (numpy.ndarray): Grayscale frame, reused by the scan afterwards
+            small (numpy.ndarray): Grayscale frame shrunk to DETECTOR_WIDTH, owned by the caller
+
+        Returns:
+            float: Suspicion score of the frame
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    @property
+    def scores(self):
+        """
+        numpy.ndarray: float32 score of every frame seen so far
+        """
+        return np.asarray(self._scores, dtype=np.float32)
+
+    @classmethod
+    def flag(cls, scores, threshold):
+        """
+        Frames the scores of this detector mark as suspicious
+
+        Args:
+            scores (numpy.ndarray): Scores produced by this detector
+            threshold (float): Detection threshold
+
+        Returns:
+            list: Flagged frame indices
+        """
+        return threshold_frames(scores, threshold)
+
+def shrink_frame(gray_frame, width=DETECTOR_WIDTH):
+    """
+    Downscale a grayscale frame to the width the detectors work at
+
+    Args:
+        gray_frame (numpy.ndarray): Grayscale frame
+        width (int): Target width, narrower frames are copied unchanged
+
+    Returns:
+        numpy.ndarray: New downscaled frame
+    """
+    height, frame_width = gray_frame.shape[:2]
+    if frame_width <= width:
+        return gray_frame.copy()
+    return cv2.resize(gray_frame, (width, max(1, height * width // frame_width)),
+                      interpolation=cv2.INTER_AREA)
+
+class DetectorSet:
+    """
+    Single scan sink that feeds several detectors one shared downscaled frame
+    """
+
+    def __init__(self, detectors):
+        """
+        Args:
+            detectors (list): Detector instances to feed
+        """
+        self.detectors = detectors
+
+    def update(self, index, frame, gray_frame, score):
+        small = shrink_frame(gray_frame)
+        for detector in self.detectors:
+            detector.update(index, frame, gray_frame, score, small)
+
+    def close(self):
+        for detector in self.detectors:
+            detector.close()
+
+class HistogramDetector(Detector):
+    """
+    Bhattacharyya distance between the intensity histograms of neighbouring frames
+
+    Insensitive to motion within a scene, high when the content is replaced.
+    """
+
+    name = 'histogram'
+    default_threshold = 0.3
+
+    def __init__(self, threshold=None, bins=64):
+        super().__init__(threshold)
+        self.bins = bins
+        self._prev = None
+
+    def score(self, frame, gray_frame, small):
+        hist = cv2.calcHist([small], [0], None, [self.bins], [0, 256])
+        distance = 0.0
+        if self._prev is not None:
+            distance = cv2.compareHist(self._prev, hist, cv2.HISTCMP_BHATTACHARYYA)
+        self._prev = hist
+        return distance
+
+class SSIMDetector(Detector):
+    """
+    Structural dissimilarity (1 - SSIM) between neighbouring frames
+    """
+
+    name = 'ssim'
+    default_threshold = 0.5
+
+    # Stabilising constants of the SSIM formula for 8-bit images
+    C1 = (0.01 * 255) ** 2
+    C2 = (0.03 * 255) ** 2
+
+    def __init__(self, threshold=None):
+        super().__init__(threshold)
+        self._prev = None
+
+    def score(self, frame, gray_frame, small):
+        current = small.astype(np.float32)
+        dissimilarity = 0.0
+        if self._prev is not None:
+            dissimilarity = 1.0 - self._ssim(self._prev, current)
+        self._prev = current
+        return dissimilarity
+
+    def _ssim(self, a, b):
+        def blur(image):
+            return cv2.GaussianBlur(image, (11, 11), 1.5)
+
+        mu_a, mu_b = blur(a), blur(b)
+        mu_aa, mu_bb, mu_ab = mu_a * mu_a, mu_b * mu_b, mu_a * mu_b
+        var_a = blur(a * a) - mu_aa
+        var_b = blur(b * b) - mu_bb
+        covariance = blur(a * b) - mu_ab
+        ssim_map = ((2 * mu_ab + self.C1) * (2 * covariance + self.C2)) / \
+            ((mu_aa + mu_bb + self.C1) * (var_a + var_b + self.C2))
+        return float(ssim_map.mean())
+
+class OpticalFlowDetector(Detector):
+    """
+    Jumps in the average optical flow magnitude
+
+    Continuous camera or object motion keeps the flow magnitude smooth; a
+    removed or inserted stretch of footage breaks it. The score is the
+    change against the mean of the recent frames, relative to that mean.
+    """
+
+    name = 'optical_flow'
+    default_threshold = 2.0
+
+    def __init__(self, threshold=None, history=5):
+        super().__init__(threshold)
+        self._prev = None
+        self._recent = collections.deque(maxlen=history)
+        # DIS at its fastest preset is about 20x cheaper than Farneback at this size
+        self._flow = cv2.DISOpticalFlow_create(cv2.DISOPTICAL_FLOW_PRESET_ULTRAFAST)
+
+    def score(self, frame, gray_frame, small):
+        current = small
+        jump = 0.0
+        if self._prev is not None:
+            flow = self._flow.calc(self._prev, current, None)
+            magnitude = float(cv2.norm(flow, cv2.NORM_L2) / math.sqrt(flow.shape[0] * flow.shape[1]))
+            if self._recent:
+                expected = sum(self._recent) / len(self._recent)
+                # Half a pixel of slack keeps nearly static footage from producing huge ratios
+                jump = abs(magnitude - expected) / (expected + 0.5)
+            self._recent.append(magnitude)
+        self._prev = current
+        return jump
+
+class DuplicateFrameDetector(Detector):
+    """
+    Hamming distance between the perceptual hashes (dHash) of neighbouring frames
+
+    A score of 0 means a frame looks identical to its predecessor. flag()
+    reports such repeats only where the footage moves on both sides, which
+    is how a duplicated frame hiding a removed one looks, while static
+    scenes (long runs of zeros) stay unflagged. The frames are hashed as
+    scanned, scale and roi applied; the fingerprints analyze_video keeps
+    for repeated segments and archive matching come from the full frames.
+    """
+
+    name = 'duplicates'
+    default_threshold = 0.0
+
+    def __init__(self, threshold=None):
+        super().__init__(threshold)
+        self._previous = None
+
+    def score(self, frame, gray_frame, small):
+        fingerprint = dhash(small)
+        distance = 0.0
+        if self._previous is not None:
+            distance = int(hamming_distance(self._previous, fingerprint)) / 64.0
+        self._previous = fingerprint
+        return distance
+
+    @classmethod
+    def flag(cls, scores, threshold):
+        scores = np.asarray(scores)
+        if len(scores) < 3:
+            return []
+        repeated = scores[1:-1] <= threshold
+        moving = (scores[:-2] > threshold) & (scores[2:] > threshold)
+        return (np.flatnonzero(repeated & moving) + 1).tolist()
+
+class NoiseDetector(Detector):
+    """
+    Jumps in the estimated sensor noise level
+
+    Footage spliced in from another camera or encode usually carries a
+    different noise or compression level. The noise is estimated with
+    Immerkaer's Laplacian method and compared against the median of the
+    recent frames.
+    """
+
+    name = 'noise'
+    default_threshold = 0.5
+
+    KERNEL = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+
+    def __init__(self, threshold=None, history=HISTORY_FRAMES):
+        super().__init__(threshold)
+        self._recent = collections.deque(maxlen=history)
+
+    def score(self, frame, gray_frame, small):
+        # Plain subsampling keeps the noise that a smoothing resize would remove
+        step = -(-gray_frame.shape[1] // NOISE_MAX_WIDTH)
+        sampled = gray_frame[::step, ::step]
+        height, width = sampled.shape[:2]
+        if height < 3 or width < 3:
+            return 0.0
+        response = cv2.filter2D(sampled, cv2.CV_16S, self.KERNEL)
+        sigma = math.sqrt(math.pi / 2) * cv2.norm(response, cv2.NORM_L1) / (6 * (width - 2) * (height - 2))
+
+        jump = 0.0
+        if self._recent:
+            expected = float(np.median(self._recent))
+            jump = abs(sigma - expected) / (expected + 0.1)
+        self._recent.append(sigma)
+        return jump
+
+# Detectors available by name, in the order they are reported
+DETECTORS = {
+    cls.name: cls for cls in (
+        HistogramDetector, SSIMDetector, OpticalFlowDetector, DuplicateFrameDetector, NoiseDetector
+    )
+}
+
+def create_detectors(names=None, thresholds=None):
+    """
+    Instantiate detectors to pass to the scan as sinks
+
+    Args:
+        names (list): Detector names, None for all of them
+        thresholds (dict): Optional threshold per detector name
+
+    Returns:
+        list: Detector instances
+
+    Raises:
+        ValueError: If a name is not a known detector
+    """
+    names = list(DETECTORS) if names is None else names
+    unknown = [name for name in names if name not in DETECTORS]
+    if unknown:
+        raise ValueError(f"unknown detectors: {', '.join(unknown)}")
+    thresholds = thresholds or {}
+    return [DETECTORS[name](thresholds.get(name)) for name in names]
+
+def summarize_detectors(detector_scores, thresholds=None):
+    """
+    JSON-serialisable per-detector results for the report
+
+    Args:
+        detector_scores (dict): Score array per detector name
+        thresholds (dict): Threshold per detector name, defaults where missing
+
+    Returns:
+        dict: Threshold, flagged frames and peak score per detector
+    """
+    thresholds = thresholds or {}
+    summary = {}
+    for name, scores in detector_scores.items():
+        detector = DETECTORS[name]
+        threshold = thresholds.get(name, detector.default_threshold)
+        summary[name] = {
+            'threshold': threshold,
+            'flagged_frames': detector.flag(scores, threshold),
+            'max_score': float(np.max(scores)) if len(scores) else 0.0,
+        }
+    return summary
+
+def attach_detector_results(analysis, detectors):
+    """
+    Add the scores and summary of detectors that ran as sinks to an analysis
+
+    Args:
+        analysis (dict): Result of analyze_video, updated in place
+        detectors (list): Detector instances that were fed the scan
+    """
+    analysis['detector_scores'] = {detector.name: detector.scores for detector in detectors}
+    analysis['detectors'] = summarize_detectors(
+        analysis['detector_scores'], {detector.name: detector.threshold for detector in detectors}
+    )
+
+def save_detector_scores(detector_scores, path):
+    """
+    Write per-detector score arrays to an .npz file
+
+    Args:
+        detector_scores (dict): Score array per detector name
+        path (str): Destination path
+    """
+    save_arrays(path, detector_scores)
+
+def load_detector_scores(path):
+    """
+    Read score arrays written by save_detector_scores
+
+    Args:
+        path (str): Path of the .npz file
+
+    Returns:
+        dict: float32 score array per detector name
+    """
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
@@ -0,0 +1,342 @@
+import contextlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows, where writers are only serialised within one process
+    fcntl = None
+
+from fingerprints import (
+    CHUNKS, MAX_DISTANCE, MAX_SEGMENT_GAP, MIN_SEGMENT_FRAMES, QUERY_BATCH, chain_matches,
+    chunk_values, hamming_distance
+)
+
+DEFAULT_INDEX_DIR = os.environ.get(
+    'VIDGUARD_INDEX_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'vidguard-index')
+)
+
+# Archive-wide chunk values are shared by far more frames than within one video;
+# buckets bigger than this are static content and skipped
+MAX_INDEX_BUCKET_SIZE = 4096
+
+# A new shard is merged into the previous one while it holds at least this share of its frames,
+# which keeps the number of shards logarithmic in the number of indexed frames
+MERGE_RATIO = 0.5
+
+# A search that finds a shard merged away under it starts over on the newer manifest this many times
+SEARCH_ATTEMPTS = 5
+
+class FingerprintIndex:
+    """
+    Persistent multi-index hash of the frame fingerprints of every analysed video
+
+    The index is a directory of immutable shards plus a manifest. For each
+    16-bit chunk of the 64-bit fingerprint a shard keeps its fingerprints
+    sorted by that chunk, with a 65537-entry table of where every chunk
+    value starts, so candidates for a query frame are a single contiguous
+    slice per chunk. All arrays are memory-mapped .npy files.
+
+    Adding videos writes a new shard and merges it into its predecessor
+    while they are of similar size, as in a log-structured merge tree.
+    The CLI and the app can share one index directory, so writes are
+    serialised with a lock file as well as a thread lock. Readers take no
+    lock: the manifest is replaced atomically, and a reader whose shard was
+    merged away before it could open it starts over on the newer manifest.
+    Shards a reader has already opened stay readable after removal, since
+    their arrays are memory-mapped.
+    """
+
+    def __init__(self, index_dir=DEFAULT_INDEX_DIR):
+        """
+        Args:
+            index_dir (str): Directory the index is stored in, created if missing
+        """
+        self.index_dir = index_dir
+        self._lock = threading.Lock()
+        self._shards = {}
+        os.makedirs(index_dir, exist_ok=True)
+
+    def __contains__(self, video_key):
+        return any(video_key in shard['keys'] for _, shard in self._open_shards())
+
+    def add(self, video_key, fingerprints, info=None):
+        """
+        Index the fingerprints of one video
+
+        Args:
+            video_key (str): Unique id of the video, such as its MD5; videos
+                already in the index are skipped
+            fingerprints (numpy.ndarray): uint64 fingerprint per frame
+            info (dict): JSON-serialisable details returned with matches, e.g. the filename
+
+        Returns:
+            bool: True if the video was added, False if it was already indexed
+        """
+        return self.add_many([(video_key, fingerprints, info)]) > 0
+
+    def add_many(self, videos):
+        """
+        Index several videos in one new shard
+
+        Args:
+            videos (list): (video_key, fingerprints, info) tuples
+
+        Returns:
+            int: Number of videos added
+        """
+        with self._write_lock():
+            manifest = self._manifest()
+            known = set()
+            for name in manifest['shards']:
+                known.update(self._shard(name)['keys'])
+
+            records = []
+            for video_key, fingerprints, info in videos:
+                if video_key in known or len(fingerprints) == 0:
+                    continue
+                known.add(video_key)
+                records.append(({'key': video_key, 'info': info or {}},
+                                np.asarray(fingerprints, dtype=np.uint64)))
+            if not records:
+                return 0
+
+            shards = list(manifest['shards'])
+            shards.append(self._write_shard(records))
+
+            # Merge while the newest shard is not much smaller than the one before it
+            while len(shards) > 1:
+                newest, previous = self._shard(shards[-1]), self._shard(shards[-2])
+                if len(newest['fingerprints']) < MERGE_RATIO * len(previous['fingerprints']):
+                    break
+                merged = self._write_shard(self._records(shards[-2]) + self._records(shards[-1]))
+                shards[-2:] = [merged]
+
+            old_shards = set(manifest['shards']) - set(shards)
+            self._write_manifest({'shards': shards})
+            for name in old_shards:
+                self._shards.pop(name, None)
+                shutil.rmtree(os.path.join(self.index_dir, name), ignore_errors=True)
+            return len(records)
+
+    def search(self, fingerprints, min_length=MIN_SEGMENT_FRAMES, max_distance=MAX_DISTANCE,
+               max_gap=MAX_SEGMENT_GAP, min_distinct=5, exclude=None, max_bucket=MAX_INDEX_BUCKET_SIZE):
+        """
+        Find indexed videos that share footage with a query video
+
+        Args:
+            fingerprints (numpy.ndarray): uint64 fingerprint per frame of the query video
+            min_length (int): Shortest matching segment reported, in frames
+            max_distance (int): Largest Hamming distance that counts as the same frame
+            max_gap (int): Largest run of unmatched frames bridged inside a segment
+            min_distinct (int): Fewest distinct fingerprints a segment must contain
+            exclude (str): Video key to leave out, usually the query video itself
+            max_bucket (int): Chunk values shared by more indexed frames are skipped
+
+        Returns:
+            list: One dict per matching video with 'key', 'info', 'matched_frames'
+                and 'segments' (as returned by match_fingerprints), best match first
+        """
+        query = np.asarray(fingerprints, dtype=np.uint64)
+        matches = []
+        if len(query) == 0:
+            return matches
+
+        for _, shard in self._open_shards():
+            query_index, position = self._candidates(shard, query, max_distance, max_bucket)
+            if len(query_index) == 0:
+                continue
+
+            video = np.searchsorted(shard['offsets'], position, side='right') - 1
+            order = np.argsort(video, kind='stable')
+            video, query_index, position = video[order], query_index[order], position[order]
+            bounds = np.flatnonzero(np.diff(video)) + 1
+            for start, stop in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [len(video)]])):
+                record = shard['videos'][video[start]]
+                if record['key'] == exclude:
+                    continue
+                frame_index = position[start:stop] - shard['offsets'][video[start]]
+                distances = hamming_distance(query[query_index[start:stop]], shard['fingerprints'][position[start:stop]])
+                segments = chain_matches(
+                    query_index[start:stop], frame_index, query, min_length, max_gap, min_distinct, distances
+                )
+                if segments:
+                    matches.append({
+                        'key': record['key'],
+                        'info': record['info'],
+                        'matched_frames': sum(segment['matched_frames'] for segment in segments),
+                        'segments': segments,
+                    })
+
+        matches.sort(key=lambda match: -match['matched_frames'])
+        return matches
+
+    def stats(self):
+        """
+        Report the size of the index
+
+        Returns:
+            dict: Number of shards, videos and frames
+        """
+        shards = [shard for _, shard in self._open_shards()]
+        return {
+            'shards': len(shards),
+            'videos': sum(len(shard['videos']) for shard in shards),
+            'frames': sum(len(shard['fingerprints']) for shard in shards),
+        }
+
+    def _candidates(self, shard, query, max_distance, max_bucket):
+        """
+        (query frame, shard position) pairs within max_distance, found through any chunk
+        """
+        query_hits, position_hits = [], []
+        for chunk in range(CHUNKS):
+            starts = shard['starts'][chunk]
+            sorted_fingerprints = shard['sorted'][chunk]
+            query_chunks = chunk_values(query, chunk)
+
+            for batch_start in range(0, len(query), QUERY_BATCH):
+                batch_chunks = query_chunks[batch_start:batch_start + QUERY_BATCH]
+                left = starts[batch_chunks]
+                counts = starts[batch_chunks.astype(np.int64) + 1] - left
+                counts[counts > max_bucket] = 0
+                total = int(counts.sum())
+                if total == 0:
+                    continue
+
+                # Each bucket is one contiguous slice of the chunk-sorted arrays
+                query_index = np.repeat(np.arange(batch_start, batch_start + len(batch_chunks)), counts)
+                within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+                slot = np.repeat(left, counts) + within
+                close = np.bitwise_count(sorted_fingerprints[slot] ^ query[query_index]) <= max_distance
+                query_hits.append(query_index[close])
+                position_hits.append(shard['positions'][chunk][slot[close]].astype(np.int64))
+
+        if not query_hits:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        frames = len(shard['fingerprints'])
+        keys = np.unique(np.concatenate(query_hits) * frames + np.concatenate(position_hits))
+        return keys // frames, keys % frames
+
+    @contextlib.contextmanager
+    def _write_lock(self):
+        """
+        Hold the thread lock and, where available, an exclusive lock on the index's lock file
+        """
+        with self._lock, open(os.path.join(self.index_dir, 'lock'), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _open_shards(self):
+        """
+        Open every shard of the current manifest
+
+        Another process can merge shards away between reading the manifest
+        and opening them; the manifest is then read again.
+
+        Returns:
+            list: (name, shard) pairs in manifest order
+        """
+        for attempt in range(SEARCH_ATTEMPTS):
+            names = self._manifest()['shards']
+            try:
+                shards = [(name, self._shard(name)) for name in names]
+            except FileNotFoundError:
+                if attempt == SEARCH_ATTEMPTS - 1:
+                    raise
+                continue
+            # Forget shards merged away since, so their files can be freed
+            for name in set(self._shards) - set(names):
+                self._shards.pop(name, None)
+            return shards
+
+    def _write_shard(self, records):
+        """
+        Write videos into a new shard directory
+
+        Args:
+            records (list): (video record, fingerprints) tuples
+
+        Returns:
+            str: Name of the shard directory
+        """
+        fingerprints = np.concatenate([fingerprints for _, fingerprints in records])
+        offsets = np.cumsum([0] + [len(fingerprints) for _, fingerprints in records]).astype(np.int64)
+
+        # Build in a scratch directory and rename it so a shard is never seen half written
+        tmp_dir = tempfile.mkdtemp(dir=self.index_dir, prefix='.tmp-')
+        try:
+            np.save(os.path.join(tmp_dir, 'fingerprints.npy'), fingerprints)
+            np.save(os.path.join(tmp_dir, 'offsets.npy'), offsets)
+            for chunk in range(CHUNKS):
+                values = chunk_values(fingerprints, chunk)
+                order = np.argsort(values, kind='stable')
+                starts = np.zeros((1 << 16) + 1, dtype=np.int64)
+                np.cumsum(np.bincount(values, minlength=1 << 16), out=starts[1:])
+                np.save(os.path.join(tmp_dir, f'sorted{chunk}.npy'), fingerprints[order])
+                np.save(os.path.join(tmp_dir, f'positions{chunk}.npy'), order.astype(np.uint32))
+                np.save(os.path.join(tmp_dir, f'starts{chunk}.npy'), starts)
+            with open(os.path.join(tmp_dir, 'videos.json'), 'w') as f:
+                json.dump([record for record, _ in records], f)
+
+            name = f"shard-{os.path.basename(tmp_dir)[len('.tmp-'):]}"
+            os.replace(tmp_dir, os.path.join(self.index_dir, name))
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        return name
+
+    def _records(self, name):
+        shard = self._shard(name)
+        return [
+            (record, np.asarray(shard['fingerprints'][start:stop]))
+            for record, start, stop in zip(shard['videos'], shard['offsets'][:-1], shard['offsets'][1:])
+        ]
+
+    def _shard(self, name):
+        """
+        Open a shard's arrays memory-mapped, once per index object
+        """
+        shard = self._shards.get(name)
+        if shard is None:
+            shard_dir = os.path.join(self.index_dir, name)
+
+            def load(filename):
+                return np.load(os.path.join(shard_dir, filename), mmap_mode='r')
+
+            with open(os.path.join(shard_dir, 'videos.json')) as f:
+                videos = json.load(f)
+            shard = {
+                'videos': videos,
+                'keys': {record['key'] for record in videos},
+                'fingerprints': load('fingerprints.npy'),
+                'offsets': np.array(load('offsets.npy')),
+                # The bucket tables are small and hit for every query frame, so keep them in memory
+                'starts': [np.array(load(f'starts{chunk}.npy')) for chunk in range(CHUNKS)],
+                'sorted': [load(f'sorted{chunk}.npy') for chunk in range(CHUNKS)],
+                'positions': [load(f'positions{chunk}.npy') for chunk in range(CHUNKS)],
+            }
+            self._shards[name] = shard
+        return shard
+
+    def _manifest(self):
+        try:
+            with open(os.path.join(self.index_dir, 'manifest.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'shards': []}
+
+    def _write_manifest(self, manifest):
+        tmp_path = os.path.join(self.index_dir, 'manifest.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(self.index_dir, 'manifest.json'))
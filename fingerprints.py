@@ -0,0 +1,367 @@
+import cv2
+import numpy as np
+
+from array_files import save_array
+
+# Fingerprints whose Hamming distance is at most this are treated as the same picture
+MAX_DISTANCE = 3
+
+# A repeated or matching stretch must span at least this many frames to be reported
+MIN_SEGMENT_FRAMES = 15
+
+# A repeat must start at least this many frames after its source; slowly
+# changing footage resembles itself over shorter distances
+MIN_REPEAT_OFFSET = 50
+
+# Matching frames may be this many frames apart within one segment (dropped or re-encoded frames)
+MAX_SEGMENT_GAP = 2
+
+# Reference frames a query frame takes from one candidate bucket; static content,
+# like a parked camera view, or a long loop can put thousands of frames in one bucket
+MAX_BUCKET_CANDIDATES = 64
+
+# Larger frames are first resampled to this multiple of the 9x8 hash grid, so
+# hashing a full-resolution frame costs the same at any resolution
+DHASH_OVERSAMPLE = 8
+
+# Fingerprints are split into this many 16-bit chunks for candidate lookups
+CHUNKS = 4
+
+# Query frames expanded into candidate pairs at a time, which bounds peak memory
+QUERY_BATCH = 65536
+
+def dhash(frame):
+    """
+    64-bit difference hash of a frame
+
+    The frame is reduced to 9x8 pixels and each bit records whether a pixel
+    is brighter than its right-hand neighbour, which survives re-encoding,
+    rescaling and mild colour changes. Large frames are resampled to 72x64
+    first; each hash cell still averages 64 of those samples.
+
+    Args:
+        frame (numpy.ndarray): Grayscale or BGR frame of any size
+
+    Returns:
+        numpy.uint64: Fingerprint of the frame
+    """
+    size = (9 * DHASH_OVERSAMPLE, 8 * DHASH_OVERSAMPLE)
+    if frame.shape[1] > size[0] and frame.shape[0] > size[1]:
+        frame = cv2.resize(frame, size, interpolation=cv2.INTER_LINEAR)
+    tiny = cv2.resize(frame, (9, 8), interpolation=cv2.INTER_AREA)
+    if tiny.ndim == 3:
+        tiny = cv2.cvtColor(tiny, cv2.COLOR_BGR2GRAY)
+    bits = np.packbits(tiny[:, 1:] > tiny[:, :-1])
+    return bits.view('>u8')[0].astype(np.uint64)
+
+def hamming_distance(a, b):
+    """
+    Number of differing bits between fingerprints, element-wise
+
+    Args:
+        a (numpy.ndarray): uint64 fingerprints
+        b (numpy.ndarray): uint64 fingerprints, broadcast against a
+
+    Returns:
+        numpy.ndarray: uint8 distances from 0 to 64
+    """
+    return np.bitwise_count(np.bitwise_xor(np.asarray(a, dtype=np.uint64), np.asarray(b, dtype=np.uint64)))
+
+def save_fingerprints(fingerprints, path):
+    """
+    Save a fingerprint array as .npy so it can be memory-mapped later
+
+    Args:
+        fingerprints (numpy.ndarray): uint64 fingerprint per frame
+        path (str): Destination path
+    """
+    save_array(path, np.asarray(fingerprints, dtype=np.uint64))
+
+def load_fingerprints(path, mmap=True):
+    """
+    Load a fingerprint array written by save_fingerprints
+
+    Args:
+        path (str): Path of the .npy file
+        mmap (bool): Memory-map the file instead of reading it
+
+    Returns:
+        numpy.ndarray: uint64 fingerprint per frame
+    """
+    return np.load(path, mmap_mode='r' if mmap else None)
+
+def chunk_values(fingerprints, chunk):
+    """
+    One 16-bit chunk of every fingerprint, the keys of the candidate lookup tables
+
+    Args:
+        fingerprints (numpy.ndarray): uint64 fingerprints
+        chunk (int): Chunk number from 0 (lowest bits) to CHUNKS - 1
+
+    Returns:
+        numpy.ndarray: uint16 chunk values
+    """
+    return ((fingerprints >> np.uint64(16 * chunk)) & np.uint64(0xFFFF)).astype(np.uint16)
+
+def _candidate_pairs(query, reference, max_distance=MAX_DISTANCE, max_candidates=MAX_BUCKET_CANDIDATES,
+                     following=False):
+    """
+    All (query frame, reference frame) pairs within max_distance of each other
+
+    Two 64-bit fingerprints at most 3 bits apart agree exactly on at least
+    one of their four 16-bit chunks, so candidates come from exact chunk
+    matches, looked up in a table of the reference frames sorted by chunk
+    value, and are then checked on the full fingerprint. The lookup is exact
+    up to a distance of 3 and misses some matches beyond that.
+
+    A bucket is never skipped for being large, since looped footage fills
+    buckets with every copy of a frame; instead each query frame takes at
+    most max_candidates reference frames from it, in frame order.
+
+    Args:
+        query (numpy.ndarray): uint64 fingerprints
+        reference (numpy.ndarray): uint64 fingerprints
+        max_distance (int): Largest Hamming distance that counts as a match
+        max_candidates (int): Reference frames taken per query frame from one bucket
+        following (bool): query and reference are the same video; each frame
+            takes the frames after itself in its bucket, so a loop finds its next copies
+
+    Returns:
+        tuple: Matching query and reference frame indices as int64 arrays, without duplicates
+    """
+    query = np.asarray(query, dtype=np.uint64)
+    reference = np.asarray(reference, dtype=np.uint64)
+    query_hits, reference_hits = [], []
+
+    for chunk in range(CHUNKS):
+        reference_chunks = chunk_values(reference, chunk)
+        order = np.argsort(reference_chunks, kind='stable')
+        # With only 65536 chunk values, bucket sizes and starts fit in a direct lookup table
+        bucket_sizes = np.bincount(reference_chunks, minlength=1 << 16)
+        bucket_ends = np.cumsum(bucket_sizes)
+        bucket_starts = bucket_ends - bucket_sizes
+        query_chunks = chunk_values(query, chunk)
+        if following:
+            # Where each frame itself sits in the chunk-sorted order
+            sorted_position = np.empty(len(reference), dtype=np.int64)
+            sorted_position[order] = np.arange(len(reference))
+
+        # Batches of query frames bound the size of the expanded candidate arrays
+        for batch_start in range(0, len(query), QUERY_BATCH):
+            batch_chunks = query_chunks[batch_start:batch_start + QUERY_BATCH]
+            if following:
+                left = sorted_position[batch_start:batch_start + len(batch_chunks)] + 1
+            else:
+                left = bucket_starts[batch_chunks]
+            counts = np.minimum(bucket_ends[batch_chunks] - left, max_candidates)
+
+            # Expand every query frame into one row per reference frame it takes from its bucket
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            query_index = np.repeat(np.arange(batch_start, batch_start + len(batch_chunks)), counts)
+            within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            reference_index = order[np.repeat(left, counts) + within]
+
+            close = hamming_distance(query[query_index], reference[reference_index]) <= max_distance
+            query_hits.append(query_index[close])
+            reference_hits.append(reference_index[close])
+
+    if not query_hits:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    # A pair found through several chunks is kept once
+    keys = np.unique(np.concatenate(query_hits) * len(reference) + np.concatenate(reference_hits))
+    return keys // len(reference), keys % len(reference)
+
+def chain_matches(query_index, reference_index, query, min_length, max_gap, min_distinct, distances=None):
+    """
+    Chain matching frame pairs that share an offset into segments
+
+    Runs of pairs with one exact offset are found first. Runs whose offsets
+    differ by at most max_gap from their neighbours' and that touch along
+    the query are then merged, because a dropped or duplicated frame in
+    either copy shifts the offset by one. A merged segment takes its offset,
+    and so its reference range, from its strongest run: the one with the
+    most matches, or of those the closest matches when slowly changing
+    footage matches equally well at several neighbouring offsets.
+
+    Args:
+        query_index (numpy.ndarray): Query frame of each matching pair
+        reference_index (numpy.ndarray): Reference frame of each matching pair
+        query (numpy.ndarray): Query fingerprints, used to reject static segments
+        min_length (int): Shortest segment reported, in query frames
+        max_gap (int): Largest run of unmatched frames bridged inside a segment
+        min_distinct (int): Fewest distinct fingerprints a segment must contain
+        distances (numpy.ndarray): Hamming distance of each matching pair, to break ties between runs
+
+    Returns:
+        list: Segments as dicts with 'query_start', 'query_end', 'reference_start',
+            'reference_end' (inclusive), 'matched_frames' and 'offset', strongest first
+    """
+    if len(query_index) == 0:
+        return []
+    query_index = np.asarray(query_index, dtype=np.int64)
+    offsets = np.asarray(reference_index, dtype=np.int64) - query_index
+    if distances is None:
+        distances = np.zeros(len(query_index), dtype=np.int64)
+    order = np.lexsort((query_index, offsets))
+    query_index, offsets = query_index[order], offsets[order]
+    distances = np.asarray(distances, dtype=np.int64)[order]
+
+    # A new run starts where the offset changes or the matches are too far apart
+    breaks = np.flatnonzero((np.diff(offsets) != 0) | (np.diff(query_index) > max_gap + 1)) + 1
+    starts = np.concatenate([[0], breaks])
+    run_first = query_index[starts]
+    run_last = np.maximum.reduceat(query_index, starts)
+    run_offset = offsets[starts]
+    run_matched = np.diff(np.concatenate([starts, [len(query_index)]]))
+    run_distance = np.add.reduceat(distances, starts)
+
+    # Runs come sorted by offset; neighbouring offsets form a band, inside which
+    # runs that touch along the query are merged in one sweep
+    band = np.concatenate([[0], np.cumsum(np.diff(run_offset) > max_gap)])
+    order = np.lexsort((run_first, band))
+    run_first, run_last, run_offset, run_matched, run_distance, band = (
+        run_first[order], run_last[order], run_offset[order], run_matched[order], run_distance[order], band[order]
+    )
+    # Shifting each band past the previous one lets one running maximum track the reach within a band
+    shift = band * (int(run_last.max()) + max_gap + 2)
+    reach = np.maximum.accumulate(run_last + shift)
+    new_segment = np.ones(len(run_first), dtype=bool)
+    new_segment[1:] = (band[1:] != band[:-1]) | (run_first[1:] + shift[1:] > reach[:-1] + max_gap + 1)
+    segment_starts = np.flatnonzero(new_segment)
+    segment_id = np.cumsum(new_segment) - 1
+
+    query_start = run_first[segment_starts]
+    query_end = np.maximum.reduceat(run_last, segment_starts)
+    # Merged runs can pair one query frame with several neighbouring reference frames
+    matched = np.minimum(np.add.reduceat(run_matched, segment_starts), query_end - query_start + 1)
+    # Runs sorted by segment and then by strength put each segment's strongest run at its start
+    strongest = np.lexsort((run_distance, -run_matched, segment_id))[segment_starts]
+    segment_offset = run_offset[strongest]
+
+    candidates = [
+        {
+            'query_start': int(first),
+            'query_end': int(last),
+            'reference_start': int(first + offset),
+            'reference_end': int(last + offset),
+            'matched_frames': int(count),
+            'offset': int(offset),
+        }
+        for first, last, offset, count in zip(query_start, query_end, segment_offset, matched)
+        if last - first + 1 >= min_length and len(np.unique(query[first:last + 1])) >= min_distinct
+    ]
+    candidates.sort(key=lambda segment: (-segment['matched_frames'], abs(segment['offset'])))
+
+    # Slowly changing footage matches at a band of neighbouring offsets; keep the strongest
+    segments = []
+    for segment in candidates:
+        if not any(_overlaps(segment, kept, 'query') and _overlaps(segment, kept, 'reference')
+                   for kept in segments):
+            segments.append(segment)
+    return segments
+
+def _overlaps(a, b, side):
+    return a[f'{side}_start'] <= b[f'{side}_end'] and b[f'{side}_start'] <= a[f'{side}_end']
+
+def _collapse_loops(repeats, max_gap):
+    """
+    Fold repeats at multiples of a stronger repeat's period into it
+
+    Footage looped n times matches itself at the loop period and at every
+    multiple of it; those are one finding, the loop, not n - 1 repeats.
+
+    Args:
+        repeats (list): Repeats from find_repeated_segments, strongest first
+        max_gap (int): Tolerance of a multiple's offset per period
+
+    Returns:
+        list: The repeats that are not multiples of an earlier one
+    """
+    kept = []
+    for repeat in repeats:
+        folded = False
+        for loop in kept:
+            multiple = round(repeat['period'] / loop['period'])
+            if multiple >= 2 and abs(repeat['period'] - multiple * loop['period']) <= max_gap * multiple \
+                    and loop['source_start'] - max_gap <= repeat['source_start'] \
+                    and repeat['repeat_end'] <= loop['repeat_end'] + max_gap:
+                folded = True
+                break
+        if not folded:
+            kept.append(repeat)
+    return kept
+
+def find_repeated_segments(fingerprints, min_length=MIN_SEGMENT_FRAMES, max_distance=MAX_DISTANCE,
+                           max_gap=MAX_SEGMENT_GAP, min_distinct=5, min_offset=MIN_REPEAT_OFFSET):
+    """
+    Find stretches of a video that reappear later in the same video
+
+    Looping or re-inserting earlier footage is a common way to cover up a
+    gap in surveillance video. Matches closer together than min_offset
+    frames are ignored, so slow or static scenes do not match themselves,
+    and segments with fewer than min_distinct different fingerprints are
+    dropped for the same reason. Footage looped several times is reported
+    once, with its period and the number of copies.
+
+    Args:
+        fingerprints (numpy.ndarray): uint64 fingerprint per frame
+        min_length (int): Shortest repeated segment reported, in frames
+        max_distance (int): Largest Hamming distance that counts as the same frame
+        max_gap (int): Largest run of unmatched frames bridged inside a segment
+        min_distinct (int): Fewest distinct fingerprints a segment must contain
+        min_offset (int): Fewest frames between a source frame and its repeat
+
+    Returns:
+        list: One dict per repeat, 'source_start'/'source_end' being the earlier
+            copy and 'repeat_start'/'repeat_end' the later one (inclusive), with
+            'period' (frames from a copy to the next) and 'copies' (2 for a
+            single repeat, more for a loop whose copies follow one another)
+    """
+    fingerprints = np.asarray(fingerprints, dtype=np.uint64)
+    source, repeat = _candidate_pairs(fingerprints, fingerprints, max_distance, following=True)
+    keep = repeat - source >= max(min_offset, min_length)
+    source, repeat = source[keep], repeat[keep]
+    segments = chain_matches(
+        source, repeat, fingerprints, min_length, max_gap, min_distinct,
+        hamming_distance(fingerprints[source], fingerprints[repeat]),
+    )
+    repeats = []
+    for s in segments:
+        period = s['offset']
+        # Copies that follow one another cover the span from the first source frame to the last repeat
+        contiguous = s['reference_start'] <= s['query_end'] + max_gap + 1
+        repeats.append({
+            'source_start': s['query_start'],
+            'source_end': s['query_end'],
+            'repeat_start': s['reference_start'],
+            'repeat_end': s['reference_end'],
+            'matched_frames': s['matched_frames'],
+            'period': period,
+            'copies': max(2, round((s['reference_end'] - s['query_start'] + 1) / period)) if contiguous else 2,
+        })
+    return _collapse_loops(repeats, max_gap)
+
+def match_fingerprints(query, reference, min_length=MIN_SEGMENT_FRAMES, max_distance=MAX_DISTANCE,
+                       max_gap=MAX_SEGMENT_GAP, min_distinct=5):
+    """
+    Find stretches of one video that also appear in another
+
+    Args:
+        query (numpy.ndarray): uint64 fingerprints of the video being examined
+        reference (numpy.ndarray): uint64 fingerprints of an archived video
+        min_length (int): Shortest matching segment reported, in frames
+        max_distance (int): Largest Hamming distance that counts as the same frame
+        max_gap (int): Largest run of unmatched frames bridged inside a segment
+        min_distinct (int): Fewest distinct fingerprints a segment must contain
+
+    Returns:
+        list: Matching segments with 'query_start', 'query_end', 'reference_start',
+            'reference_end' (inclusive), 'matched_frames' and 'offset'
+    """
+    query = np.asarray(query, dtype=np.uint64)
+    reference = np.asarray(reference, dtype=np.uint64)
+    query_index, reference_index = _candidate_pairs(query, reference, max_distance)
+    distances = hamming_distance(query[query_index], reference[reference_index])
+    return chain_matches(query_index, reference_index, query, min_length, max_gap, min_distinct, distances)
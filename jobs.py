@@ -0,0 +1,203 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import build_report, threshold_frames
+from cache import THUMBNAIL_ARTIFACT, analyze_video_cached
+from result_store import ResultStore
+
+# Finished jobs are forgotten after this many seconds so the queue does not grow forever
+JOB_RETENTION_SECONDS = 3600
+
+class Job:
+    """
+    State of one queued analysis, shared between the worker and any polling session
+    """
+
+    def __init__(self, job_id, video_path, filename, filesize, scale, key, detectors=(), audio=False,
+                 thumbnails=False):
+        self.id = job_id
+        self.video_path = video_path
+        self.filename = filename
+        self.filesize = filesize
+        self.scale = scale
+        self.key = key
+        self.detectors = detectors
+        self.audio = audio
+        self.thumbnails = thumbnails
+        self.status = 'queued'
+        self.progress = {}
+        self.error = None
+        self.cache_hit = None
+        self.submitted = time.time()
+        self.finished = None
+
+    @property
+    def active(self):
+        return self.status in ('queued', 'running')
+
+    def partial_altered_frames(self, threshold=0.05):
+        """
+        Altered frames among the frames decoded so far
+
+        Args:
+            threshold (float): Threshold for frame difference detection
+
+        Returns:
+            list: Altered frame indices, empty before decoding has started
+        """
+        partial_scores = self.progress.get('decode', {}).get('partial_scores')
+        if partial_scores is None:
+            return []
+        return threshold_frames(partial_scores, threshold)
+
+class JobQueue:
+    """
+    Server-wide pool that runs analyses outside the Streamlit script run
+
+    Jobs live here rather than in st.session_state, so a widget interaction
+    that reruns the script does not restart or cancel the analysis, and
+    sessions only need to remember a job id to poll it. Submitting a file
+    that is already being analysed with the same settings joins the running
+    job, and one whose result is still in the result store finishes at once.
+    Finished reports are put in the result store under the job's key, where
+    sessions acquire them instead of copying them off the job.
+    """
+
+    def __init__(self, cache, max_workers=2, index=None, store=None):
+        """
+        Args:
+            cache (AnalysisCache): Cache every job consults and fills
+            max_workers (int): Number of analyses that run at the same time
+            index (FingerprintIndex): Archive every analysed video is checked
+                against and then added to, or None to skip the check
+            store (ResultStore): Store finished results are shared through,
+                None to open the default one
+        """
+        self.cache = cache
+        self.index = index
+        self.store = store or ResultStore()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='vidguard-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, video_path, filename, filesize, hashes, scale=1.0, threshold=0.05, detectors=(),
+               audio=False, thumbnails=False):
+        """
+        Queue a video for analysis
+
+        The job takes ownership of video_path and deletes it once the
+        analysis has finished.
+
+        Args:
+            video_path (str): Path to the uploaded video file
+            filename (str): Name of the file shown in the report
+            filesize (int): Size of the file in bytes
+            hashes (dict): Digests computed while the upload was saved
+            scale (float): Resolution factor frames are diffed at
+            threshold (float): Threshold for frame difference detection
+            detectors (list): Names of detectors from detectors.DETECTORS to also run
+            audio (bool): Also analyse the audio track
+            thumbnails (bool): Store thumbnails of flagged frames for inspection
+
+        Returns:
+            str: Id of the new job, or of the running job for the same content and settings
+        """
+        detectors = tuple(sorted(detectors))
+        key = (hashes['md5'], scale, detectors, audio, thumbnails)
+        with self._lock:
+            self._prune()
+            for job in self._jobs.values():
+                if job.key == key and job.active:
+                    _remove_file(video_path)
+                    return job.id
+
+            job = Job(uuid.uuid4().hex, video_path, filename, filesize, scale, key, detectors, audio, thumbnails)
+            self._jobs[job.id] = job
+            # Another session analysed the same content recently; share its result
+            if self.store.acquire(key, job.id) is not None:
+                job.status = 'done'
+                job.cache_hit = True
+                job.finished = time.time()
+                _remove_file(video_path)
+                return job.id
+
+        self._pool.submit(self._run, job, hashes, threshold)
+        return job.id
+
+    def get(self, job_id):
+        """
+        Look up a job
+
+        Args:
+            job_id (str): Id returned by submit
+
+        Returns:
+            Job: The job, or None if it is unknown or was pruned
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        """
+        Count jobs by status
+
+        Returns:
+            dict: Number of jobs per status
+        """
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return counts
+
+    def _run(self, job, hashes, threshold):
+        job.status = 'running'
+
+        def record_progress(update):
+            job.progress[update['stage']] = update
+
+        try:
+            analysis = analyze_video_cached(
+                self.cache, job.video_path, threshold, scale=job.scale, hashes=hashes,
+                progress_callback=record_progress, thumbnails=job.thumbnails, detectors=list(job.detectors),
+                audio=job.audio,
+            )
+            report = build_report(analysis, job.filename, job.filesize, threshold, job.scale)
+            if self.index is not None and 'fingerprints' in analysis:
+                report['archive_matches'] = self._check_archive(job, analysis['fingerprints'], hashes['md5'])
+            self.store.put(
+                job.key, report, arrays={'frame_scores': analysis['frame_scores']},
+                files={'thumbnails': analysis['artifacts'].get(THUMBNAIL_ARTIFACT)}, owner=job.id,
+            )
+            job.cache_hit = analysis['cache_hit']
+            job.status = 'done'
+        except Exception as e:
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished = time.time()
+            _remove_file(job.video_path)
+
+    def _check_archive(self, job, fingerprints, video_key):
+        """
+        Search the archive for footage shared with this video, then add it to the archive
+        """
+        matches = self.index.search(fingerprints, exclude=video_key)
+        self.index.add(video_key, fingerprints, {'filename': job.filename})
+        return matches
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished is not None and job.finished < cutoff]:
+            job = self._jobs.pop(job_id)
+            self.store.release(job.key, job.id)
+
+def _remove_file(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
@@ -0,0 +1,267 @@
+import copy
+import json
+import mmap
+import os
+import struct
+import zlib
+import numpy as np
+
+# File header: magic and the length of the JSON header that follows it
+HEADER = struct.Struct('<8sQ')
+MAGIC = b'VGREPRT1'
+
+# Arrays are written to JSON exports this many items at a time
+JSON_CHUNK_ITEMS = 65536
+
+# Report sections holding one result per name, each with its own flagged frame list
+FRAME_LIST_SECTIONS = ('detectors', 'audio')
+
+def _set_path(data, path, value):
+    for key in path[:-1]:
+        data = data[key]
+    data[path[-1]] = value
+
+def split_frame_lists(report):
+    """
+    Separate a report's frame index lists from the rest of it
+
+    Args:
+        report (dict): Forensic report as built by build_report
+
+    Returns:
+        tuple: Copy of the report with None in place of the altered frames and
+            the flagged frames of each detector and audio score, and those
+            lists by name, e.g. 'altered_frames', 'detectors/ssim/flagged_frames'
+            or 'audio/spectral/flagged_frames'
+    """
+    header = {}
+    frame_lists = {}
+    for key, value in report.items():
+        if key == 'altered_frames':
+            header[key] = None
+            frame_lists[key] = value
+        elif key in FRAME_LIST_SECTIONS:
+            header[key] = {}
+            for name, result in value.items():
+                if not isinstance(result, dict) or 'flagged_frames' not in result:
+                    header[key][name] = copy.deepcopy(result)
+                    continue
+                header[key][name] = copy.deepcopy({k: v for k, v in result.items() if k != 'flagged_frames'})
+                header[key][name]['flagged_frames'] = None
+                frame_lists[f'{key}/{name}/flagged_frames'] = result['flagged_frames']
+        else:
+            header[key] = copy.deepcopy(value)
+    return header, frame_lists
+
+def set_frame_list(report, name, frames):
+    """
+    Put a frame list separated by split_frame_lists back into a report
+
+    Args:
+        report (dict): Report, usually the header split_frame_lists returned
+        name (str): Name of the list, e.g. 'detectors/ssim/flagged_frames'
+        frames: The frame indices
+    """
+    _set_path(report, name.split('/'), frames)
+
+def _encode_frames(frames):
+    """
+    Delta-encode sorted frame indices into the narrowest integer type, then zlib them
+    """
+    deltas = np.diff(np.asarray(frames, dtype=np.int64), prepend=0)
+    dtype = np.int64
+    if len(deltas) == 0 or deltas.min() >= 0:
+        top = deltas.max() if len(deltas) else 0
+        dtype = next(t for t in (np.uint8, np.uint16, np.uint32, np.int64) if top <= np.iinfo(t).max)
+    return zlib.compress(deltas.astype(dtype).tobytes()), np.dtype(dtype).str
+
+def _encode_scores(scores):
+    """
+    Byte-shuffle float32 scores so exponents and mantissas compress separately, then zlib them
+    """
+    planes = np.ascontiguousarray(np.asarray(scores, dtype='<f4').view(np.uint8).reshape(-1, 4).T)
+    return zlib.compress(planes.tobytes()), '<f4'
+
+def write_report(target, report, frame_scores=None):
+    """
+    Write a report as a small JSON header followed by compressed binary arrays
+
+    Altered frames and every detector's flagged frames are stored sorted and
+    delta-encoded, the per-frame scores byte-shuffled; both are zlib
+    compressed. Their places in the header hold None until loaded.
+
+    Args:
+        target (str or file): Path to write to atomically, or a binary file object
+        report (dict): Forensic report as built by build_report
+        frame_scores (numpy.ndarray): Optional float32 score per frame to store as well
+    """
+    header_report, frame_lists = split_frame_lists(report)
+    arrays = {}
+    blobs = []
+    offset = 0
+
+    def add(name, path, data, encoding, count):
+        nonlocal offset
+        blob, dtype = data
+        arrays[name] = {'path': path, 'offset': offset, 'size': len(blob), 'count': count,
+                        'dtype': dtype, 'encoding': encoding}
+        blobs.append(blob)
+        offset += len(blob)
+
+    for name, frames in frame_lists.items():
+        add(name, name.split('/'), _encode_frames(frames), 'delta', len(frames))
+    if frame_scores is not None:
+        add('frame_scores', None, _encode_scores(frame_scores), 'shuffle', len(frame_scores))
+
+    header = json.dumps({'version': 1, 'report': header_report, 'arrays': arrays}).encode()
+
+    def write(f):
+        f.write(HEADER.pack(MAGIC, len(header)))
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+
+    if not isinstance(target, (str, os.PathLike)):
+        write(target)
+        return
+    tmp_path = f"{target}.tmp"
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, target)
+
+class ReportFile:
+    """
+    Lazily loaded binary report written by write_report
+
+    Opening reads only the JSON header; each array is decompressed the first
+    time it is asked for, so a viewer can show the report's details and
+    counts without touching hundreds of thousands of frame indices.
+    """
+
+    def __init__(self, source):
+        """
+        Args:
+            source (str or bytes): Path of the report, memory-mapped, or its contents
+
+        Raises:
+            ValueError: If the data is not a binary report
+        """
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, 'rb') as f:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._data = memoryview(source)
+
+        if len(self._data) < HEADER.size:
+            raise ValueError("not a VidGuard binary report")
+        magic, header_size = HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC:
+            raise ValueError("not a VidGuard binary report")
+        header = json.loads(bytes(self._data[HEADER.size:HEADER.size + header_size]))
+        self.report = header['report']
+        self.arrays = header['arrays']
+        self._base = HEADER.size + header_size
+        self._loaded = {}
+
+    def count(self, name):
+        """
+        Number of items in an array, read from the header without decoding it
+
+        Args:
+            name (str): Array name, e.g. 'altered_frames' or 'frame_scores'
+
+        Returns:
+            int: Item count
+        """
+        return self.arrays[name]['count']
+
+    def array(self, name):
+        """
+        Decode an array, once
+
+        Args:
+            name (str): Array name, e.g. 'altered_frames', 'detectors/ssim/flagged_frames' or 'frame_scores'
+
+        Returns:
+            numpy.ndarray: int64 frame indices or float32 scores
+        """
+        if name not in self._loaded:
+            entry = self.arrays[name]
+            start = self._base + entry['offset']
+            raw = zlib.decompress(self._data[start:start + entry['size']])
+            if entry['encoding'] == 'delta':
+                values = np.cumsum(np.frombuffer(raw, dtype=entry['dtype']), dtype=np.int64)
+            else:
+                planes = np.frombuffer(raw, dtype=np.uint8).reshape(4, -1)
+                values = np.ascontiguousarray(planes.T).view(entry['dtype']).reshape(-1)
+            self._loaded[name] = values
+        return self._loaded[name]
+
+    def to_dict(self):
+        """
+        Materialise the full report with every frame list filled in
+
+        Returns:
+            dict: The report as build_report returned it
+        """
+        report = copy.deepcopy(self.report)
+        for name, entry in self.arrays.items():
+            if entry['path'] is not None:
+                _set_path(report, entry['path'], self.array(name).tolist())
+        return report
+
+def iter_json(report, frame_scores=None, chunk_items=JSON_CHUNK_ITEMS):
+    """
+    Encode a report as JSON piece by piece
+
+    Long lists and arrays are written a chunk at a time, so the export never
+    holds the whole document, or a Python int per frame, in memory at once.
+
+    Args:
+        report (dict): Forensic report; lists may be numpy arrays
+        frame_scores (numpy.ndarray): Optional scores added under 'frame_scores'
+        chunk_items (int): Items of a long list encoded per piece
+
+    Yields:
+        str: Consecutive pieces of the JSON document
+    """
+    if frame_scores is not None:
+        report = dict(report, frame_scores=frame_scores)
+    yield from _iter_value(report, chunk_items)
+
+def _iter_value(value, chunk_items):
+    if isinstance(value, dict):
+        yield '{'
+        for i, (key, item) in enumerate(value.items()):
+            yield (', ' if i else '') + json.dumps(str(key)) + ': '
+            yield from _iter_value(item, chunk_items)
+        yield '}'
+    elif isinstance(value, np.ndarray) or (isinstance(value, list) and len(value) > chunk_items):
+        yield '['
+        for start in range(0, len(value), chunk_items):
+            part = value[start:start + chunk_items]
+            if isinstance(part, np.ndarray):
+                part = part.tolist()
+            yield (', ' if start else '') + json.dumps(part)[1:-1]
+        yield ']'
+    elif isinstance(value, (list, tuple)):
+        yield '['
+        for i, item in enumerate(value):
+            if i:
+                yield ', '
+            yield from _iter_value(item, chunk_items)
+        yield ']'
+    else:
+        yield json.dumps(value.item() if isinstance(value, np.generic) else value)
+
+def export_json(report, f, frame_scores=None):
+    """
+    Stream a report as JSON into a text file object
+
+    Args:
+        report (dict): Forensic report
+        f: Writable text file object
+        frame_scores (numpy.ndarray): Optional scores added under 'frame_scores'
+    """
+    for piece in iter_json(report, frame_scores):
+        f.write(piece)
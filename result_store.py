@@ -0,0 +1,332 @@
+import atexit
+import os
+import shutil
+import threading
+import time
+import uuid
+import numpy as np
+
+from utils import save_upload
+from report_format import set_frame_list, split_frame_lists
+
+DEFAULT_STORE_DIR = os.environ.get(
+    'VIDGUARD_STORE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'vidguard-store')
+)
+
+# Arrays held in memory across all results; beyond this the least recently used are spilled to disk
+DEFAULT_MAX_MEMORY_BYTES = 512 * 1024 ** 2
+
+# Spilled arrays and files across all results; beyond this unreferenced results are dropped
+DEFAULT_MAX_DISK_BYTES = 4 * 1024 ** 3
+
+# An owner that has not renewed its hold on a result for this many seconds, such as a
+# browser session that was closed, no longer keeps the result alive
+LEASE_SECONDS = 30 * 60
+
+class StoredResult:
+    """
+    One finished analysis shared by every session that shows it
+
+    The report's frame lists are held as int64 arrays and every large array
+    is either in memory or memory-mapped from the store's directory, so
+    sessions reference the same pages instead of each keeping a copy.
+    Sessions must treat the report and arrays as read-only.
+    """
+
+    def __init__(self, key, report, frame_lists, arrays, files, result_dir):
+        self.key = key
+        self.report = report
+        self.frame_lists = frame_lists
+        self.arrays = arrays
+        self.files = files
+        self.result_dir = result_dir
+        self.owners = {}
+        self.last_used = time.time()
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    def derived(self, name, build):
+        """
+        Value computed from this result once and shared, e.g. a plotting summary
+
+        Args:
+            name (str): Name of the derived value
+            build (callable): Called with no arguments to compute it the first time
+
+        Returns:
+            The derived value
+        """
+        with self._lock:
+            if name not in self._derived:
+                self._derived[name] = build()
+            return self._derived[name]
+
+    @property
+    def memory_bytes(self):
+        """
+        int: Bytes of arrays held in memory rather than mapped from disk
+        """
+        return sum(array.nbytes for array in self._all_arrays() if not isinstance(array, np.memmap))
+
+    @property
+    def disk_bytes(self):
+        """
+        int: Bytes of the result's files in the store directory
+        """
+        total = 0
+        for name in os.listdir(self.result_dir):
+            try:
+                total += os.path.getsize(os.path.join(self.result_dir, name))
+            except OSError:
+                pass
+        return total
+
+    def _all_arrays(self):
+        yield from self.arrays.values()
+        yield from self.frame_lists.values()
+
+class ResultStore:
+    """
+    Server-wide, reference-counted store of finished analyses with a memory and disk budget
+
+    Results are keyed by content, so every session showing the same video
+    shares one copy. Owners such as sessions and jobs acquire a result and
+    renew their hold each time they use it; holds lapse after
+    lease_seconds, so sessions that vanish without releasing do not pin
+    results forever. Over the memory budget the least recently used
+    in-memory arrays are written to the store directory and memory-mapped,
+    and over the disk budget results nobody holds are dropped.
+
+    Uploaded videos are saved under the store directory with the server's
+    process id in their name. They are deleted when their job finishes, at
+    interpreter exit, and, for a server that died, by the next store opened
+    on the same directory.
+    """
+
+    def __init__(self, store_dir=DEFAULT_STORE_DIR, max_memory_bytes=DEFAULT_MAX_MEMORY_BYTES,
+                 max_disk_bytes=DEFAULT_MAX_DISK_BYTES, lease_seconds=LEASE_SECONDS):
+        """
+        Args:
+            store_dir (str): Directory for spilled arrays, result files and uploads
+            max_memory_bytes (int): Budget for arrays held in memory
+            max_disk_bytes (int): Budget for the store's files, uploads excluded
+            lease_seconds (float): Seconds an owner's hold lasts without being renewed
+        """
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.lease_seconds = lease_seconds
+        self.upload_dir = os.path.join(store_dir, 'uploads')
+        self.results_dir = os.path.join(store_dir, f'results-{os.getpid()}')
+        self._results = {}
+        self._lock = threading.Lock()
+
+        os.makedirs(self.upload_dir, exist_ok=True)
+        _reclaim_dead_processes(store_dir, self.upload_dir)
+        # Anything already under this process id was left by an earlier server that had the same id
+        shutil.rmtree(self.results_dir, ignore_errors=True)
+        _remove_uploads(self.upload_dir, os.getpid())
+        os.makedirs(self.results_dir)
+        atexit.register(self.close)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._results
+
+    def put(self, key, report, arrays=None, files=None, owner=None):
+        """
+        Add a finished analysis, replacing any earlier result for the same key
+
+        Args:
+            key: Hashable id of the analysis, e.g. (md5, scale)
+            report (dict): Forensic report; its frame lists are stored as arrays
+            arrays (dict): Large numpy arrays by name, e.g. 'frame_scores'
+            files (dict): Files the result needs by name, e.g. a thumbnail file;
+                they are linked or copied into the store so other cleanups cannot remove them
+            owner (str): Optional first owner holding the result
+
+        Returns:
+            StoredResult: The stored result
+        """
+        header, frame_lists = split_frame_lists(report)
+        frame_lists = {name: np.asarray(frames, dtype=np.int64) for name, frames in frame_lists.items()}
+        for name, frames in frame_lists.items():
+            set_frame_list(header, name, frames)
+
+        result_dir = os.path.join(self.results_dir, uuid.uuid4().hex)
+        os.makedirs(result_dir)
+        stored_files = {}
+        for name, path in (files or {}).items():
+            if path is None or not os.path.exists(path):
+                continue
+            stored_files[name] = os.path.join(result_dir, name)
+            try:
+                os.link(path, stored_files[name])
+            except OSError:
+                shutil.copyfile(path, stored_files[name])
+
+        result = StoredResult(key, header, frame_lists, dict(arrays or {}), stored_files, result_dir)
+        if owner is not None:
+            result.owners[owner] = time.time()
+
+        with self._lock:
+            previous = self._results.pop(key, None)
+            self._results[key] = result
+            if previous is not None:
+                shutil.rmtree(previous.result_dir, ignore_errors=True)
+            self._enforce_budget()
+        return result
+
+    def acquire(self, key, owner):
+        """
+        Take or renew a hold on a result
+
+        Args:
+            key: Id the result was stored under
+            owner (str): Id of the holder, e.g. a session or job id
+
+        Returns:
+            StoredResult: The result, or None if it is not in the store
+        """
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                result.owners[owner] = result.last_used = time.time()
+            return result
+
+    def release(self, key, owner):
+        """
+        Drop a hold on a result; results nobody holds can be evicted
+
+        Args:
+            key: Id the result was stored under
+            owner (str): Id of the holder
+        """
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                result.owners.pop(owner, None)
+            self._enforce_budget()
+
+    def save_upload(self, stream, suffix='.mp4'):
+        """
+        Save an upload into the store's upload directory, hashing it on the way
+
+        Args:
+            stream: Readable binary file object, such as a Streamlit UploadedFile
+            suffix (str): Suffix of the saved file
+
+        Returns:
+            tuple: (path of the saved file, dict of hex digests by algorithm name)
+        """
+        return save_upload(stream, suffix=suffix, directory=self.upload_dir, prefix=f'{os.getpid()}-')
+
+    def stats(self):
+        """
+        Report store usage
+
+        Returns:
+            dict: Number of results, how many are held, and memory and disk bytes against the budgets
+        """
+        with self._lock:
+            self._expire_leases()
+            results = list(self._results.values())
+            return {
+                'results': len(results),
+                'held': sum(1 for result in results if result.owners),
+                'memory_bytes': sum(result.memory_bytes for result in results),
+                'max_memory_bytes': self.max_memory_bytes,
+                'disk_bytes': sum(result.disk_bytes for result in results),
+                'max_disk_bytes': self.max_disk_bytes,
+            }
+
+    def close(self):
+        """
+        Delete this process's results and uploads
+        """
+        with self._lock:
+            self._results.clear()
+        shutil.rmtree(self.results_dir, ignore_errors=True)
+        _remove_uploads(self.upload_dir, os.getpid())
+
+    def _expire_leases(self):
+        cutoff = time.time() - self.lease_seconds
+        for result in self._results.values():
+            for owner in [owner for owner, seen in result.owners.items() if seen < cutoff]:
+                del result.owners[owner]
+
+    def _enforce_budget(self):
+        """
+        Spill arrays over the memory budget, then drop unheld results over either budget
+        """
+        self._expire_leases()
+        by_age = sorted(self._results.values(), key=lambda result: result.last_used)
+
+        memory = sum(result.memory_bytes for result in by_age)
+        for result in by_age:
+            if memory <= self.max_memory_bytes:
+                break
+            memory -= result.memory_bytes
+            _spill(result)
+
+        disk = sum(result.disk_bytes for result in by_age)
+        for result in by_age:
+            if disk <= self.max_disk_bytes and memory <= self.max_memory_bytes:
+                break
+            if result.owners:
+                continue
+            disk -= result.disk_bytes
+            memory -= result.memory_bytes
+            del self._results[result.key]
+            shutil.rmtree(result.result_dir, ignore_errors=True)
+
+def _spill(result):
+    """
+    Move a result's in-memory arrays to its directory and memory-map them
+
+    Owners that already hold the in-memory arrays keep them until they next
+    acquire the result; the store itself only references the mapped copies.
+    """
+    def spilled(name, array):
+        if isinstance(array, np.memmap):
+            return array
+        path = os.path.join(result.result_dir, f"{name.replace('/', '-')}.npy")
+        np.save(path, array)
+        return np.load(path, mmap_mode='r')
+
+    result.arrays = {name: spilled(name, array) for name, array in result.arrays.items()}
+    # Derived values may still reference the in-memory arrays; rebuild them from the mapped ones
+    result._derived.clear()
+    for name, frames in result.frame_lists.items():
+        result.frame_lists[name] = spilled(f'frames-{name}', frames)
+        set_frame_list(result.report, name, result.frame_lists[name])
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _remove_uploads(upload_dir, pid):
+    prefix = f'{pid}-'
+    for name in os.listdir(upload_dir):
+        if name.startswith(prefix):
+            try:
+                os.unlink(os.path.join(upload_dir, name))
+            except OSError:
+                pass
+
+def _reclaim_dead_processes(store_dir, upload_dir):
+    """
+    Delete results and uploads left behind by store processes that no longer run
+    """
+    for name in os.listdir(store_dir):
+        if name.startswith('results-') and name[len('results-'):].isdigit():
+            if not _pid_alive(int(name[len('results-'):])):
+                shutil.rmtree(os.path.join(store_dir, name), ignore_errors=True)
+    pids = {name.split('-', 1)[0] for name in os.listdir(upload_dir)}
+    for pid in pids:
+        if pid.isdigit() and not _pid_alive(int(pid)):
+            _remove_uploads(upload_dir, int(pid))
@@ -0,0 +1,212 @@
+import shutil
+import subprocess
+import cv2
+import numpy as np
+
+from array_files import save_arrays
+from container import parse_container
+from decoders import open_decoder
+
+try:
+    import av
+except ImportError:  # PyAV is optional, ffprobe or a plain decode are used without it
+    av = None
+
+class SeekIndex:
+    """
+    Map from frame numbers to keyframes and presentation timestamps
+
+    Frames are numbered in presentation order, like the indices reported by
+    analyze_frames. keyframes holds the sorted frame numbers at which a
+    decoder can start, timestamps_ms the presentation time of every frame
+    relative to the first one (or None when the source could not tell).
+    """
+
+    def __init__(self, keyframes, timestamps_ms=None, source='none'):
+        """
+        Args:
+            keyframes (array-like): Frame numbers of the keyframes
+            timestamps_ms (array-like): Presentation time of every frame in milliseconds
+            source (str): Where the index came from, e.g. 'pyav', 'ffprobe' or 'none'
+        """
+        self.keyframes = np.unique(np.asarray(keyframes, dtype=np.int64))
+        if len(self.keyframes) == 0 or self.keyframes[0] != 0:
+            # Decoding from the first frame always works
+            self.keyframes = np.concatenate([[0], self.keyframes]).astype(np.int64)
+        self.timestamps_ms = (
+            None if timestamps_ms is None else np.asarray(timestamps_ms, dtype=np.float64)
+        )
+        self.source = source
+
+    @property
+    def frame_count(self):
+        """
+        int: Number of frames the index knows timestamps for, 0 if unknown
+        """
+        return 0 if self.timestamps_ms is None else len(self.timestamps_ms)
+
+    def keyframe_before(self, frame_index):
+        """
+        Nearest keyframe at or before a frame
+
+        Args:
+            frame_index (int): Target frame number
+
+        Returns:
+            int: Frame number decoding should start from to reach frame_index
+        """
+        position = np.searchsorted(self.keyframes, frame_index, side='right') - 1
+        return int(self.keyframes[max(0, position)])
+
+    def save(self, path):
+        """
+        Write the index to an .npz file
+
+        Args:
+            path (str): Destination path
+        """
+        arrays = {'keyframes': self.keyframes, 'source': np.array(self.source)}
+        if self.timestamps_ms is not None:
+            arrays['timestamps_ms'] = self.timestamps_ms
+        save_arrays(path, arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read an index written by save
+
+        Args:
+            path (str): Path of the .npz file
+
+        Returns:
+            SeekIndex: The loaded index
+        """
+        with np.load(path) as data:
+            return cls(
+                data['keyframes'],
+                data['timestamps_ms'] if 'timestamps_ms' in data else None,
+                str(data['source']),
+            )
+
+def build_seek_index(video_path):
+    """
+    Build a seek index from the container's packets without decoding any pixels
+
+    MP4/MOV and Matroska sample tables are read directly first, then PyAV
+    is used when it is installed, then ffprobe. When none of them works the
+    index only holds frame 0, which makes every seek decode from the start:
+    slow, but always correct.
+
+    Args:
+        video_path (str): Path to the video file
+
+    Returns:
+        SeekIndex: Keyframes and timestamps of the first video stream
+    """
+    try:
+        info = parse_container(video_path)
+    except (OSError, ValueError):
+        info = None
+    if info is not None:
+        return SeekIndex(info['keyframes'], info['timestamps_ms'], 'container')
+
+    for reader in (_read_packets_pyav, _read_packets_ffprobe):
+        try:
+            packets = reader(video_path)
+        except (OSError, ValueError, subprocess.SubprocessError):
+            continue
+        if packets is not None and len(packets[0]):
+            return _index_from_packets(*packets)
+    return SeekIndex([0])
+
+def _index_from_packets(pts_seconds, is_keyframe, source):
+    """
+    Turn packets in decode order into a presentation-order index
+
+    Args:
+        pts_seconds (numpy.ndarray): Presentation time of each packet
+        is_keyframe (numpy.ndarray): Keyframe flag of each packet
+        source (str): Name of the packet reader
+
+    Returns:
+        SeekIndex: Index in presentation order
+    """
+    # With B-frames packets arrive out of presentation order; sorting by pts fixes that
+    order = np.argsort(pts_seconds, kind='stable')
+    pts_sorted = pts_seconds[order]
+    keyframes = np.flatnonzero(is_keyframe[order])
+    return SeekIndex(keyframes, (pts_sorted - pts_sorted[0]) * 1000.0, source)
+
+def _read_packets_pyav(video_path):
+    if av is None:
+        return None
+    with av.open(video_path) as container:
+        stream = container.streams.video[0]
+        pts, keys = [], []
+        for packet in container.demux(stream):
+            # The flushing packet at the end carries no data
+            if packet.size == 0:
+                continue
+            timestamp = packet.pts if packet.pts is not None else packet.dts
+            if timestamp is None:
+                continue
+            pts.append(float(timestamp * packet.time_base))
+            keys.append(packet.is_keyframe)
+    return np.array(pts), np.array(keys, dtype=bool), 'pyav'
+
+def _read_packets_ffprobe(video_path):
+    ffprobe = shutil.which('ffprobe')
+    if ffprobe is None:
+        return None
+    output = subprocess.run(
+        [ffprobe, '-v', 'error', '-select_streams', 'v:0',
+         '-show_entries', 'packet=pts_time,dts_time,flags', '-of', 'compact=p=0', video_path],
+        capture_output=True, text=True, check=True,
+    ).stdout
+
+    pts, keys = [], []
+    for line in output.splitlines():
+        fields = dict(item.split('=', 1) for item in line.split('|') if '=' in item)
+        timestamp = fields.get('pts_time', 'N/A')
+        if timestamp == 'N/A':
+            timestamp = fields.get('dts_time', 'N/A')
+        if timestamp == 'N/A':
+            continue
+        pts.append(float(timestamp))
+        keys.append(fields.get('flags', '').startswith('K'))
+    return np.array(pts), np.array(keys, dtype=bool), 'ffprobe'
+
+def open_at(video_path, frame_index, seek_index=None, threads=None):
+    """
+    Open a capture positioned so that the next read returns frame_index
+
+    With a seek index the capture jumps to the nearest keyframe, where
+    seeking is exact, and grabs forward from there. Without one it asks the
+    backend to seek to the frame directly.
+
+    Args:
+        video_path (str): Path to the video file
+        frame_index (int): Frame to position the capture at
+        seek_index (SeekIndex): Optional keyframe index of the video
+        threads (int): Decode threads, None for OpenCV's default
+
+    Returns:
+        cv2.VideoCapture: Opened video capture
+    """
+    cap = open_decoder(video_path, 'opencv', threads)
+    if frame_index <= 0:
+        return cap
+
+    start = seek_index.keyframe_before(frame_index) if seek_index is not None else frame_index
+    if start > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) != start:
+            # The backend could not seek exactly, fall back to grabbing from the start
+            cap.release()
+            cap = open_decoder(video_path, 'opencv', threads)
+            start = 0
+
+    for _ in range(frame_index - start):
+        if not cap.grab():
+            break
+    return cap
@@ -0,0 +1,19 @@
+import pytest
+
+from benchmark import generate_video
+
+# Long enough for a two-worker parallel scan, which needs MIN_SEGMENT_FRAMES per segment
+CLIP_FRAMES = 600
+CLIP_CUT_EVERY = 100
+
+@pytest.fixture(scope='session')
+def clip(tmp_path_factory):
+    """
+    Small synthetic clip with a cut every CLIP_CUT_EVERY frames
+
+    Returns:
+        tuple: (path of the clip, frame indices of the injected cuts)
+    """
+    path = str(tmp_path_factory.mktemp('clips') / 'clip.mp4')
+    cuts = generate_video(path, 160, 120, CLIP_FRAMES, cut_every=CLIP_CUT_EVERY)
+    return path, cuts
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+import utils
+from utils import analyze_frame_scores, analyze_video, coarse_to_fine_scan, compare_downscaled
+
+def test_analyze_video_finds_injected_cuts(clip):
+    path, cuts = clip
+    analysis = analyze_video(path, workers=1)
+
+    assert analysis['altered_frames'] == cuts
+    assert analysis['frame_scores'].dtype == np.float32
+    assert analysis['metadata']['frame_count'] == len(analysis['frame_scores'])
+
+def test_coarse_to_fine_scan_samples_keyframes_only(clip):
+    path, cuts = clip
+    result = coarse_to_fine_scan(path)
+
+    assert result['altered_frames'] == cuts
+    assert result['sampling'] == 'keyframes'
+    # Keyframes plus the rescanned windows are a fraction of the clip
+    assert result['frames_sampled'] + result['frames_rescanned'] < result['frame_count'] / 4
+
+def test_parallel_decoder_rate_uses_wall_clock_time(clip):
+    path, _ = clip
+    analysis = analyze_video(path, workers=2, decode_threads=2)
+
+    frames = len(analysis['frame_scores'])
+    decoder = analysis['decoder']
+    assert decoder['frames_per_second'] == pytest.approx(frames / decoder['seconds'])
+    # Measured around the whole scan, not summed over the workers' decode time
+    assert decoder['seconds'] != analysis['timings']['decode']
+    assert decoder['seconds'] <= analysis['timings']['total']
+    assert decoder['threads'] == 2
+
+def test_serial_decoder_rate_uses_decode_time(clip):
+    path, _ = clip
+    analysis = analyze_video(path, workers=1)
+
+    assert analysis['decoder']['seconds'] == analysis['timings']['decode']
+    assert analysis['decoder']['frames_per_second'] == pytest.approx(
+        len(analysis['frame_scores']) / analysis['timings']['decode']
+    )
+
+def test_segment_worker_honours_decode_threads(clip):
+    path, _ = clip
+    scores, _, _ = utils._analyze_segment(path, 0, 300, decode_threads=2)
+
+    np.testing.assert_array_equal(scores, analyze_frame_scores(path, workers=1)[:300])
+
+def test_compare_downscaled_crops_both_scans(clip):
+    path, _ = clip
+    # At full scale the two scans differ only if the ROI is applied to one of them
+    comparison = compare_downscaled(path, threshold=0.01, scale=1.0, roi=(0, 0, 40, 30))
+
+    assert comparison['full_resolution_frames'] == comparison['downscaled_frames']
+    assert comparison['agreement'] == 1.0
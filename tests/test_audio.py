@@ -0,0 +1,122 @@
+import subprocess
+
+import numpy as np
+import pytest
+
+import utils
+from audio import AUDIO_SAMPLE_RATE, SPECTRAL_THRESHOLD, AudioScanner, align_audio_scores, frame_audio_times
+from decoders import FFmpegReader, find_ffmpeg
+from utils import analyze_video
+
+def scan(samples):
+    scanner = AudioScanner()
+    scanner.feed(samples.astype(np.float32))
+    return scanner.result()
+
+def test_sound_out_of_silence_is_not_a_spectral_splice():
+    rng = np.random.default_rng(0)
+    silence = np.zeros(AUDIO_SAMPLE_RATE)
+    # Start mid-window, so one window holds both silence and sound
+    sound = 0.1 * rng.standard_normal(AUDIO_SAMPLE_RATE + 100)
+    result = scan(np.concatenate([silence, sound]))
+
+    assert result['spectral'].max() < SPECTRAL_THRESHOLD
+
+def test_spliced_sound_is_a_spectral_splice():
+    rng = np.random.default_rng(0)
+    tone = 0.1 * np.sin(2 * np.pi * 440 * np.arange(AUDIO_SAMPLE_RATE) / AUDIO_SAMPLE_RATE)
+    noise = 0.1 * rng.standard_normal(AUDIO_SAMPLE_RATE)
+    result = scan(np.concatenate([tone, noise]))
+
+    flagged = result['times'][result['spectral'] > SPECTRAL_THRESHOLD]
+    assert len(flagged) and np.all(np.abs(flagged - 1.0) < 0.05)
+
+def test_frames_are_placed_by_timestamps_and_stream_starts():
+    # 10 fps video starting at 0.5 s with one dropped frame, audio starting at 1.5 s
+    container = {
+        'timestamps_ms': np.array([0, 100, 200, 400, 500], dtype=np.float64),
+        'start_seconds': 0.5,
+        'audio_start_seconds': 1.5,
+    }
+    frame_times = frame_audio_times(5, 10.0, container)
+    np.testing.assert_allclose(frame_times, [-1.0, -0.9, -0.8, -0.6, -0.5])
+
+    audio = {
+        'times': np.array([-0.95, -0.7, -0.45, -0.35]),
+        'spectral': np.array([1, 2, 3, 4], dtype=np.float32),
+        'rms_jump': np.zeros(4, dtype=np.float32),
+    }
+    # The window between the dropped frame's neighbours belongs to frame 2; windows past the end are dropped
+    np.testing.assert_array_equal(align_audio_scores(audio, frame_times)['spectral'], [1, 0, 2, 0, 3])
+
+@pytest.mark.skipif(find_ffmpeg() is None, reason="needs an ffmpeg executable")
+def test_late_audio_track_is_aligned_with_the_frames(tmp_path):
+    # 6 s of 25 fps video; the audio starts 1 s in and is spliced from a tone to noise 3 s later
+    path = str(tmp_path / 'late_audio.mkv')
+    subprocess.run(
+        [find_ffmpeg(), '-v', 'error', '-y',
+         '-f', 'lavfi', '-i', 'testsrc=size=160x120:rate=25:d=6',
+         '-f', 'lavfi', '-i', 'sine=f=440:d=3', '-f', 'lavfi', '-i', 'anoisesrc=d=2:c=pink',
+         '-filter_complex', '[1][2]concat=n=2:v=0:a=1,asetpts=PTS-STARTPTS+1/TB[a]',
+         '-map', '0:v', '-map', '[a]', '-c:v', 'mpeg4', '-c:a', 'aac', path],
+        check=True,
+    )
+    analysis = analyze_video(path, audio=True)
+
+    # Read in one pass through ffmpeg, whatever the requested decoder
+    assert analysis['decoder']['name'] == 'ffmpeg'
+    assert analysis['audio']['start_offset'] == pytest.approx(1.0, abs=0.01)
+    assert 100 in analysis['audio']['spectral']['flagged_frames']
+    assert min(analysis['audio']['spectral']['flagged_frames']) >= 98
+    assert len(analysis['audio_scores']['spectral']) == len(analysis['frame_scores'])
+
+def test_missing_audio_track_is_reported(clip):
+    path, _ = clip
+    analysis = analyze_video(path, audio=True)
+
+    assert 'error' in analysis['audio']
+    assert 'audio_scores' not in analysis
+
+@pytest.mark.skipif(find_ffmpeg() is None, reason="needs an ffmpeg executable")
+def test_failed_ffmpeg_is_an_error_not_an_empty_video(clip):
+    path, _ = clip
+    # An output format this build cannot write stops ffmpeg before it decodes a frame
+    reader = FFmpegReader(path, ffmpeg=find_ffmpeg(), audio_output=['-f', 'no_such_format'])
+    reader.audio.close()
+
+    with pytest.raises(ValueError, match='no_such_format'):
+        reader.read()
+    reader.release()
+
+@pytest.mark.skipif(find_ffmpeg() is None, reason="needs an ffmpeg executable")
+def test_video_is_scanned_when_the_audio_ffmpeg_fails(tmp_path, monkeypatch):
+    path = str(tmp_path / 'with_audio.mkv')
+    subprocess.run(
+        [find_ffmpeg(), '-v', 'error', '-y', '-f', 'lavfi', '-i', 'testsrc=size=160x120:rate=25:d=2',
+         '-f', 'lavfi', '-i', 'sine=f=440:d=2', '-c:v', 'mpeg4', '-c:a', 'aac', path],
+        check=True,
+    )
+    monkeypatch.setattr(utils, 'audio_output_args', lambda: ['-f', 'no_such_format'])
+    analysis = analyze_video(path, audio=True)
+
+    assert analysis['decoder']['name'] == 'opencv'
+    assert len(analysis['frame_scores']) == 50
+    assert 'no_such_format' in analysis['audio']['error']
+
+@pytest.mark.skipif(find_ffmpeg() is None, reason="needs an ffmpeg executable")
+def test_audio_scan_failure_keeps_the_video_scores(tmp_path, monkeypatch):
+    path = str(tmp_path / 'with_audio.mkv')
+    subprocess.run(
+        [find_ffmpeg(), '-v', 'error', '-y', '-f', 'lavfi', '-i', 'testsrc=size=160x120:rate=25:d=2',
+         '-f', 'lavfi', '-i', 'sine=f=440:d=2', '-c:v', 'mpeg4', '-c:a', 'aac', path],
+        check=True,
+    )
+
+    def failing_scan(stream):
+        raise MemoryError("audio buffer")
+    monkeypatch.setattr(utils, 'scan_audio', failing_scan)
+    analysis = analyze_video(path, audio=True)
+
+    assert len(analysis['frame_scores']) == 50
+    assert analysis['audio'] == {'error': "audio buffer"}
+    assert 'audio_scores' not in analysis
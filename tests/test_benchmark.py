@@ -0,0 +1,13 @@
+import pytest
+
+from benchmark import _format_rate, measure_stage
+
+def test_failed_stage_raises_instead_of_hanging(clip):
+    path, _ = clip
+
+    with pytest.raises(RuntimeError, match='exited with code 1'):
+        measure_stage('no_such_stage', path)
+
+def test_untimed_rate_is_formatted():
+    assert _format_rate(None, 9) == '      n/a'
+    assert _format_rate(1234.56, 9) == '   1234.6'
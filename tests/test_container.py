@@ -0,0 +1,103 @@
+import struct
+
+import numpy as np
+import pytest
+
+from container import parse_container
+
+def box_payload(data, box_type):
+    """
+    Offset of the payload of the first box of a type, past its version and flags
+    """
+    return data.index(box_type) + 8
+
+def write(tmp_path, data, name='video.mp4'):
+    path = tmp_path / name
+    path.write_bytes(bytes(data))
+    return str(path)
+
+@pytest.fixture
+def clip_bytes(clip):
+    path, _ = clip
+    with open(path, 'rb') as f:
+        return bytearray(f.read())
+
+def test_clip_is_parsed(clip):
+    path, _ = clip
+    info = parse_container(path)
+
+    assert info['format'] == 'mp4'
+    assert info['frame_count'] == 600
+    assert info['keyframes'][0] == 0
+
+def test_oversized_stts_count_is_rejected(clip_bytes, tmp_path):
+    # The first entry's sample count, after the 4-byte entry count
+    position = box_payload(clip_bytes, b'stts') + 4
+    clip_bytes[position:position + 4] = struct.pack('>I', 0xFFFFFFFF)
+
+    with pytest.raises(ValueError, match='stts'):
+        parse_container(write(tmp_path, clip_bytes))
+
+def test_stts_disagreeing_with_stsz_is_rejected(clip_bytes, tmp_path):
+    position = box_payload(clip_bytes, b'stts') + 4
+    count = struct.unpack('>I', clip_bytes[position:position + 4])[0]
+    clip_bytes[position:position + 4] = struct.pack('>I', count + 1)
+
+    with pytest.raises(ValueError):
+        parse_container(write(tmp_path, clip_bytes))
+
+def test_samples_larger_than_the_file_are_rejected(clip_bytes, tmp_path):
+    # A constant sample size of 1 GiB
+    position = box_payload(clip_bytes, b'stsz')
+    clip_bytes[position:position + 4] = struct.pack('>I', 1 << 30)
+
+    with pytest.raises(ValueError):
+        parse_container(write(tmp_path, clip_bytes))
+
+def test_file_truncated_inside_the_sample_tables_is_rejected(clip_bytes, tmp_path):
+    truncated = clip_bytes[:box_payload(clip_bytes, b'stsz') + 16]
+
+    with pytest.raises(ValueError):
+        parse_container(write(tmp_path, truncated))
+
+def test_file_truncated_before_the_moov_has_no_video(clip_bytes, tmp_path):
+    truncated = clip_bytes[:clip_bytes.index(b'moov') - 4]
+
+    assert parse_container(write(tmp_path, truncated)) is None
+
+def test_corrupt_moov_fails_cleanly(clip_bytes, tmp_path):
+    rng = np.random.default_rng(0)
+    moov = clip_bytes.index(b'moov') - 4
+    for attempt in range(100):
+        data = bytearray(clip_bytes)
+        for position in rng.integers(moov, len(data), 8):
+            data[position] = rng.integers(0, 256)
+        try:
+            parse_container(write(tmp_path, data))
+        except ValueError:
+            pass
+
+def test_samples_outside_the_edit_list_are_not_frames(clip_bytes, tmp_path):
+    # Present one second less, starting one second into the media: the 30 fps clip loses 30 frames
+    position = box_payload(clip_bytes, b'elst') + 4
+    movie_duration, media_time = struct.unpack('>Ii', clip_bytes[position:position + 8])
+    clip_bytes[position:position + 8] = struct.pack('>Ii', movie_duration - 1000, media_time + 15360)
+    info = parse_container(write(tmp_path, clip_bytes))
+
+    assert info['frame_count'] == 570
+    assert info['trimmed_samples'] == 30
+    assert info['start_seconds'] == 0.0
+    assert info['timestamps_ms'][-1] == pytest.approx(569 * 1000 / 30)
+
+def test_quicktime_meta_without_version_is_read(clip_bytes, tmp_path):
+    # QuickTime writes meta as a plain box: drop its version and flags and shrink every enclosing box
+    moov = clip_bytes.index(b'moov') - 4
+    meta = clip_bytes.index(b'meta', moov) - 4
+    del clip_bytes[meta + 8:meta + 12]
+    for box_type in (b'moov', b'udta', b'meta'):
+        position = clip_bytes.index(box_type, moov) - 4
+        size = struct.unpack('>I', clip_bytes[position:position + 4])[0]
+        clip_bytes[position:position + 4] = struct.pack('>I', size - 4)
+    info = parse_container(write(tmp_path, clip_bytes))
+
+    assert info['tags']['\xa9too'].startswith('Lavf')
@@ -0,0 +1,43 @@
+import multiprocessing
+
+from fingerprint_index import FingerprintIndex
+from test_fingerprints import random_walk
+
+VIDEOS_PER_PROCESS = 6
+
+def add_videos(index_dir, worker):
+    index = FingerprintIndex(index_dir)
+    for video in range(VIDEOS_PER_PROCESS):
+        key = f'{worker}-{video}'
+        index.add(key, random_walk(200, seed=worker * 100 + video), {'filename': key})
+
+def test_processes_sharing_an_index_lose_no_videos(tmp_path):
+    index_dir = str(tmp_path / 'index')
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=add_videos, args=(index_dir, worker)) for worker in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    index = FingerprintIndex(index_dir)
+    assert index.stats()['videos'] == 3 * VIDEOS_PER_PROCESS
+    assert all(f'{worker}-{video}' in index for worker in range(3) for video in range(VIDEOS_PER_PROCESS))
+
+def test_search_survives_shards_merged_away(tmp_path):
+    index_dir = str(tmp_path / 'index')
+    writer, reader = FingerprintIndex(index_dir), FingerprintIndex(index_dir)
+    query = random_walk(400, seed=1)
+    writer.add('first', query, {})
+    stale = reader._manifest()
+
+    # A second video merges the first shard into a new one and removes it
+    writer.add('second', random_walk(400, seed=2), {})
+    manifests = [stale]
+    real_manifest = reader._manifest
+    reader._manifest = lambda: manifests.pop() if manifests else real_manifest()
+
+    matches = reader.search(query[50:350])
+    assert [match['key'] for match in matches] == ['first']
+    assert matches[0]['segments'][0]['reference_start'] == 50
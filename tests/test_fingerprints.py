@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from fingerprints import chain_matches, find_repeated_segments, match_fingerprints
+from utils import analyze_video
+
+def random_walk(frames, seed=0):
+    """
+    Fingerprints of slowly changing footage: each frame flips at most one bit of the last
+    """
+    rng = np.random.default_rng(seed)
+    flips = np.where(rng.random(frames) < 0.7, np.uint64(1) << rng.integers(0, 64, frames).astype(np.uint64), 0)
+    return np.bitwise_xor.accumulate(flips.astype(np.uint64)) ^ np.uint64(rng.integers(0, 2 ** 63))
+
+def test_self_match_is_exact():
+    fingerprints = random_walk(900)
+    segments = match_fingerprints(fingerprints, fingerprints)
+
+    assert segments == [{
+        'query_start': 0, 'query_end': 899, 'reference_start': 0, 'reference_end': 899,
+        'matched_frames': 900, 'offset': 0,
+    }]
+
+@pytest.mark.parametrize('start, stop', [(100, 600), (300, 900), (0, 250)])
+def test_slice_matches_at_its_offset(start, stop):
+    fingerprints = random_walk(900)
+    segments = match_fingerprints(fingerprints[start:stop], fingerprints)
+
+    assert len(segments) == 1
+    assert segments[0]['offset'] == start
+    assert (segments[0]['reference_start'], segments[0]['reference_end']) == (start, stop - 1)
+
+def test_reinserted_footage_is_found():
+    clip, other = random_walk(300, seed=1), random_walk(2000, seed=2)
+    video = np.concatenate([other[:500], clip, other[500:1000], clip, other[1000:]])
+    repeats = find_repeated_segments(video)
+
+    assert len(repeats) == 1
+    assert (repeats[0]['source_start'], repeats[0]['source_end']) == (500, 799)
+    assert (repeats[0]['repeat_start'], repeats[0]['repeat_end']) == (1300, 1599)
+    assert repeats[0]['copies'] == 2
+
+def test_looped_footage_is_one_finding():
+    # Every chunk value of a 40-times loop is shared by 40 frames or more
+    video = np.tile(random_walk(300, seed=3), 40)
+    repeats = find_repeated_segments(video)
+
+    assert len(repeats) == 1
+    assert repeats[0]['period'] == 300
+    assert repeats[0]['copies'] == 40
+    assert (repeats[0]['source_start'], repeats[0]['repeat_end']) == (0, len(video) - 1)
+
+def test_chain_matches_anchors_on_the_strongest_run():
+    query = random_walk(100)
+    # Frames 0-29 match at offset 40, frames 30-99 at offset 41, as after a dropped frame
+    query_index = np.arange(100)
+    reference_index = query_index + np.where(query_index < 30, 40, 41)
+    segments = chain_matches(query_index, reference_index, query, 15, 2, 5)
+
+    assert len(segments) == 1
+    assert segments[0]['offset'] == 41
+    assert (segments[0]['query_start'], segments[0]['query_end']) == (0, 99)
+    assert (segments[0]['reference_start'], segments[0]['reference_end']) == (41, 140)
+    assert segments[0]['matched_frames'] == 100
+
+def test_chain_matches_keeps_distant_offsets_apart():
+    query = random_walk(200)
+    query_index = np.concatenate([np.arange(0, 50), np.arange(100, 160)])
+    reference_index = query_index + np.where(query_index < 100, 500, 900)
+    segments = chain_matches(query_index, reference_index, query, 15, 2, 5)
+
+    assert sorted((s['offset'], s['query_start'], s['query_end']) for s in segments) == [(500, 0, 49), (900, 100, 159)]
+
+def test_chain_matches_drops_static_footage():
+    # A parked camera view: every frame has the same fingerprint and matches at any offset
+    query = np.full(100, np.uint64(0x0123456789ABCDEF))
+    query_index = np.arange(100)
+    segments = chain_matches(query_index, query_index + 500, query, 15, 2, 5)
+
+    assert segments == []
+
+def test_every_scan_fingerprints_the_full_frames(clip):
+    path, _ = clip
+    plain = analyze_video(path)
+    reduced = analyze_video(path, scale=0.25, roi=(0, 0, 40, 30))
+    parallel = analyze_video(path, workers=2)
+
+    assert len(plain['fingerprints']) == len(plain['frame_scores'])
+    np.testing.assert_array_equal(reduced['fingerprints'], plain['fingerprints'])
+    np.testing.assert_array_equal(parallel['fingerprints'], plain['fingerprints'])
@@ -0,0 +1,34 @@
+import shutil
+import time
+
+from cache import AnalysisCache
+from jobs import JobQueue
+from result_store import ResultStore
+from utils import calculate_hashes
+
+def wait(queue, job_id):
+    while queue.get(job_id).active:
+        time.sleep(0.05)
+    return queue.get(job_id)
+
+def test_extra_analyses_are_opt_in_and_part_of_the_key(clip, tmp_path):
+    path, _ = clip
+    hashes = calculate_hashes(path)['digests']
+    store = ResultStore(str(tmp_path / 'store'))
+    queue = JobQueue(AnalysisCache(str(tmp_path / 'cache')), max_workers=1, store=store)
+
+    def submit(name, **options):
+        upload = str(tmp_path / name)
+        shutil.copyfile(path, upload)
+        return wait(queue, queue.submit(upload, name, 0, hashes, **options))
+
+    plain = submit('plain.mp4')
+    report = store.acquire(plain.key, 'test').report
+    assert plain.status == 'done'
+    assert not report['detectors'] and not report['audio']
+    assert 'thumbnails' not in store.acquire(plain.key, 'test').files
+
+    detected = submit('detected.mp4', detectors=['histogram'], thumbnails=True)
+    assert detected.key != plain.key
+    assert list(store.acquire(detected.key, 'test').report['detectors']) == ['histogram']
+    assert 'thumbnails' in store.acquire(detected.key, 'test').files
@@ -0,0 +1,25 @@
+import numpy as np
+
+import utils
+from seek_index import build_seek_index
+from utils import analyze_frame_scores, threshold_frames
+
+def test_parallel_scores_equal_serial(clip):
+    path, cuts = clip
+    serial = analyze_frame_scores(path, workers=1)
+    parallel = analyze_frame_scores(path, workers=2)
+
+    assert len(serial) == len(parallel)
+    np.testing.assert_array_equal(serial, parallel)
+    assert threshold_frames(serial) == cuts
+
+def test_segments_start_just_after_a_keyframe(clip):
+    path, _ = clip
+    seek_index = build_seek_index(path)
+    bounds = utils._segment_bounds(600, 3, seek_index)
+
+    assert bounds[0] == 0 and bounds[-1] == 600
+    assert len(bounds) == 4
+    # Each worker decodes from the frame before its segment, which should not need earlier frames
+    for bound in bounds[1:-1]:
+        assert seek_index.keyframe_before(bound - 1) == bound - 1
@@ -0,0 +1,89 @@
+import io
+import json
+
+import numpy as np
+import pytest
+
+from report_format import ReportFile, export_json, iter_json, set_frame_list, split_frame_lists, write_report
+
+def make_report():
+    return {
+        'filename': 'clip.mp4',
+        'metadata': {'frame_count': 5000, 'fps': 25.0},
+        'altered_frames': [3, 17, 18, 400, 4999],
+        'threshold': 0.05,
+        'detectors': {
+            'ssim': {'threshold': 0.3, 'flagged_frames': [], 'max_score': 0.1},
+            'noise': {'threshold': 2.0, 'flagged_frames': list(range(0, 5000, 7)), 'max_score': 4.5},
+        },
+        'audio': {
+            'sample_rate': 16000,
+            'spectral': {'threshold': 0.6, 'flagged_frames': [120], 'max_score': 0.9},
+        },
+        'repeated_segments': [{'source_start': 0, 'source_end': 20}],
+    }
+
+def test_split_and_set_frame_lists_round_trip():
+    report = make_report()
+    header, frame_lists = split_frame_lists(report)
+
+    assert header['altered_frames'] is None
+    assert header['detectors']['noise']['flagged_frames'] is None
+    assert header['audio']['sample_rate'] == 16000
+    assert set(frame_lists) == {
+        'altered_frames', 'detectors/ssim/flagged_frames', 'detectors/noise/flagged_frames',
+        'audio/spectral/flagged_frames',
+    }
+    for name, frames in frame_lists.items():
+        set_frame_list(header, name, frames)
+    assert header == report
+
+def test_binary_report_round_trips(tmp_path):
+    report = make_report()
+    scores = np.random.default_rng(0).random(5000, dtype=np.float32)
+    path = str(tmp_path / 'report.vgr')
+    write_report(path, report, scores)
+
+    report_file = ReportFile(path)
+    assert report_file.count('detectors/noise/flagged_frames') == len(report['detectors']['noise']['flagged_frames'])
+    assert report_file.to_dict() == report
+    np.testing.assert_array_equal(report_file.array('frame_scores'), scores)
+
+    # Reading from bytes gives the same result as the memory-mapped file
+    with open(path, 'rb') as f:
+        assert ReportFile(f.read()).to_dict() == report
+
+def test_binary_report_rejects_other_data():
+    with pytest.raises(ValueError):
+        ReportFile(b'{"not": "a report"}')
+
+def test_streamed_json_matches_report():
+    report = make_report()
+    report['altered_frames'] = np.asarray(report['altered_frames'], dtype=np.int64)
+    scores = np.linspace(0, 1, 5000, dtype=np.float32)
+    out = io.StringIO()
+    export_json(report, out, scores)
+
+    exported = json.loads(out.getvalue())
+    assert exported['altered_frames'] == report['altered_frames'].tolist()
+    assert exported['detectors'] == report['detectors']
+    np.testing.assert_allclose(exported['frame_scores'], scores)
+
+def test_binary_report_decodes_arrays_only_when_asked(tmp_path):
+    report = make_report()
+    path = str(tmp_path / 'report.vgr')
+    write_report(path, report)
+
+    report_file = ReportFile(path)
+    assert report_file.report['altered_frames'] is None
+    assert report_file.count('altered_frames') == 5
+    assert report_file._loaded == {}
+    assert report_file.array('altered_frames').tolist() == report['altered_frames']
+    assert list(report_file._loaded) == ['altered_frames']
+
+def test_streamed_json_encodes_long_lists_a_chunk_at_a_time():
+    report = {'altered_frames': np.arange(5000)}
+    pieces = list(iter_json(report, chunk_items=100))
+
+    assert json.loads(''.join(pieces)) == {'altered_frames': list(range(5000))}
+    assert max(len(piece) for piece in pieces) <= 100 * len('4999, ')
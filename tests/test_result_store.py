@@ -0,0 +1,83 @@
+import hashlib
+import io
+import os
+
+import numpy as np
+import pytest
+
+from result_store import ResultStore
+
+SCORES = 250_000  # 1 MB of float32 scores per result
+
+def make_report():
+    return {
+        'threshold': 0.05,
+        'altered_frames': [1, 2, 3],
+        'detectors': {'ssim': {'threshold': 0.3, 'flagged_frames': [2], 'max_score': 0.5}},
+    }
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultStore(str(tmp_path / 'store'), max_memory_bytes=1_500_000, max_disk_bytes=2_500_000)
+    yield store
+    store.close()
+
+def test_results_are_shared_by_key(store):
+    scores = np.zeros(SCORES, dtype=np.float32)
+    store.put('a', make_report(), {'frame_scores': scores}, owner='job')
+
+    first = store.acquire('a', 'session-1')
+    second = store.acquire('a', 'session-2')
+    assert first is second
+    assert isinstance(first.report['altered_frames'], np.ndarray)
+    assert first.report['detectors']['ssim']['flagged_frames'].tolist() == [2]
+    assert first.derived('pyramid', lambda: object()) is second.derived('pyramid', lambda: object())
+
+def test_memory_budget_spills_least_recently_used(store):
+    store.put('a', make_report(), {'frame_scores': np.ones(SCORES, dtype=np.float32)}, owner='job-a')
+    store.put('b', make_report(), {'frame_scores': np.ones(SCORES, dtype=np.float32)}, owner='job-b')
+
+    spilled = store.acquire('a', 'session')
+    kept = store.acquire('b', 'session')
+    assert isinstance(spilled.arrays['frame_scores'], np.memmap)
+    assert isinstance(spilled.report['altered_frames'], np.memmap)
+    assert not isinstance(kept.arrays['frame_scores'], np.memmap)
+    np.testing.assert_array_equal(spilled.arrays['frame_scores'], 1)
+    assert store.stats()['memory_bytes'] <= store.max_memory_bytes
+
+def test_disk_budget_evicts_only_unheld_results(store):
+    for key in ('a', 'b', 'c'):
+        store.put(key, make_report(), {'frame_scores': np.ones(SCORES, dtype=np.float32)}, owner=f'job-{key}')
+    store.release('a', 'job-a')
+    store.put('d', make_report(), {'frame_scores': np.ones(SCORES, dtype=np.float32)}, owner='job-d')
+
+    assert 'a' not in store
+    assert all(key in store for key in ('b', 'c', 'd'))
+
+def test_uploads_of_dead_processes_are_reclaimed(tmp_path):
+    store_dir = str(tmp_path / 'store')
+    uploads = os.path.join(store_dir, 'uploads')
+    os.makedirs(uploads)
+    # No process has pid 2**22 + 1 on Linux, whose pid_max is at most 2**22
+    stale = os.path.join(uploads, f'{2 ** 22 + 1}-stale.mp4')
+    open(stale, 'wb').close()
+
+    store = ResultStore(store_dir)
+    path, hashes = store.save_upload(io.BytesIO(b'video'), '.mp4')
+    assert not os.path.exists(stale)
+    assert os.path.basename(path).startswith(f'{os.getpid()}-')
+    assert hashes['md5'] == hashlib.md5(b'video').hexdigest()
+
+    store.close()
+    assert not os.path.exists(path)
+
+def test_lapsed_holds_do_not_pin_results(tmp_path):
+    # Every hold lapses at once, as for sessions whose browser tabs were closed
+    store = ResultStore(str(tmp_path / 'store'), max_memory_bytes=1_500_000, max_disk_bytes=2_500_000,
+                        lease_seconds=0)
+    for key in ('a', 'b', 'c', 'd'):
+        store.put(key, make_report(), {'frame_scores': np.ones(SCORES, dtype=np.float32)}, owner=f'session-{key}')
+
+    assert 'a' not in store
+    assert 'd' in store
+    store.close()
@@ -0,0 +1,51 @@
+import numpy as np
+
+import utils
+from utils import analyze_frame_scores, analyze_frame_scores_resumable, analyze_video, analyze_video_resumable
+
+class Interrupted(Exception):
+    pass
+
+def test_resumed_scan_equals_one_shot_scan(clip, tmp_path, monkeypatch):
+    path, _ = clip
+    checkpoint_path = str(tmp_path / 'scan.checkpoint.json')
+    expected = analyze_frame_scores(path, workers=1)
+
+    # Report every frame and stop the first scan part-way through
+    monkeypatch.setattr(utils, 'PROGRESS_INTERVAL', 0.0)
+
+    def interrupt(update):
+        if update['done'] >= 250:
+            raise Interrupted()
+
+    try:
+        analyze_frame_scores_resumable(path, checkpoint_path, progress_callback=interrupt, checkpoint_interval=0.0)
+    except Interrupted:
+        pass
+    else:
+        raise AssertionError("the first scan was not interrupted")
+
+    seen = []
+    resumed = analyze_frame_scores_resumable(path, checkpoint_path, progress_callback=seen.append)
+
+    np.testing.assert_array_equal(resumed, expected)
+    # The second scan started from the checkpoint rather than from frame 0
+    assert min(update['done'] for update in seen if update['done']) > 200
+
+def test_resumable_scan_starts_over_for_other_parameters(clip, tmp_path):
+    path, _ = clip
+    checkpoint_path = str(tmp_path / 'scan.checkpoint.json')
+    analyze_frame_scores_resumable(path, checkpoint_path, scale=0.5)
+
+    full = analyze_frame_scores_resumable(path, checkpoint_path, scale=1.0)
+
+    np.testing.assert_array_equal(full, analyze_frame_scores(path, workers=1))
+
+def test_resumable_analysis_matches_analyze_video(clip, tmp_path):
+    path, cuts = clip
+    analysis = analyze_video_resumable(path, str(tmp_path / 'scan.checkpoint.json'))
+    expected = analyze_video(path)
+
+    assert analysis['altered_frames'] == cuts
+    assert analysis['hashes'] == expected['hashes']
+    np.testing.assert_array_equal(analysis['frame_scores'], expected['frame_scores'])
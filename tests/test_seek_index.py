@@ -0,0 +1,34 @@
+import cv2
+import numpy as np
+
+from seek_index import SeekIndex, build_seek_index, open_at
+
+def test_index_round_trips_under_its_own_name(clip, tmp_path):
+    path, _ = clip
+    index = build_seek_index(path)
+    # Cache entries are written under temporary names without the .npz extension
+    target = str(tmp_path / 'seek_index.tmp')
+    index.save(target)
+
+    loaded = SeekIndex.load(target)
+    np.testing.assert_array_equal(loaded.keyframes, index.keyframes)
+    np.testing.assert_array_equal(loaded.timestamps_ms, index.timestamps_ms)
+    assert loaded.source == index.source
+
+def test_open_at_reaches_the_requested_frame(clip):
+    path, _ = clip
+    index = build_seek_index(path)
+    # A frame just after a keyframe is reached by seeking and then grabbing forward
+    target = int(index.keyframes[3]) + 2
+
+    cap = cv2.VideoCapture(path)
+    for _ in range(target):
+        cap.grab()
+    expected = cap.read()[1]
+    cap.release()
+
+    cap = open_at(path, target, index)
+    ret, frame = cap.read()
+    cap.release()
+    assert ret
+    np.testing.assert_array_equal(frame, expected)
@@ -0,0 +1,18 @@
+import numpy as np
+
+from thumbnails import ThumbnailStore, ThumbnailWriter
+
+def test_store_keeps_images_after_closing(tmp_path):
+    path = str(tmp_path / 'thumbnails.bin')
+    writer = ThumbnailWriter(path, neighbours=0)
+    frame = np.full((120, 160, 3), 128, dtype=np.uint8)
+    writer.update(0, frame, frame[:, :, 0], 0.0)
+    writer.update(1, frame, frame[:, :, 0], 1.0)
+    writer.close()
+
+    with ThumbnailStore(path) as store:
+        assert store.frames.tolist() == [1]
+        image = store.get(1)
+
+    assert store._data.closed
+    assert image[:2] == b'\xff\xd8'
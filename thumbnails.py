@@ -0,0 +1,178 @@
+import collections
+import mmap
+import struct
+import cv2
+import numpy as np
+
+# Footer at the end of a thumbnail file: magic, index offset, number of entries
+FOOTER = struct.Struct('<8sQQ')
+MAGIC = b'VGTHUMB1'
+
+class ThumbnailWriter:
+    """
+    Frame sink that stores JPEG thumbnails of flagged frames and their neighbours
+
+    Thumbnails are appended to a single file as they are encoded. Closing
+    the writer appends an int64 (frame, offset, length) index and a footer
+    that points at it, so readers can memory-map the file and jump straight
+    to any stored frame without decoding the video again.
+    """
+
+    def __init__(self, path, threshold=0.05, neighbours=1, max_width=320, quality=80,
+                 max_thumbnails=5000):
+        """
+        Args:
+            path (str): File to write the thumbnails to
+            threshold (float): Change score above which a frame is stored
+            neighbours (int): Frames stored on each side of a flagged frame
+            max_width (int): Thumbnails wider than this are scaled down
+            quality (int): JPEG quality from 0 to 100
+            max_thumbnails (int): Stop storing once this many thumbnails were written
+        """
+        self.path = path
+        self.threshold = threshold
+        self.neighbours = neighbours
+        self.max_width = max_width
+        self.quality = quality
+        self.max_thumbnails = max_thumbnails
+        self._file = open(path, 'wb')
+        self._index = []
+        self._stored = set()
+        self._recent = collections.deque(maxlen=neighbours)
+        self._pending_after = 0
+
+    def update(self, index, frame, gray_frame, score):
+        """
+        Consume one decoded frame of the scan
+
+        Args:
+            index (int): Frame index in the video
+            frame (numpy.ndarray): Decoded frame
+            gray_frame (numpy.ndarray): Grayscale frame used for differencing
+            score (float): Change score of the frame against its predecessor
+        """
+        if score > self.threshold:
+            # Store the frames leading up to the change, then the flagged frame itself
+            for recent_index, recent_frame in self._recent:
+                self._store(recent_index, recent_frame)
+            self._store(index, frame)
+            self._pending_after = self.neighbours
+        elif self._pending_after > 0:
+            self._store(index, frame)
+            self._pending_after -= 1
+
+        if self.neighbours:
+            # The scan reuses its frame buffers, so keep a copy
+            self._recent.append((index, frame.copy()))
+
+    def close(self):
+        """
+        Write the index and footer and close the file
+        """
+        if self._file.closed:
+            return
+        index = np.array(sorted(self._index), dtype=np.int64).reshape(-1, 3)
+        index_offset = self._file.tell()
+        self._file.write(index.tobytes())
+        self._file.write(FOOTER.pack(MAGIC, index_offset, len(index)))
+        self._file.close()
+
+    def _store(self, index, frame):
+        if index in self._stored or len(self._index) >= self.max_thumbnails:
+            return
+
+        height, width = frame.shape[:2]
+        if width > self.max_width:
+            frame = cv2.resize(
+                frame, (self.max_width, max(1, height * self.max_width // width)),
+                interpolation=cv2.INTER_AREA,
+            )
+        ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return
+
+        offset = self._file.tell()
+        self._file.write(encoded.tobytes())
+        self._index.append((index, offset, len(encoded)))
+        self._stored.add(index)
+
+class ThumbnailStore:
+    """
+    Read-only, memory-mapped view of a file written by ThumbnailWriter
+
+    Use it as a context manager, or call close(), to release the mapping.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Thumbnail file to open
+
+        Raises:
+            ValueError: If the file is not a complete thumbnail file
+        """
+        with open(path, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._data) < FOOTER.size:
+            self._data.close()
+            raise ValueError(f"{path} is too short to be a thumbnail file")
+        magic, index_offset, count = FOOTER.unpack_from(self._data, len(self._data) - FOOTER.size)
+        if magic != MAGIC:
+            self._data.close()
+            raise ValueError(f"{path} is not a thumbnail file")
+
+        # The index is small, so copy it out and leave the mapping free to close
+        self._index = np.frombuffer(self._data, dtype=np.int64, count=count * 3,
+                                    offset=index_offset).reshape(-1, 3).copy()
+
+    @property
+    def frames(self):
+        """
+        numpy.ndarray: Sorted indices of the frames that have a thumbnail
+        """
+        return self._index[:, 0]
+
+    def __contains__(self, frame_index):
+        position = np.searchsorted(self.frames, frame_index)
+        return position < len(self.frames) and self.frames[position] == frame_index
+
+    def get(self, frame_index):
+        """
+        JPEG bytes of a stored frame
+
+        Args:
+            frame_index (int): Frame index in the video
+
+        Returns:
+            bytes: Encoded JPEG, or None if the frame has no thumbnail
+        """
+        position = np.searchsorted(self.frames, frame_index)
+        if position >= len(self.frames) or self.frames[position] != frame_index:
+            return None
+        _, offset, length = self._index[position]
+        return self._data[offset:offset + length]
+
+    def get_image(self, frame_index):
+        """
+        Decoded thumbnail of a stored frame
+
+        Args:
+            frame_index (int): Frame index in the video
+
+        Returns:
+            numpy.ndarray: BGR image, or None if the frame has no thumbnail
+        """
+        encoded = self.get(frame_index)
+        if encoded is None:
+            return None
+        return cv2.imdecode(np.frombuffer(encoded, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+    def close(self):
+        self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,7 +1,85 @@
 import cv2
 import hashlib
+import mmap
 import numpy as np
 import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from container import container_summary, parse_container
+from decoders import DRAIN_BLOCK_SIZE, iter_keyframes, open_decoder
+from audio import (
+    align_audio_scores, audio_output_args, frame_audio_times, has_audio_stream, scan_audio,
+    summarize_audio
+)
+from seek_index import SeekIndex, build_seek_index, open_at
+from checkpoint import ScanCheckpoint, frame_digest
+from fingerprints import dhash, find_repeated_segments
+
+# Uploads are copied to disk in chunks of this size so memory does not grow with the file
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Digests recorded for chain of custody; MD5 stays first as the report's primary hash
+HASH_ALGORITHMS = ('md5', 'sha256')
+
+# Files are hashed in windows of this size; hashlib releases the GIL on buffers this large
+HASH_BUFFER_SIZE = 16 * 1024 * 1024
+
+# Segments shorter than this are not worth the cost of a worker process and a seek
+MIN_SEGMENT_FRAMES = 250
+
+# Progress callbacks are throttled to at most one call per this many seconds
+PROGRESS_INTERVAL = 0.1
+
+# Resumable scans save their progress at most this many seconds apart
+CHECKPOINT_INTERVAL = 10.0
+
+# A followed recording is polled for new data this often, and given up on
+# once it has not grown for FOLLOW_IDLE_SECONDS
+FOLLOW_POLL_SECONDS = 2.0
+FOLLOW_IDLE_SECONDS = 60.0
+
+def _progress_reporter(callback, stage, total, unit):
+    """
+    Build a throttled progress function that reports position and ETA
+    
+    Args:
+        callback (callable): Receives a dict with 'stage', 'done', 'total',
+            'unit', 'elapsed_seconds' and 'eta_seconds'; may be None
+        stage (str): Name of the stage being reported, e.g. 'decode' or 'hash'
+        total (int): Expected final position, 0 when unknown
+        unit (str): Unit of the position, e.g. 'frames' or 'bytes'
+        
+    Returns:
+        callable: update(done, final=False, **extra) to call as work advances;
+            final bypasses the throttle so the last position is always reported,
+            extra keys are passed through to the callback
+    """
+    start = time.perf_counter()
+    last_call = [0.0]
+    
+    def update(done, final=False, **extra):
+        if callback is None:
+            return
+        now = time.perf_counter()
+        if not final and now - last_call[0] < PROGRESS_INTERVAL:
+            return
+        last_call[0] = now
+        elapsed = now - start
+        eta = elapsed / done * (total - done) if 0 < done <= total else None
+        callback(dict(
+            extra,
+            stage=stage,
+            done=done,
+            total=total,
+            unit=unit,
+            elapsed_seconds=elapsed,
+            eta_seconds=eta,
+        ))
+    
+    return update
 
 def extract_metadata(video_path):
     """
@@ -13,12 +91,57 @@ def extract_metadata(video_path):
     Returns:
         dict: Dictionary containing video metadata
     """
-    metadata = {}
     cap = cv2.VideoCapture(video_path)
     
     if not cap.isOpened():
         return {"error": "Failed to open video file"}
     
+    metadata = _read_metadata(cap)
+    cap.release()
+    _add_container_metadata(video_path, metadata)
+    return metadata
+
+def _add_container_metadata(video_path, metadata):
+    """
+    Merge what the container itself says about the video into the metadata
+    
+    CAP_PROP_FRAME_COUNT is often estimated from duration and frame rate,
+    so when the sample tables can be read their frame count replaces it and
+    the backend's figure is kept as 'reported_frame_count'.
+    
+    Args:
+        video_path (str): Path to the video file
+        metadata (dict): Metadata read from the capture, updated in place
+        
+    Returns:
+        dict: The parse_container result, or None if the container could not be read
+    """
+    try:
+        info = parse_container(video_path)
+    except (OSError, ValueError):
+        info = None
+    if info is None:
+        return None
+    
+    metadata['container'] = container_summary(info)
+    metadata['reported_frame_count'] = metadata['frame_count']
+    metadata['frame_count'] = info['frame_count']
+    if info['duration_seconds'] > 0:
+        metadata['duration_seconds'] = info['duration_seconds']
+    return info
+
+def _read_metadata(cap):
+    """
+    Read metadata from an already opened capture without consuming any frames
+    
+    Args:
+        cap (cv2.VideoCapture): Opened video capture
+        
+    Returns:
+        dict: Dictionary containing video metadata
+    """
+    metadata = {}
+    
     # Extract basic metadata
     metadata['frame_count'] = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
     metadata['frame_width'] = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
@@ -38,7 +161,6 @@ def extract_metadata(video_path):
     else:
         metadata['duration_seconds'] = 0
     
-    cap.release()
     return metadata
 
 def calculate_hash(video_path):
@@ -51,53 +173,1169 @@ def calculate_hash(video_path):
     Returns:
         str: MD5 hash of the video file
     """
-    hash_md5 = hashlib.md5()
-    with open(video_path, 'rb') as f:
-        for chunk in iter(lambda: f.read(4096), b''):
-            hash_md5.update(chunk)
-    return hash_md5.hexdigest()
+    return calculate_hashes(video_path, ('md5',))['digests']['md5']
 
-def analyze_frames(video_path, threshold=0.05):
+def calculate_hashes(video_path, algorithms=HASH_ALGORITHMS, buffer_size=HASH_BUFFER_SIZE,
+                     progress_callback=None):
+    """
+    Calculate several digests of the video file in a single read
+    
+    The file is memory-mapped and walked in large windows. Each window is fed
+    to every digest on its own thread; hashlib releases the GIL for buffers
+    this size, so the digests run side by side and alongside frame decoding.
+    
+    Args:
+        video_path (str): Path to the video file
+        algorithms (tuple): hashlib algorithm names, e.g. 'md5', 'sha1', 'sha256', 'blake2b'
+        buffer_size (int): Size of each window in bytes
+        progress_callback (callable): Called with the 'hash' stage position in bytes
+        
+    Returns:
+        dict: 'digests' by algorithm name, plus 'bytes', 'seconds' and 'mb_per_second'
+    """
+    hashers = {name: hashlib.new(name) for name in algorithms}
+    progress = _progress_reporter(
+        progress_callback, 'hash', os.path.getsize(video_path), 'bytes'
+    )
+    start = time.perf_counter()
+    total = 0
+    
+    with open(video_path, 'rb') as f, ThreadPoolExecutor(max_workers=len(hashers)) as pool:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # Empty files and some filesystems cannot be mapped
+            mapped = None
+        
+        if mapped is not None:
+            with mapped, memoryview(mapped) as view:
+                for offset in range(0, len(view), buffer_size):
+                    with view[offset:offset + buffer_size] as window:
+                        _update_hashers(hashers, window, pool)
+                    progress(min(offset + buffer_size, len(view)))
+                total = len(view)
+        else:
+            buffer = bytearray(buffer_size)
+            with memoryview(buffer) as view:
+                while True:
+                    n = f.readinto(buffer)
+                    if not n:
+                        break
+                    _update_hashers(hashers, view[:n], pool)
+                    total += n
+                    progress(total)
+    
+    progress(total, final=True)
+    seconds = time.perf_counter() - start
+    return {
+        'digests': {name: h.hexdigest() for name, h in hashers.items()},
+        'bytes': total,
+        'seconds': seconds,
+        'mb_per_second': total / 1024 / 1024 / seconds if seconds > 0 else None,
+    }
+
+def _update_hashers(hashers, data, pool=None):
+    """
+    Feed the same buffer to several hash objects, in parallel when a pool is given
+    
+    Args:
+        hashers (dict): hashlib objects by algorithm name
+        data (memoryview): Bytes to add to every digest
+        pool (ThreadPoolExecutor): Optional pool to run the updates on
+    """
+    if pool is None or len(hashers) == 1:
+        for h in hashers.values():
+            h.update(data)
+        return
+    
+    for future in [pool.submit(h.update, data) for h in hashers.values()]:
+        future.result()
+
+def save_upload(stream, suffix='.mp4', chunk_size=COPY_CHUNK_SIZE, algorithms=HASH_ALGORITHMS,
+                directory=None, prefix=None):
+    """
+    Copy an uploaded file to a temporary file on disk, hashing it on the way
+    
+    Data is moved through one reusable buffer, so peak memory stays at
+    chunk_size however large the upload is, and the digests come out of the
+    same pass instead of reading the file back afterwards.
+    
+    Args:
+        stream: Readable binary file object, such as a Streamlit UploadedFile
+        suffix (str): Suffix of the temporary file
+        chunk_size (int): Size of the copy buffer in bytes
+        algorithms (tuple): hashlib algorithm names to compute
+        directory (str): Directory to create the file in, None for the system temp directory
+        prefix (str): Prefix of the temporary file's name
+        
+    Returns:
+        tuple: (path of the temporary file, dict of hex digests by algorithm name)
+    """
+    hashers = {name: hashlib.new(name) for name in algorithms}
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    
+    stream.seek(0)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=directory, prefix=prefix) as tmp_file, \
+            ThreadPoolExecutor(max_workers=len(hashers)) as pool:
+        while True:
+            n = stream.readinto(buffer)
+            if not n:
+                break
+            _update_hashers(hashers, view[:n], pool)
+            tmp_file.write(view[:n])
+    
+    return tmp_file.name, {name: h.hexdigest() for name, h in hashers.items()}
+
+def analyze_frames(video_path, threshold=0.05, workers=1, scale=1.0, roi=None,
+                   progress_callback=None):
     """
     Analyze frames for alterations or tampering
     
     Args:
         video_path (str): Path to the video file
         threshold (float): Threshold for frame difference detection
+        workers (int): Number of worker processes, None for one per CPU core
+        scale (float): Resolution factor frames are diffed at, 1.0 for full resolution
+        roi (tuple): Optional (x, y, width, height) region to restrict the diff to
+        progress_callback (callable): Called with the 'decode' stage position in frames
         
     Returns:
         list: List of potentially altered frame indices
     """
+    scores = analyze_frame_scores(video_path, workers, scale, roi, progress_callback)
+    return threshold_frames(scores, threshold)
+
+def analyze_frame_scores(video_path, workers=1, scale=1.0, roi=None, progress_callback=None,
+                         timings=None, sinks=None, decoder='opencv', decode_threads=None):
+    """
+    Compute the change score of every frame against its predecessor
+    
+    Args:
+        video_path (str): Path to the video file
+        workers (int): Number of worker processes, None for one per CPU core
+        scale (float): Resolution factor frames are diffed at, 1.0 for full resolution
+        roi (tuple): Optional (x, y, width, height) region to restrict the diff to
+        progress_callback (callable): Called with the 'decode' stage position in frames
+        timings (dict): Optional dict that per-stage seconds are added to
+        sinks (list): Frame sinks fed every decoded frame, see _scan_scores;
+            they need the frames in order, so a scan with sinks runs serially
+        decoder (str): Frame source from decoders.DECODERS; the gray 'pyav' and
+            'ffmpeg' sources cannot seek, so they also run serially
+        decode_threads (int): Threads the decoder uses, None for its default
+        
+    Returns:
+        numpy.ndarray: float32 array with one score per decoded frame, 0 for the first
+    """
     cap = cv2.VideoCapture(video_path)
     frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
     
-    if frame_count <= 0:
-        return []
+    if not sinks and decoder == 'opencv' and _segment_count(frame_count, workers) > 1:
+        cap.release()
+        return _frame_scores_parallel(
+            video_path, workers, frame_count, scale, roi, progress_callback, timings
+        )
     
-    altered_frames = []
-    prev_frame = None
+    if decoder != 'opencv' or decode_threads:
+        cap.release()
+        cap = open_decoder(video_path, decoder, decode_threads)
+    scores = _scan_scores(cap, frame_count, scale, roi, progress_callback, timings, sinks)
+    cap.release()
+    return scores
+
+def threshold_frames(scores, threshold=0.05, first_index=0):
+    """
+    Turn a per-frame score series into a list of altered frame indices
+    
+    Args:
+        scores (numpy.ndarray): Per-frame change scores
+        threshold (float): Threshold for frame difference detection
+        first_index (int): Frame index of scores[0]
+        
+    Returns:
+        list: List of potentially altered frame indices
+    """
+    return (np.flatnonzero(np.asarray(scores) > threshold) + first_index).tolist()
+
+def save_frame_scores(scores, path):
+    """
+    Save a per-frame score series as a .npy file
+    
+    Args:
+        scores (numpy.ndarray): Per-frame change scores
+        path (str): Destination path, conventionally ending in .npy
+    """
+    np.save(path, np.asarray(scores, dtype=np.float32))
+
+def load_frame_scores(path, mmap=True):
+    """
+    Load a per-frame score series saved by save_frame_scores
+    
+    Args:
+        path (str): Path to the .npy file
+        mmap (bool): Memory-map the file instead of reading it into memory
+        
+    Returns:
+        numpy.ndarray: float32 array of per-frame change scores
+    """
+    return np.load(path, mmap_mode='r' if mmap else None)
+
+def analyze_frames_parallel(video_path, threshold=0.05, workers=None, frame_count=None,
+                            scale=1.0, roi=None):
+    """
+    Analyze frames across several processes, one frame-range segment each
+    
+    Every worker opens its own capture and seeks to the frame before its
+    segment, so the difference at each segment boundary is still computed
+    and the merged result matches the serial scan.
+    
+    Args:
+        video_path (str): Path to the video file
+        threshold (float): Threshold for frame difference detection
+        workers (int): Number of worker processes, None for one per CPU core
+        frame_count (int): Known frame count, probed from the file when None
+        scale (float): Resolution factor frames are diffed at, 1.0 for full resolution
+        roi (tuple): Optional (x, y, width, height) region to restrict the diff to
+        
+    Returns:
+        list: List of potentially altered frame indices
+    """
+    scores = _frame_scores_parallel(video_path, workers, frame_count, scale, roi)
+    return threshold_frames(scores, threshold)
+
+def _frame_scores_parallel(video_path, workers=None, frame_count=None, scale=1.0, roi=None,
+                           progress_callback=None, timings=None, seek_index=None, decode_threads=None,
+                           fingerprints=None):
+    """
+    Compute per-frame change scores with one process per frame-range segment
+    
+    Args:
+        video_path (str): Path to the video file
+        workers (int): Number of worker processes, None for one per CPU core
+        frame_count (int): Known frame count, probed from the file when None
+        scale (float): Resolution factor frames are diffed at
+        roi (tuple): Optional (x, y, width, height) region to restrict the diff to
+        progress_callback (callable): Called with the 'decode' stage position in
+            frames each time a segment finishes
+        timings (dict): Optional dict that per-stage seconds, summed over workers, are added to
+        seek_index (SeekIndex): Keyframe index of the video, built when None
+        decode_threads (int): Threads each worker's decoder uses, None for its default
+        fingerprints (numpy.ndarray): Optional uint64 array of frame_count entries that
+            receives the dHash of every full decoded frame
+        
+    Returns:
+        numpy.ndarray: float32 array with one score per decoded frame
+    """
+    if frame_count is None:
+        cap = cv2.VideoCapture(video_path)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+    
+    segment_count = _segment_count(frame_count, workers)
+    if segment_count <= 1:
+        cap = cv2.VideoCapture(video_path)
+        scores = _scan_scores(cap, frame_count, scale, roi, progress_callback, timings, fingerprints=fingerprints)
+        cap.release()
+        return scores
+    
+    if seek_index is None:
+        seek_index = build_seek_index(video_path)
+    bounds = _segment_bounds(frame_count, segment_count, seek_index)
+    
+    progress = _progress_reporter(progress_callback, 'decode', frame_count, 'frames')
+    with ProcessPoolExecutor(max_workers=len(bounds) - 1) as pool:
+        futures = [
+            pool.submit(_analyze_segment, video_path, int(start), int(stop), scale, roi, seek_index,
+                        decode_threads, fingerprints is not None)
+            for start, stop in zip(bounds[:-1], bounds[1:])
+        ]
+        # Segments are submitted in order, so concatenating keeps frames aligned.
+        # A short segment means decoding failed there, which also ends the serial scan.
+        segments = []
+        for future, start, stop in zip(futures, bounds[:-1], bounds[1:]):
+            segment, segment_fingerprints, segment_timings = future.result()
+            segments.append(segment)
+            if fingerprints is not None:
+                fingerprints[start:start + len(segment_fingerprints)] = segment_fingerprints
+            _add_timings(timings, segment_timings)
+            progress(int(stop), final=True)
+            if len(segment) < stop - start:
+                break
+    
+    return np.concatenate(segments)
+
+def _segment_bounds(frame_count, segment_count, seek_index):
+    """
+    Split a video into frame ranges whose workers can start at a keyframe
+    
+    Each interior boundary is moved back so that the frame before it, where
+    the worker starts decoding, is a keyframe. Boundaries without a keyframe
+    in reach are left where they are.
+    
+    Args:
+        frame_count (int): Total number of frames in the video
+        segment_count (int): Number of segments wanted
+        seek_index (SeekIndex): Keyframe index of the video
+        
+    Returns:
+        numpy.ndarray: Increasing boundaries, starting at 0 and ending at frame_count
+    """
+    bounds = np.linspace(0, frame_count, segment_count + 1).astype(int)
+    for i in range(1, segment_count):
+        keyframe = seek_index.keyframe_before(bounds[i] - 1)
+        if keyframe > bounds[i - 1]:
+            bounds[i] = keyframe + 1
+    return np.unique(bounds)
+
+def _segment_count(frame_count, workers):
+    """
+    Number of segments a parallel scan should use for a video
+    
+    Args:
+        frame_count (int): Total number of frames in the video
+        workers (int): Requested worker count, None for one per CPU core
+        
+    Returns:
+        int: Segment count, 1 meaning the serial path should be used
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    return max(1, min(workers, frame_count // MIN_SEGMENT_FRAMES))
+
+def _analyze_segment(video_path, start, stop, scale=1.0, roi=None, seek_index=None, decode_threads=None,
+                     fingerprint=False):
+    """
+    Worker entry point: score frames [start, stop) of a video
+    
+    Args:
+        video_path (str): Path to the video file
+        start (int): First frame whose difference should be evaluated
+        stop (int): Frame index at which the segment ends
+        scale (float): Resolution factor frames are diffed at
+        roi (tuple): Optional (x, y, width, height) region to restrict the diff to
+        seek_index (SeekIndex): Keyframe index used to position the capture
+        decode_threads (int): Threads the decoder uses, None for its default
+        fingerprint (bool): Also hash every frame of the segment
+        
+    Returns:
+        tuple: float32 scores of the frames within the segment, their uint64
+            fingerprints or None, and the per-stage timings
+    """
+    # Start one frame early so the boundary diff against start - 1 is not lost
+    first = max(0, start - 1)
+    timings = {}
+    fingerprints = np.zeros(stop - first, dtype=np.uint64) if fingerprint else None
+    cap = open_at(video_path, first, seek_index, decode_threads)
+    scores = _scan_scores(cap, stop - first, scale, roi, timings=timings, fingerprints=fingerprints)
+    cap.release()
+    if fingerprints is not None:
+        fingerprints = fingerprints[start - first:len(scores)]
+    return scores[start - first:], fingerprints, timings
+
+def _prepare_gray(frame, scale=1.0, roi=None, out=None, resized=None):
+    """
+    Crop, downscale and convert a decoded BGR frame to grayscale
+    
+    Args:
+        frame (numpy.ndarray): Decoded BGR frame, or a 2-D frame a gray decoder
+            already converted, which is only cropped and resized
+        scale (float): Resolution factor to resize to, 1.0 to keep full resolution
+        roi (tuple): Optional (x, y, width, height) region to crop to first
+        out (numpy.ndarray): Optional preallocated grayscale buffer to write into
+        resized (numpy.ndarray): Optional preallocated buffer for the downscaled colour frame
+        
+    Returns:
+        numpy.ndarray: Grayscale frame ready for differencing
+    """
+    if roi is not None:
+        x, y, w, h = roi
+        frame = frame[y:y + h, x:x + w]
+    
+    if frame.ndim == 2:
+        if scale != 1.0:
+            return cv2.resize(frame, None, dst=out, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+        if out is None:
+            return frame.copy()
+        np.copyto(out, frame)
+        return out
+    
+    if scale != 1.0:
+        # Shrinking the colour frame first keeps cvtColor off the full-size image.
+        # INTER_LINEAR is several times cheaper than INTER_AREA on 4K frames.
+        frame = cv2.resize(frame, None, dst=resized, fx=scale, fy=scale,
+                           interpolation=cv2.INTER_LINEAR)
+    
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=out)
+
+def _change_score(gray_frame, prev_frame, diff=None):
+    """
+    Fraction of pixels that changed noticeably between two grayscale frames
+    
+    Args:
+        gray_frame (numpy.ndarray): Current grayscale frame
+        prev_frame (numpy.ndarray): Previous grayscale frame
+        diff (numpy.ndarray): Optional preallocated scratch buffer of the same shape
+        
+    Returns:
+        float: Share of pixels whose intensity changed by more than 25 levels
+    """
+    diff = cv2.absdiff(gray_frame, prev_frame, dst=diff)
+    # Zeroing small differences in place and counting what is left avoids
+    # the temporary boolean mask that diff > 25 would allocate
+    cv2.threshold(diff, 25, 255, cv2.THRESH_TOZERO, dst=diff)
+    return cv2.countNonZero(diff) / diff.size
+
+def _add_timings(timings, extra):
+    """
+    Add per-stage seconds from extra into timings
+    
+    Args:
+        timings (dict): Accumulated seconds by stage name, may be None
+        extra (dict): Seconds by stage name to add
+    """
+    if timings is None:
+        return
+    for stage, seconds in extra.items():
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+def _scan_scores(cap, frame_count, scale=1.0, roi=None, progress_callback=None, timings=None,
+                 sinks=None, fingerprints=None):
+    """
+    Decode frames from an opened capture and score the change between neighbours
+    
+    Every buffer is allocated once, from the first frame: frames are decoded
+    into the same array, converted into two alternating grayscale slots and
+    diffed into one scratch array, so the loop allocates nothing per frame.
+    
+    Args:
+        cap (cv2.VideoCapture): Opened video capture, or a gray frame source from decoders.open_decoder
+        frame_count (int): Number of frames to read
+        scale (float): Resolution factor frames are diffed at
+        roi (tuple): Optional (x, y, width, height) region to restrict the diff to
+        progress_callback (callable): Called with the 'decode' stage position in frames
+            and the scores computed so far as 'partial_scores'
+        timings (dict): Optional dict that 'decode', 'color_convert', 'diff' and, with
+            fingerprints, 'fingerprint' seconds are added to
+        sinks (list): Objects whose update(index, frame, gray_frame, score) is called
+            for every decoded frame, in order, so extra outputs such as thumbnails
+            can be built without decoding the video again. The arrays passed
+            are reused for later frames, so sinks must copy what they keep.
+        fingerprints (numpy.ndarray): Optional uint64 array of frame_count entries that
+            receives the dHash of every full decoded frame, whatever the scale and roi
+        
+    Returns:
+        numpy.ndarray: float32 score per frame read, 0 for the first one
+    """
+    scores = np.zeros(max(0, frame_count), dtype=np.float32)
+    progress = _progress_reporter(progress_callback, 'decode', frame_count, 'frames')
+    clock = time.perf_counter
+    decode_seconds = convert_seconds = diff_seconds = fingerprint_seconds = 0.0
+    frame = gray_slots = resized = diff = None
+    read = 0
     
     for i in range(frame_count):
-        ret, frame = cap.read()
+        t0 = clock()
+        ret, frame = cap.read(frame)
+        t1 = clock()
+        decode_seconds += t1 - t0
         
         if not ret:
             break
-            
+        
+        if gray_slots is None:
+            # Size the reusable buffers from the first frame
+            gray_frame = _prepare_gray(frame, scale, roi)
+            gray_slots = np.empty((2,) + gray_frame.shape, dtype=np.uint8)
+            diff = np.empty(gray_frame.shape, dtype=np.uint8)
+            if scale != 1.0 and frame.ndim == 3:
+                resized = np.empty(gray_frame.shape + frame.shape[2:], dtype=np.uint8)
+        
         # Convert to grayscale for easier comparison
-        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        gray_frame = _prepare_gray(frame, scale, roi, out=gray_slots[i % 2], resized=resized)
+        t2 = clock()
+        convert_seconds += t2 - t1
+        
+        if i > 0:
+            # Calculate percentage of changed pixels against the previous frame
+            scores[i] = _change_score(gray_frame, gray_slots[(i - 1) % 2], diff)
+            diff_seconds += clock() - t2
+        
+        if fingerprints is not None:
+            t3 = clock()
+            fingerprints[i] = dhash(frame)
+            fingerprint_seconds += clock() - t3
+        
+        if sinks:
+            for sink in sinks:
+                sink.update(i, frame, gray_frame, scores[i])
+        
+        read = i + 1
+        progress(read, partial_scores=scores[:read])
+    
+    progress(read, final=True, partial_scores=scores[:read])
+    _add_timings(timings, {
+        'decode': decode_seconds,
+        'color_convert': convert_seconds,
+        'diff': diff_seconds,
+    })
+    if fingerprints is not None:
+        _add_timings(timings, {'fingerprint': fingerprint_seconds})
+    return scores[:read]
+
+def analyze_frame_scores_resumable(video_path, checkpoint_path, scale=1.0, roi=None, follow=False,
+                                   progress_callback=None, checkpoint_interval=CHECKPOINT_INTERVAL,
+                                   poll_interval=FOLLOW_POLL_SECONDS, idle_timeout=FOLLOW_IDLE_SECONDS):
+    """
+    Compute per-frame change scores, checkpointing so an interrupted scan can resume
+    
+    Scores are saved to the checkpoint every checkpoint_interval seconds.
+    A later call with the same checkpoint picks up after the last saved
+    frame: it seeks to the nearest keyframe, decodes forward to that frame
+    and checks its digest before carrying on, falling back to a decode from
+    the start and then to a fresh scan if the frame cannot be reproduced.
+    
+    With follow set the scan treats the end of the file as a pause rather
+    than the end of the video, for recordings that are still being written:
+    it waits for the file to grow, resumes from its own checkpoint and only
+    stops once the file has not grown for idle_timeout seconds. This needs a
+    container whose early frames are readable before it is finalised, such
+    as Matroska, MPEG-TS or fragmented MP4.
+    
+    Args:
+        video_path (str): Path to the video file
+        checkpoint_path (str): Path of the checkpoint state; scores are kept next to it
+        scale (float): Resolution factor frames are diffed at, 1.0 for full resolution
+        roi (tuple): Optional (x, y, width, height) region to restrict the diff to
+        follow (bool): Keep reading while the file grows
+        progress_callback (callable): Called with the 'decode' stage position in frames
+        checkpoint_interval (float): Seconds between checkpoints
+        poll_interval (float): Seconds between checks for new data when following
+        idle_timeout (float): Seconds without growth after which following stops
+        
+    Returns:
+        numpy.ndarray: float32 score per frame scored so far, 0 for the first
+    """
+    checkpoint = ScanCheckpoint(checkpoint_path, video_path, {'scale': scale, 'roi': roi})
+    done, digest = checkpoint.load()
+    progress = _progress_reporter(progress_callback, 'decode', 0, 'frames')
+    
+    while True:
+        cap, prev_gray = _resume_capture(video_path, done, digest, scale, roi)
+        if done > 0 and prev_gray is None:
+            # The last scored frame could not be decoded again, so the saved scores cannot be trusted
+            done, digest = checkpoint.reset()
+        done, digest = _scan_checkpointed(
+            cap, prev_gray, done, digest, checkpoint, scale, roi, progress, checkpoint_interval
+        )
+        cap.release()
+        if not follow or not _wait_for_growth(video_path, poll_interval, idle_timeout):
+            break
+    
+    progress(done, final=True)
+    return checkpoint.scores()[:done]
+
+def _resume_capture(video_path, done, digest, scale=1.0, roi=None):
+    """
+    Open a capture positioned after the last frame a checkpoint scored
+    
+    Args:
+        video_path (str): Path to the video file
+        done (int): Number of frames already scored
+        digest (str): frame_digest of frame done - 1
+        scale (float): Resolution factor frames are diffed at
+        roi (tuple): Optional (x, y, width, height) region to restrict the diff to
+        
+    Returns:
+        tuple: Capture whose next read is frame done, and the grayscale frame
+            done - 1 to diff it against; None instead of the frame when done is
+            0 or the frame did not match the digest, with the capture at frame 0
+    """
+    if done > 0:
+        # Jump to the nearest keyframe first, then fall back to decoding from the start
+        for seek_index in (build_seek_index(video_path), SeekIndex([0])):
+            cap = open_at(video_path, done - 1, seek_index)
+            ret, frame = cap.read()
+            if ret:
+                gray_frame = _prepare_gray(frame, scale, roi)
+                if frame_digest(gray_frame) == digest:
+                    return cap, gray_frame
+            cap.release()
+    return cv2.VideoCapture(video_path), None
+
+def _scan_checkpointed(cap, prev_gray, done, digest, checkpoint, scale, roi, progress, interval):
+    """
+    Score frames until the capture runs out, appending them to a checkpoint
+    
+    Args:
+        cap (cv2.VideoCapture): Capture positioned at frame done
+        prev_gray (numpy.ndarray): Grayscale frame done - 1, None when done is 0
+        done (int): Number of frames already scored
+        digest (str): frame_digest of frame done - 1
+        checkpoint (ScanCheckpoint): Where scores and progress are saved
+        scale (float): Resolution factor frames are diffed at
+        roi (tuple): Optional (x, y, width, height) region to restrict the diff to
+        progress (callable): Update function from _progress_reporter
+        interval (float): Seconds between checkpoints
+        
+    Returns:
+        tuple: Number of frames scored and the digest of the last one, both saved
+    """
+    clock = time.perf_counter
+    last_save = clock()
+    pending = []
+    frame = gray_slots = resized = diff = None
+    
+    while True:
+        ret, frame = cap.read(frame)
+        if not ret:
+            break
+        
+        if gray_slots is None:
+            gray_frame = _prepare_gray(frame, scale, roi)
+            gray_slots = np.empty((2,) + gray_frame.shape, dtype=np.uint8)
+            diff = np.empty(gray_frame.shape, dtype=np.uint8)
+            if scale != 1.0:
+                resized = np.empty(gray_frame.shape + frame.shape[2:], dtype=np.uint8)
+            if prev_gray is not None:
+                gray_slots[(done - 1) % 2] = prev_gray
+        
+        gray_frame = _prepare_gray(frame, scale, roi, out=gray_slots[done % 2], resized=resized)
+        pending.append(_change_score(gray_frame, gray_slots[(done - 1) % 2], diff) if done > 0 else 0.0)
+        done += 1
+        progress(done)
+        
+        if clock() - last_save >= interval:
+            digest = frame_digest(gray_frame)
+            checkpoint.append(pending)
+            checkpoint.save(done, digest)
+            pending = []
+            last_save = clock()
+    
+    if pending:
+        digest = frame_digest(gray_frame)
+        checkpoint.append(pending)
+    checkpoint.save(done, digest)
+    return done, digest
+
+def _wait_for_growth(video_path, poll_interval, idle_timeout):
+    """
+    Wait until a file grows
+    
+    Args:
+        video_path (str): Path to the file
+        poll_interval (float): Seconds between size checks
+        idle_timeout (float): Seconds to wait before giving up
+        
+    Returns:
+        bool: True if the file grew, False if it stayed the same for idle_timeout
+    """
+    size = os.path.getsize(video_path)
+    waited = 0.0
+    while waited < idle_timeout:
+        time.sleep(poll_interval)
+        waited += poll_interval
+        if os.path.getsize(video_path) != size:
+            return True
+    return False
+
+def analyze_video_resumable(video_path, checkpoint_path, threshold=0.05, scale=1.0, roi=None,
+                            follow=False, progress_callback=None):
+    """
+    Resumable counterpart of analyze_video for very long or still-growing recordings
+    
+    Frames are scored with analyze_frame_scores_resumable. Metadata and
+    digests are taken once the scan has finished, so a followed recording
+    is described as it was when it stopped growing.
+    
+    Args:
+        video_path (str): Path to the video file
+        checkpoint_path (str): Path of the checkpoint state; scores are kept next to it
+        threshold (float): Threshold for frame difference detection
+        scale (float): Resolution factor frames are diffed at, 1.0 for full resolution
+        roi (tuple): Optional (x, y, width, height) region to restrict the diff to
+        follow (bool): Keep reading while the file grows
+        progress_callback (callable): Receives 'decode' and then 'hash' progress
+        
+    Returns:
+        dict: Same structure as analyze_video
+    """
+    start = time.perf_counter()
+    timings = {}
+    frame_scores = analyze_frame_scores_resumable(
+        video_path, checkpoint_path, scale, roi, follow, progress_callback
+    )
+    timings['decode'] = time.perf_counter() - start
+    
+    metadata = extract_metadata(video_path)
+    result = calculate_hashes(video_path, progress_callback=progress_callback)
+    timings['hash'] = result['seconds']
+    timings['total'] = time.perf_counter() - start
+    
+    return {
+        'metadata': metadata,
+        'hash': result['digests']['md5'],
+        'hashes': result['digests'],
+        'hash_stats': {k: result[k] for k in ('bytes', 'seconds', 'mb_per_second')},
+        'altered_frames': threshold_frames(frame_scores, threshold),
+        'frame_scores': frame_scores,
+        'timings': timings,
+    }
+
+def build_report(analysis, filename, filesize, threshold=0.05, scale=1.0):
+    """
+    Assemble the forensic report for an analysed file
+    
+    Args:
+        analysis (dict): Result of analyze_video
+        filename (str): Name of the file shown in the report
+        filesize (int): Size of the file in bytes
+        threshold (float): Threshold the altered frames were detected with
+        scale (float): Resolution factor the frames were diffed at
+        
+    Returns:
+        dict: JSON-serialisable forensic report
+    """
+    return {
+        'filename': filename,
+        'filesize': filesize,
+        'metadata': analysis['metadata'],
+        'hash': analysis['hash'],
+        'hashes': analysis['hashes'],
+        'altered_frames': analysis['altered_frames'],
+        'threshold': threshold,
+        'analysis_scale': scale,
+        'timings': analysis.get('timings', {}),
+        'decoder': analysis.get('decoder', {}),
+        'detectors': analysis.get('detectors', {}),
+        'audio': analysis.get('audio', {}),
+        'repeated_segments': analysis.get('repeated_segments', []),
+        'analysis_timestamp': time.strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+def analyze_video(video_path, threshold=0.05, workers=1, scale=1.0, roi=None, hashes=None,
+                  progress_callback=None, sinks=None, seek_index=None, decoder='opencv',
+                  decode_threads=None, audio=False):
+    """
+    Run metadata extraction, hashing and frame analysis in a single pass
+    
+    The file is hashed on a background thread while the same capture that
+    provides the metadata decodes the frames, so both readers walk the file
+    at the same time and share the OS page cache instead of reading it from
+    disk once per step. The audio track is scored on another thread from a
+    second pipe of the ffmpeg process that decodes the frames, so the file
+    is still read once: with audio the frames always come from ffmpeg, in
+    a serial scan, as BGR unless the 'pyav' or 'ffmpeg' decoder asked for
+    gray. If that ffmpeg fails before its first frame the video is read
+    without it and the audio summary holds the error. Audio windows are placed on the frames by their presentation
+    timestamps and both streams' start times from the container.
+    
+    Args:
+        video_path (str): Path to the video file
+        threshold (float): Threshold for frame difference detection
+        workers (int): Number of frame analysis processes, None for one per CPU core
+        scale (float): Resolution factor frames are diffed at, 1.0 for full resolution
+        roi (tuple): Optional (x, y, width, height) region to restrict the diff to
+        hashes (dict): Digests of the file if already known, skips the hashing thread
+        progress_callback (callable): Receives 'decode' progress from the calling
+            thread and 'hash' progress from the hashing thread
+        sinks (list): Frame sinks fed every decoded frame; forces a serial scan
+        seek_index (SeekIndex): Keyframe index used to place parallel segments
+        decoder (str): Frame source from decoders.DECODERS; 'pyav' and 'ffmpeg'
+            decode straight to gray, force a serial scan and hand sinks gray frames
+        decode_threads (int): Threads the decoder uses, per worker in a parallel scan,
+            None for its default
+        audio (bool): Also score the audio track for splices and level jumps
+        
+    Returns:
+        dict: Dictionary with 'metadata', 'hash' (MD5), 'hashes', 'hash_stats',
+            'timings', 'decoder' (name actually used, threads, and the seconds its frames/sec
+            are measured over: decode time in a serial scan, wall-clock scan time in a
+            parallel one), 'altered_frames'
+            and the float32 'frame_scores' array the altered frames were thresholded from,
+            the uint64 dHash 'fingerprints' of the full frames and the 'repeated_segments'
+            they show. With audio there is also an 'audio' summary, which holds an 'error'
+            when the track could not be scored, such as when there is none, and
+            with a scored track the per-frame 'audio_scores' arrays
+    """
+    start = time.perf_counter()
+    result = {'digests': hashes}
+    audio_result = {}
+    timings = {}
+    
+    def _hash_worker():
+        try:
+            result.update(calculate_hashes(video_path, progress_callback=progress_callback))
+        except Exception as e:
+            result['error'] = e
+    
+    def _audio_worker(stream):
+        audio_start = time.perf_counter()
+        try:
+            audio_result.update(scan_audio(stream))
+        except Exception as e:
+            audio_result['error'] = e
+            # The frames come from the same ffmpeg, which stops on a broken audio pipe
+            while stream.read(DRAIN_BLOCK_SIZE):
+                pass
+        finally:
+            stream.close()
+        audio_result['seconds'] = time.perf_counter() - audio_start
+    
+    def _start_audio(stream):
+        thread = threading.Thread(target=_audio_worker, args=(stream,), daemon=True)
+        thread.start()
+        audio_threads.append(thread)
+    
+    hasher = threading.Thread(target=_hash_worker, daemon=True)
+    if hashes is None:
+        hasher.start()
+    
+    audio_threads = []
+    audio_summary = None
+    container = None
+    fingerprints = np.zeros(0, dtype=np.uint64)
+    used_decoder = decoder
+    decode_seconds = None
+    cap = cv2.VideoCapture(video_path)
+    if cap.isOpened():
+        metadata = _read_metadata(cap)
+        container = _add_container_metadata(video_path, metadata)
+        
+        share_audio = False
+        if audio:
+            try:
+                share_audio = has_audio_stream(video_path)
+                if not share_audio:
+                    audio_summary = {'error': "no audio stream"}
+            except ValueError as e:
+                audio_summary = {'error': str(e)}
+        
+        # Hashed from the full frames, so archive matches do not depend on the scale or roi of the diff
+        fingerprints = np.zeros(max(0, metadata['frame_count']), dtype=np.uint64)
+        if not sinks and not share_audio and decoder == 'opencv' and \
+                _segment_count(metadata['frame_count'], workers) > 1:
+            scan_start = time.perf_counter()
+            frame_scores = _frame_scores_parallel(
+                video_path, workers, metadata['frame_count'], scale, roi,
+                progress_callback, timings, seek_index, decode_threads, fingerprints
+            )
+            # Workers decode at the same time, so their summed decode seconds overstate the time taken
+            decode_seconds = time.perf_counter() - scan_start
+        else:
+            if share_audio or decoder != 'opencv' or decode_threads:
+                # Metadata came from the default capture; frames come from the requested source
+                cap.release()
+                if share_audio:
+                    used_decoder = 'ffmpeg'
+                    cap = open_decoder(video_path, 'ffmpeg', decode_threads, audio_output=audio_output_args(),
+                                       color=decoder == 'opencv')
+                    if cap.audio is not None:
+                        _start_audio(cap.audio)
+                    else:
+                        audio_summary = {'error': "ffmpeg could not be started on the video"}
+                else:
+                    cap = open_decoder(video_path, decoder, decode_threads)
+            try:
+                frame_scores = _scan_scores(
+                    cap, metadata['frame_count'], scale, roi, progress_callback, timings, sinks, fingerprints
+                )
+            except ValueError as e:
+                # ffmpeg that cannot read the file at all, such as an old or limited build, costs only the audio
+                if not share_audio or cap.frames_read:
+                    raise
+                cap.release()
+                audio_summary = {'error': str(e)}
+                used_decoder = 'opencv' if decoder == 'ffmpeg' else decoder
+                cap = open_decoder(video_path, used_decoder, decode_threads)
+                frame_scores = _scan_scores(
+                    cap, metadata['frame_count'], scale, roi, progress_callback, timings, sinks, fingerprints
+                )
+            decode_seconds = timings.get('decode')
+    else:
+        metadata = {"error": "Failed to open video file"}
+        frame_scores = np.zeros(0, dtype=np.float32)
+        audio_summary = {'error': "video could not be opened"}
+    # A decoder sharing its process with the audio reads to the end before stopping, completing the track
+    cap.release()
+    
+    for thread in audio_threads:
+        thread.join()
+    if hashes is None:
+        hasher.join()
+    if 'error' in result:
+        raise result['error']
+    if 'error' in audio_result and audio_summary is None:
+        # The frame scores stand on their own; a track that fails to score only loses its section
+        audio_summary = {'error': str(audio_result['error']) or type(audio_result['error']).__name__}
+    
+    audio_scores = None
+    if audio_threads and audio_summary is None:
+        fps = metadata['fps']
+        frame_times = frame_audio_times(len(frame_scores), fps, container)
+        audio_scores = align_audio_scores(audio_result, frame_times)
+        audio_summary = summarize_audio(audio_result, audio_scores, fps, len(frame_scores), frame_times=frame_times)
+        timings['audio'] = audio_result['seconds']
+    fingerprints = fingerprints[:len(frame_scores)]
+    if 'seconds' in result:
+        timings['hash'] = result['seconds']
+    timings['total'] = time.perf_counter() - start
+    
+    analysis = {
+        'metadata': metadata,
+        'hash': result['digests']['md5'],
+        'hashes': result['digests'],
+        'hash_stats': {k: result[k] for k in ('bytes', 'seconds', 'mb_per_second') if k in result},
+        'altered_frames': threshold_frames(frame_scores, threshold),
+        'frame_scores': frame_scores,
+        'fingerprints': fingerprints,
+        'repeated_segments': find_repeated_segments(fingerprints),
+        'timings': timings,
+        'decoder': {
+            'name': used_decoder,
+            'threads': decode_threads,
+            'seconds': decode_seconds,
+            'frames_per_second': len(frame_scores) / decode_seconds if decode_seconds else None,
+        },
+    }
+    if audio:
+        analysis['audio'] = audio_summary
+    if audio_scores is not None:
+        analysis['audio_scores'] = audio_scores
+    return analysis
+
+def compare_downscaled(video_path, threshold=0.05, scale=0.25, roi=None):
+    """
+    Measure how closely a downscaled scan agrees with a full-resolution scan
+    
+    Both scans are computed from the same decoded frames, so the comparison
+    costs a single decode of the clip. The ROI crops both scans, so the
+    result measures the cost of downscaling alone.
+    
+    Args:
+        video_path (str): Path to the video file
+        threshold (float): Threshold for frame difference detection
+        scale (float): Resolution factor of the reduced scan
+        roi (tuple): Optional (x, y, width, height) region both scans are cropped to
+        
+    Returns:
+        dict: Altered frames of both scans, their agreement and diff-stage timings
+    """
+    cap = cv2.VideoCapture(video_path)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    
+    full_frames, reduced_frames = [], []
+    full_seconds = reduced_seconds = 0.0
+    prev_full = prev_reduced = None
+    
+    for i in range(frame_count):
+        ret, frame = cap.read()
+        if not ret:
+            break
         
-        if prev_frame is not None:
-            # Calculate difference between current and previous frame
-            diff = cv2.absdiff(gray_frame, prev_frame)
-            
-            # Calculate percentage of changed pixels
-            change_percentage = np.count_nonzero(diff > 25) / diff.size
-            
-            # Detect sudden changes that could indicate tampering
-            if change_percentage > threshold:
-                altered_frames.append(i)
+        start = time.perf_counter()
+        gray_full = _prepare_gray(frame, roi=roi)
+        if prev_full is not None and _change_score(gray_full, prev_full) > threshold:
+            full_frames.append(i)
+        full_seconds += time.perf_counter() - start
         
-        prev_frame = gray_frame
+        start = time.perf_counter()
+        gray_reduced = _prepare_gray(frame, scale, roi)
+        if prev_reduced is not None and _change_score(gray_reduced, prev_reduced) > threshold:
+            reduced_frames.append(i)
+        reduced_seconds += time.perf_counter() - start
         
+        prev_full, prev_reduced = gray_full, gray_reduced
+    
     cap.release()
-    return altered_frames
+    
+    full_set, reduced_set = set(full_frames), set(reduced_frames)
+    matched = full_set & reduced_set
+    union = full_set | reduced_set
+    
+    return {
+        'scale': scale,
+        'roi': list(roi) if roi is not None else None,
+        'full_resolution_frames': full_frames,
+        'downscaled_frames': reduced_frames,
+        'missed_frames': sorted(full_set - reduced_set),
+        'extra_frames': sorted(reduced_set - full_set),
+        'precision': len(matched) / len(reduced_set) if reduced_set else 1.0,
+        'recall': len(matched) / len(full_set) if full_set else 1.0,
+        'agreement': len(matched) / len(union) if union else 1.0,
+        'full_resolution_seconds': full_seconds,
+        'downscaled_seconds': reduced_seconds,
+        'speedup': full_seconds / reduced_seconds if reduced_seconds > 0 else None,
+    }
+
+def coarse_to_fine_scan(video_path, threshold=0.05, step=10, coarse_scale=0.25,
+                        coarse_threshold=None, seek_index=None):
+    """
+    Two-stage scan: sample keyframes cheaply, then rescan suspicious windows
+    
+    The coarse pass decodes only keyframes, with PyAV told to skip every
+    other frame, and diffs consecutive ones at least step frames apart at
+    coarse_scale. Without PyAV it seeks from keyframe to keyframe, and
+    without a keyframe index (only frame 0 known) it falls back to every
+    step-th frame, which decodes the whole video.
+    Every gap between two samples whose score exceeds coarse_threshold
+    becomes a window that the fine pass rescans at full resolution, so
+    altered_frames inside those windows are exactly what analyze_frames
+    reports for them.
+    
+    Args:
+        video_path (str): Path to the video file
+        threshold (float): Threshold for frame difference detection in the fine pass
+        step (int): Smallest distance between sampled frames in the coarse pass
+        coarse_scale (float): Resolution factor of the coarse pass
+        coarse_threshold (float): Change score that marks a gap as suspicious,
+            defaults to threshold
+        seek_index (SeekIndex): Keyframe index of the video, built when None
+        
+    Returns:
+        dict: Altered frames, rescanned windows, how many frames each pass touched
+            and the coarse 'sampling' used ('keyframes' or 'stride')
+    """
+    if coarse_threshold is None:
+        coarse_threshold = threshold
+    step = max(1, int(step))
+    if seek_index is None:
+        seek_index = build_seek_index(video_path)
+    
+    cap = cv2.VideoCapture(video_path)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    samples, sampling = _coarse_samples(seek_index, frame_count, step)
+    
+    # Coarse pass: diff sampled frames and collect [first, last] windows of evaluated frames
+    windows = []
+    prev_sample = None
+    prev_index = 0
+    sampled = 0
+    for i, frame in _read_samples(video_path, samples, seek_index):
+        sampled += 1
+        
+        gray_frame = _prepare_gray(frame, coarse_scale)
+        if prev_sample is not None and _change_score(gray_frame, prev_sample) > coarse_threshold:
+            if windows and windows[-1][1] == prev_index:
+                windows[-1][1] = i
+            else:
+                windows.append([prev_index + 1, i])
+        prev_sample = gray_frame
+        prev_index = i
+    
+    # Fine pass: full-resolution scan of each window, starting one frame early
+    altered_frames = []
+    rescanned = 0
+    for first, last in windows:
+        cap = open_at(video_path, first - 1, seek_index)
+        scores = _scan_scores(cap, last - first + 2)
+        altered_frames.extend(threshold_frames(scores[1:], threshold, first_index=first))
+        cap.release()
+        rescanned += last - first + 2
+    
+    return {
+        'altered_frames': altered_frames,
+        'windows': windows,
+        'frame_count': frame_count,
+        'frames_sampled': sampled,
+        'frames_rescanned': rescanned,
+        'sampling': sampling,
+    }
+
+def _coarse_samples(seek_index, frame_count, step):
+    """
+    Frames the coarse pass samples: keyframes at least step apart, and the last frame
+    
+    Returns:
+        tuple: (sorted frame numbers, 'keyframes' or 'stride')
+    """
+    if frame_count <= 0:
+        return [], 'stride'
+    keyframes = seek_index.keyframes[seek_index.keyframes < frame_count]
+    if len(keyframes) > 1:
+        samples = []
+        for keyframe in keyframes.tolist():
+            if not samples or keyframe - samples[-1] >= step:
+                samples.append(keyframe)
+        sampling = 'keyframes'
+    else:
+        samples = list(range(0, frame_count, step))
+        sampling = 'stride'
+    if samples[-1] != frame_count - 1:
+        samples.append(frame_count - 1)
+    return samples, sampling
+
+def _read_samples(video_path, samples, seek_index):
+    """
+    Yield (frame number, frame) for sorted sample frames, decoding as few others as possible
+    
+    Keyframe samples come from a keyframe-only decode when PyAV can open
+    the video; whatever it does not deliver, such as the last frame, is
+    read with OpenCV.
+    """
+    keyframes = set(seek_index.keyframes.tolist())
+    if len(keyframes) > 1 and seek_index.timestamps_ms is not None:
+        wanted = set(samples) & keyframes
+        delivered = -1
+        try:
+            for index, frame in _keyframe_samples(video_path, seek_index):
+                if index in wanted and index > delivered:
+                    delivered = index
+                    yield index, frame
+        except ValueError:
+            pass
+        samples = [index for index in samples if index > delivered]
+    yield from _seek_samples(video_path, samples, seek_index)
+
+def _keyframe_samples(video_path, seek_index):
+    """
+    Yield (frame number, BGR frame) of the keyframes, matched to frames by presentation time
+    
+    Raises:
+        ValueError: If PyAV is not installed or cannot open the video
+    """
+    timestamps_ms = seek_index.timestamps_ms
+    # Half the shortest frame interval tells a keyframe's own timestamp from its neighbours'
+    tolerance = max(np.diff(timestamps_ms).min() / 2, 0.5) if len(timestamps_ms) > 1 else 0.5
+    for seconds, frame in iter_keyframes(video_path):
+        pts_ms = seconds * 1000.0
+        index = int(np.searchsorted(timestamps_ms, pts_ms - tolerance))
+        if index < len(timestamps_ms) and abs(timestamps_ms[index] - pts_ms) <= tolerance:
+            yield index, frame
+
+def _seek_samples(video_path, samples, seek_index):
+    """
+    Yield (frame number, BGR frame) for sorted sample frames with OpenCV
+    
+    Each sample is reached with an exact seek to the nearest keyframe before
+    it, when that is ahead of the current position, and by grabbing forward
+    from there. Once the backend has failed to seek exactly, every sample is
+    reached by grabbing forward, which decodes the frames in between.
+    """
+    cap = cv2.VideoCapture(video_path)
+    position = 0
+    seekable = True
+    try:
+        for index in samples:
+            keyframe = seek_index.keyframe_before(index)
+            if keyframe > position and seekable:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+                if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == keyframe:
+                    position = keyframe
+                else:
+                    # Position unknown after an inexact seek: start over and grab from now on
+                    cap.release()
+                    cap = cv2.VideoCapture(video_path)
+                    position = 0
+                    seekable = False
+            while position < index:
+                if not cap.grab():
+                    return
+                position += 1
+            ret, frame = cap.read()
+            if not ret:
+                return
+            position += 1
+            yield index, frame
+    finally:
+        cap.release()
@@ -0,0 +1,405 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from utils import (
+    analyze_video, analyze_video_resumable, build_report, load_frame_scores, save_frame_scores,
+    threshold_frames
+)
+from cache import AnalysisCache, analyze_video_cached
+from detectors import DETECTORS, DetectorSet, attach_detector_results, create_detectors
+from fingerprints import load_fingerprints, save_fingerprints
+from fingerprint_index import FingerprintIndex
+from decoders import DECODERS, available_decoders, find_ffmpeg
+from checkpoint import remove_checkpoint
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+
+def find_videos(inputs, recursive=False, extensions=VIDEO_EXTENSIONS):
+    """
+    Expand files, directories and glob patterns into a sorted list of video paths
+
+    Args:
+        inputs (list): Paths to files or directories, or glob patterns
+        recursive (bool): Descend into subdirectories of directory inputs
+        extensions (tuple): Lower-case file extensions treated as videos
+
+    Returns:
+        list: Absolute paths of the matching video files, without duplicates
+    """
+    videos = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            if recursive:
+                candidates = glob.glob(os.path.join(pattern, '**', '*'), recursive=True)
+            else:
+                candidates = glob.glob(os.path.join(pattern, '*'))
+        else:
+            candidates = glob.glob(pattern, recursive=True) or [pattern]
+
+        for path in candidates:
+            if os.path.isfile(path) and os.path.splitext(path)[1].lower() in extensions:
+                videos.add(os.path.abspath(path))
+
+    return sorted(videos)
+
+def report_name(video_path):
+    """
+    Name of the report file for a video, unique even for equal basenames
+
+    Args:
+        video_path (str): Absolute path to the video file
+
+    Returns:
+        str: Report file name without directory
+    """
+    path_id = hashlib.sha1(video_path.encode()).hexdigest()[:10]
+    return f"{os.path.basename(video_path)}.{path_id}.json"
+
+def load_existing_report(report_path, video_path, threshold, scale, detectors=(), decoder='opencv',
+                         audio=False):
+    """
+    Load a report from an earlier run if it is still valid for the video
+
+    A report made with a different threshold is re-thresholded from its saved
+    score array and rewritten, so changing the sensitivity does not force the
+    batch to decode everything again.
+
+    Args:
+        report_path (str): Path of the JSON report
+        video_path (str): Path of the video it describes
+        threshold (float): Threshold the report should reflect
+        scale (float): Resolution factor the report must have been made with
+        detectors (list): Detector names whose results the report must include
+        decoder (str): Decoder the report must have been made with
+        audio (bool): Whether the report must include the audio analysis
+
+    Returns:
+        dict: The report, or None when it is missing, stale, made at another
+            scale or with another decoder, or lacking a requested detector or audio
+    """
+    try:
+        with open(report_path) as f:
+            report = json.load(f)
+        stat = os.stat(video_path)
+    except (OSError, ValueError):
+        return None
+    if report.get('filesize') != stat.st_size or report.get('source_mtime') != stat.st_mtime:
+        return None
+    if report.get('analysis_scale') != scale:
+        return None
+    if not set(detectors) <= set(report.get('detectors', {})):
+        return None
+    if audio and not report.get('audio'):
+        return None
+    used_decoder = report.get('decoder', {}).get('name', 'opencv')
+    # With audio the frames come from ffmpeg as BGR, which scores like the default OpenCV capture
+    if used_decoder != decoder and not (audio and decoder == 'opencv' and used_decoder == 'ffmpeg'):
+        return None
+
+    if report.get('threshold') != threshold:
+        scores_path = os.path.join(os.path.dirname(report_path), report.get('frame_scores_file', ''))
+        try:
+            scores = load_frame_scores(scores_path)
+        except (OSError, ValueError):
+            return None
+        report['altered_frames'] = threshold_frames(scores, threshold)
+        report['threshold'] = threshold
+        _write_json(report_path, report)
+
+    return report
+
+def summarize_report(report):
+    """
+    Condense a per-file report into its entry in the batch index
+
+    Args:
+        report (dict): Forensic report of one video
+
+    Returns:
+        dict: Status, hash and number of altered frames
+    """
+    error = report['metadata'].get('error')
+    return {
+        'status': 'error' if error else 'ok',
+        'error': error,
+        'hash': report['hash'],
+        'altered_frame_count': len(report['altered_frames']),
+    }
+
+def _write_json(path, data):
+    """
+    Write JSON atomically so an interrupted run never leaves a truncated file
+
+    Args:
+        path (str): Destination path
+        data: JSON-serialisable object
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp_path, path)
+
+def _analyze_file(video_path, report_path, threshold, scale, cache_dir, detectors=(), decoder='opencv',
+                  decode_threads=None, resumable=False, follow=False, audio=False):
+    """
+    Worker entry point: analyse one video and write its report and score array
+
+    Args:
+        video_path (str): Path to the video file
+        report_path (str): Where to write the JSON report
+        threshold (float): Threshold for frame difference detection
+        scale (float): Resolution factor frames are diffed at
+        cache_dir (str): Analysis cache directory, None to disable caching
+        detectors (list): Names of extra detectors to run on the same decode pass
+        decoder (str): Frame source from decoders.DECODERS
+        decode_threads (int): Threads the decoder uses, None for its default
+        resumable (bool): Checkpoint the frame scan next to the report so an
+            interrupted run picks up where it stopped
+        follow (bool): Keep reading a file that is still being written; implies resumable
+        audio (bool): Score the audio track alongside the frames
+
+    Returns:
+        dict: Summary entry for the batch index
+    """
+    start = time.perf_counter()
+
+    if resumable or follow:
+        checkpoint_path = os.path.splitext(report_path)[0] + '.checkpoint.json'
+        analysis = analyze_video_resumable(video_path, checkpoint_path, threshold, scale, follow=follow)
+    elif cache_dir is not None:
+        analysis = analyze_video_cached(
+            AnalysisCache(cache_dir), video_path, threshold, scale=scale, detectors=list(detectors),
+            decoder=decoder, decode_threads=decode_threads, audio=audio,
+        )
+    else:
+        detector_set = DetectorSet(create_detectors(detectors)) if detectors else None
+        analysis = analyze_video(
+            video_path, threshold, scale=scale, sinks=[detector_set] if detector_set else None,
+            decoder=decoder, decode_threads=decode_threads, audio=audio,
+        )
+        if detector_set is not None:
+            attach_detector_results(analysis, detector_set.detectors)
+
+    # Taken after the scan, which a followed recording may have kept growing through
+    stat = os.stat(video_path)
+    report = build_report(analysis, os.path.basename(video_path), stat.st_size, threshold, scale)
+    report['source_path'] = video_path
+    report['source_mtime'] = stat.st_mtime
+
+    # Scores go next to the report so it can be re-thresholded without decoding again
+    scores_path = os.path.splitext(report_path)[0] + '.scores.npy'
+    save_frame_scores(analysis['frame_scores'], scores_path)
+    report['frame_scores_file'] = os.path.basename(scores_path)
+    if 'fingerprints' in analysis:
+        fingerprints_path = os.path.splitext(report_path)[0] + '.fingerprints.npy'
+        save_fingerprints(analysis['fingerprints'], fingerprints_path)
+        report['fingerprints_file'] = os.path.basename(fingerprints_path)
+    _write_json(report_path, report)
+    if resumable and not follow:
+        # The saved score array supersedes the checkpoint; a followed file keeps it to pick up later growth
+        remove_checkpoint(checkpoint_path)
+
+    summary = summarize_report(report)
+    summary['seconds'] = time.perf_counter() - start
+    return summary
+
+def _check_archive(index, report_path, report):
+    """
+    Search the fingerprint archive for footage shared with a reported video, then add it
+
+    The report is rewritten with the matches under 'archive_matches'. Videos
+    already in the archive are not searched again.
+
+    Args:
+        index (FingerprintIndex): Archive of earlier videos
+        report_path (str): Path of the JSON report
+        report (dict): The report
+
+    Returns:
+        int: Number of archived videos sharing footage, None if the report has no fingerprints
+    """
+    fingerprints_file = report.get('fingerprints_file')
+    if fingerprints_file is None:
+        return None
+    if report['hash'] in index:
+        return len(report.get('archive_matches', []))
+
+    fingerprints = load_fingerprints(os.path.join(os.path.dirname(report_path), fingerprints_file))
+    report['archive_matches'] = index.search(fingerprints, exclude=report['hash'])
+    index.add(report['hash'], fingerprints, {'filename': report['filename'], 'path': report.get('source_path')})
+    _write_json(report_path, report)
+    return len(report['archive_matches'])
+
+def run_batch(videos, output_dir, workers=None, threshold=0.05, scale=1.0, cache_dir=None,
+              resume=True, detectors=(), index_dir=None, decoder='opencv', decode_threads=None,
+              resumable=False, follow=False, audio=False, log=sys.stderr):
+    """
+    Analyse many videos on a bounded process pool and write a summary index
+
+    Args:
+        videos (list): Paths of the videos to analyse
+        output_dir (str): Directory for the per-file reports and index.json
+        workers (int): Number of worker processes, None for one per CPU core
+        threshold (float): Threshold for frame difference detection
+        scale (float): Resolution factor frames are diffed at
+        cache_dir (str): Analysis cache directory, None to disable caching
+        resume (bool): Reuse reports from an earlier run that are still valid
+        detectors (list): Names of extra detectors to run on the same decode pass
+        index_dir (str): Fingerprint archive every video is checked against and
+            added to, None to skip
+        decoder (str): Frame source from decoders.DECODERS
+        decode_threads (int): Threads each file's decoder uses, None for its default
+        resumable (bool): Checkpoint every frame scan so a killed batch resumes mid-file;
+            runs without the cache, detectors or the fingerprint archive
+        follow (bool): Keep reading files that are still being written; implies resumable
+        audio (bool): Score every video's audio track alongside its frames
+        log: Stream progress lines are written to
+
+    Returns:
+        dict: The summary index that was written to index.json
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    index_path = os.path.join(output_dir, 'index.json')
+    archive = None
+    if index_dir is not None:
+        archive = FingerprintIndex(index_dir)
+
+    entries = {}
+    pending = []
+    for video_path in videos:
+        report_path = os.path.join(output_dir, report_name(video_path))
+        entry = {'path': video_path, 'report': os.path.basename(report_path)}
+        existing = load_existing_report(report_path, video_path, threshold, scale, detectors, decoder, audio) \
+            if resume else None
+        if existing is not None and archive is not None and 'fingerprints_file' not in existing:
+            # Made before every scan kept fingerprints; the archive check needs them
+            existing = None
+        if existing is not None:
+            entry.update(summarize_report(existing), resumed=True)
+            if archive is not None:
+                entry['archive_matches'] = _check_archive(archive, report_path, existing)
+        else:
+            pending.append((video_path, report_path))
+        entries[video_path] = entry
+
+    def write_index():
+        _write_json(index_path, {
+            'generated': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'threshold': threshold,
+            'analysis_scale': scale,
+            'files': list(entries.values()),
+        })
+
+    print(f"{len(videos)} videos found, {len(pending)} to analyse", file=log)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(_analyze_file, video_path, report_path, threshold, scale, cache_dir,
+                        detectors, decoder, decode_threads, resumable, follow, audio): video_path
+            for video_path, report_path in pending
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            video_path = futures[future]
+            try:
+                entries[video_path].update(future.result())
+                if archive is not None and entries[video_path]['status'] == 'ok':
+                    # The archive is only written from this process, so workers never contend for it
+                    report_path = os.path.join(output_dir, entries[video_path]['report'])
+                    with open(report_path) as f:
+                        report = json.load(f)
+                    entries[video_path]['archive_matches'] = _check_archive(archive, report_path, report)
+            except Exception as e:
+                entries[video_path].update(status='error', error=str(e))
+
+            entry = entries[video_path]
+            detail = entry['error'] if entry['status'] == 'error' else \
+                f"{entry['altered_frame_count']} altered frames"
+            if entry.get('archive_matches'):
+                detail += f", footage shared with {entry['archive_matches']} archived videos"
+            print(f"[{done}/{len(pending)}] {video_path}: {detail}", file=log)
+
+            # Keep the index current so an interrupted batch still shows its progress
+            write_index()
+
+    write_index()
+    with open(index_path) as f:
+        return json.load(f)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="VidGuard batch analysis: write a forensic report for every video found."
+    )
+    parser.add_argument('inputs', nargs='+', help="video files, directories or glob patterns")
+    parser.add_argument('-o', '--output', default='output', help="report directory (default: output)")
+    parser.add_argument('-r', '--recursive', action='store_true', help="descend into subdirectories")
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help="number of files analysed at once (default: one per CPU core)")
+    parser.add_argument('-t', '--threshold', type=float, default=0.05,
+                        help="share of changed pixels that flags a frame (default: 0.05)")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="resolution factor frames are diffed at (default: 1.0)")
+    parser.add_argument('--cache-dir', default=None, help="reuse results from an analysis cache")
+    parser.add_argument('--detectors', default='',
+                        help="comma-separated extra detectors to run, or 'all' "
+                             f"(available: {', '.join(DETECTORS)})")
+    parser.add_argument('--decoder', default='opencv', choices=DECODERS,
+                        help="frame source: OpenCV (default), or PyAV or an ffmpeg pipe decoding straight to gray")
+    parser.add_argument('--decode-threads', type=int, default=None,
+                        help="threads each decoder uses (default: the decoder's choice)")
+    parser.add_argument('--resumable', action='store_true',
+                        help="checkpoint each frame scan so a killed run resumes where it stopped")
+    parser.add_argument('--follow', action='store_true',
+                        help="keep reading files that are still being written, e.g. live DVR exports")
+    parser.add_argument('--audio', action='store_true',
+                        help="also score the audio track for splices and level jumps (needs ffmpeg)")
+    parser.add_argument('--index', default=None,
+                        help="fingerprint archive to check every video against and add it to")
+    parser.add_argument('--force', action='store_true',
+                        help="re-analyse files that already have an up-to-date report")
+    args = parser.parse_args(argv)
+
+    videos = find_videos(args.inputs, args.recursive)
+    if not videos:
+        parser.error("no video files matched the given inputs")
+
+    detectors = list(DETECTORS) if args.detectors == 'all' else \
+        [name for name in args.detectors.split(',') if name]
+    unknown = [name for name in detectors if name not in DETECTORS]
+    if unknown:
+        parser.error(f"unknown detectors: {', '.join(unknown)}")
+    if args.decoder not in available_decoders():
+        parser.error(f"the {args.decoder} decoder is not available here")
+    if args.audio and find_ffmpeg() is None:
+        parser.error("--audio needs an ffmpeg executable")
+    if (args.resumable or args.follow) and (detectors or args.index or args.cache_dir
+                                            or args.decoder != 'opencv' or args.audio):
+        parser.error("--resumable and --follow cannot be combined with --detectors, --index, "
+                     "--cache-dir, --decoder or --audio")
+
+    index = run_batch(
+        videos,
+        args.output,
+        workers=args.workers,
+        threshold=args.threshold,
+        scale=args.scale,
+        cache_dir=args.cache_dir,
+        resume=not args.force,
+        detectors=detectors,
+        index_dir=args.index,
+        decoder=args.decoder,
+        decode_threads=args.decode_threads,
+        resumable=args.resumable,
+        follow=args.follow,
+        audio=args.audio,
+    )
+    failed = [entry for entry in index['files'] if entry.get('status') == 'error']
+    print(f"Reports saved to {args.output} ({len(failed)} failed)")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
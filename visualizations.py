@@ -4,6 +4,18 @@ import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
 
+# Each pyramid level merges this many buckets of the level below
+PYRAMID_FACTOR = 4
+
+# Timeline charts draw at most this many buckets, picking the finest level that fits the window
+MAX_TIMELINE_POINTS = 2000
+
+# Altered frames are counted in at most this many bins along the timeline
+MAX_HISTOGRAM_BINS = 200
+
+# Altered frames closer together than this belong to the same cluster
+CLUSTER_GAP = 5
+
 def display_metadata_chart(metadata):
     """
     Create a bar chart to visualize video metadata
@@ -56,57 +68,145 @@ def display_metadata_chart(metadata):
         for metric, value in large_metrics.items():
             st.markdown(f"- **{metric}**: {value:,}")
 
+class ScorePyramid:
+    """
+    Min/max/mean summaries of a per-frame score series at successively coarser resolutions
+
+    Level 0 is the scores themselves and every further level merges
+    PYRAMID_FACTOR buckets of the level below. A window of the timeline is
+    drawn from the finest level with at most MAX_TIMELINE_POINTS buckets in
+    it, so the cost of a chart depends on the points drawn, not on the
+    number of frames: zooming in picks finer levels, down to single frames.
+    """
+
+    def __init__(self, scores, factor=PYRAMID_FACTOR):
+        """
+        Args:
+            scores (array-like): Change score per frame
+            factor (int): Buckets of one level merged into one bucket of the next
+        """
+        scores = np.asarray(scores, dtype=np.float32)
+        self.frame_count = len(scores)
+        self.factor = factor
+        self.levels = [(scores, scores, scores)]
+
+        # Means are carried as float64 sums so rounding does not build up across levels
+        sums = scores.astype(np.float64)
+        bucket = 1
+        while len(sums) > 1:
+            lows, highs, _ = self.levels[-1]
+            starts = np.arange(0, len(sums), factor)
+            bucket *= factor
+            sums = np.add.reduceat(sums, starts)
+            # Only the last bucket can be partial
+            counts = np.minimum(bucket, self.frame_count - np.arange(len(sums)) * bucket)
+            self.levels.append((
+                np.minimum.reduceat(lows, starts),
+                np.maximum.reduceat(highs, starts),
+                (sums / counts).astype(np.float32),
+            ))
+
+    def window(self, start=0, stop=None, max_points=MAX_TIMELINE_POINTS):
+        """
+        Summary of the frames in [start, stop) at the finest level that fits in max_points
+
+        Args:
+            start (int): First frame of the window
+            stop (int): Frame the window ends before, None for the end of the video
+            max_points (int): Most buckets returned
+
+        Returns:
+            dict: 'frames' (first frame of each bucket), 'bucket' (frames per
+                bucket), and the 'min', 'max' and 'mean' score of each bucket
+        """
+        start = max(0, int(start))
+        stop = self.frame_count if stop is None else min(self.frame_count, int(stop))
+        for level, (lows, highs, means) in enumerate(self.levels):
+            bucket = self.factor ** level
+            first, last = start // bucket, -(-stop // bucket)
+            if last - first <= max_points:
+                break
+        return {
+            'frames': np.arange(first, last) * bucket,
+            'bucket': bucket,
+            'min': lows[first:last],
+            'max': highs[first:last],
+            'mean': means[first:last],
+        }
+
+def plot_score_timeline(pyramid, threshold, start=0, stop=None):
+    """
+    Draw the change score along the timeline as a min/max band around the mean
+
+    Args:
+        pyramid (ScorePyramid): Summaries of the per-frame scores
+        threshold (float): Detection threshold, drawn as a horizontal line
+        start (int): First frame shown
+        stop (int): Frame the view ends before, None for the end of the video
+    """
+    window = pyramid.window(start, stop)
+    fig = go.Figure()
+    if window['bucket'] == 1:
+        fig.add_trace(go.Scattergl(x=window['frames'], y=window['mean'], mode='lines', name='Score'))
+    else:
+        # WebGL traces keep panning smooth with thousands of points
+        fig.add_trace(go.Scattergl(x=window['frames'], y=window['max'], mode='lines',
+                                   line=dict(width=0), name='Max', showlegend=False))
+        fig.add_trace(go.Scattergl(x=window['frames'], y=window['min'], mode='lines',
+                                   line=dict(width=0), fill='tonexty', fillcolor='rgba(99,110,250,0.3)',
+                                   name='Min–max range'))
+        fig.add_trace(go.Scattergl(x=window['frames'], y=window['mean'], mode='lines', name='Mean'))
+    fig.add_hline(y=threshold, line_dash="dash", line_color="red", annotation_text="Threshold")
+
+    fig.update_layout(
+        title=f"Frame Change Score ({window['bucket']:,} frames per point)",
+        xaxis_title='Frame Position',
+        yaxis_title='Share of Changed Pixels',
+        height=400
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
 def plot_altered_frames(altered_frames, total_frames):
     """
     Create a line graph showing the distribution of altered frames
     
     Args:
-        altered_frames (list): List of altered frame indices
+        altered_frames (array-like): Sorted altered frame indices
         total_frames (int): Total number of frames in the video
     """
-    if not altered_frames:
+    altered_frames = np.asarray(altered_frames, dtype=np.int64)
+    if len(altered_frames) == 0:
         st.info("No altered frames detected to visualize.")
         return
     
-    # Create histogram data
-    bin_count = min(50, len(altered_frames))  # Adjust bin count based on data
-    hist, bin_edges = np.histogram(altered_frames, bins=bin_count)
-    
-    # Create dataframe for plotting
-    df = pd.DataFrame({
-        'Frame Range': [f"{int(bin_edges[i])}-{int(bin_edges[i+1])}" for i in range(len(bin_edges)-1)],
-        'Altered Frame Count': hist,
-        'Start Frame': bin_edges[:-1]
-    })
+    # Count altered frames per bin without building per-frame Python objects
+    span = max(int(total_frames), int(altered_frames[-1]) + 1)
+    bin_size = max(1, -(-span // MAX_HISTOGRAM_BINS))
+    counts = np.bincount(altered_frames // bin_size, minlength=-(-span // bin_size))
     
-    # Create line graph
-    fig = px.line(
-        df, 
-        x='Start Frame', 
-        y='Altered Frame Count',
-        title='Distribution of Altered Frames',
-        markers=True
-    )
+    fig = go.Figure(go.Scattergl(
+        x=np.arange(len(counts)) * bin_size,
+        y=counts,
+        mode='lines+markers',
+    ))
     
     fig.update_layout(
+        title='Distribution of Altered Frames',
         xaxis_title='Frame Position',
-        yaxis_title='Number of Altered Frames',
+        yaxis_title=f'Altered Frames per {bin_size:,} Frames',
         height=400
     )
     
-    # Add a vertical line at major clusters of altered frames
-    if len(altered_frames) > 0:
-        major_clusters = [frame for i, frame in enumerate(altered_frames) 
-                         if i == 0 or frame - altered_frames[i-1] > 5]
-        
-        for cluster in major_clusters[:5]:  # Limit to first 5 major clusters
-            fig.add_vline(
-                x=cluster, 
-                line_dash="dash", 
-                line_color="red",
-                annotation_text=f"Frame {cluster}",
-                annotation_position="top right"
-            )
+    # Add a vertical line at the start of the first major clusters of altered frames
+    cluster_starts = altered_frames[np.concatenate([[True], np.diff(altered_frames) > CLUSTER_GAP])]
+    for cluster in cluster_starts[:5].tolist():  # Limit to first 5 major clusters
+        fig.add_vline(
+            x=cluster, 
+            line_dash="dash", 
+            line_color="red",
+            annotation_text=f"Frame {cluster}",
+            annotation_position="top right"
+        )
     
     st.plotly_chart(fig, use_container_width=True)
 
@@ -115,38 +215,26 @@ def create_frame_heatmap(altered_frames, total_frames):
     Create a heatmap visualization showing where alterations occur in the video timeline
     
     Args:
-        altered_frames (list): List of altered frame indices
+        altered_frames (array-like): Altered frame indices
         total_frames (int): Total number of frames in the video
     """
-    if not altered_frames:
+    altered_frames = np.asarray(altered_frames, dtype=np.int64)
+    if len(altered_frames) == 0:
         return
     
-    # Create a timeline representation
-    segments = 100  # Divide the video into 100 segments
+    # Divide the video into 100 segments and count altered frames in each
+    segments = 100
     segment_size = max(1, total_frames // segments)
-    
-    # Count altered frames in each segment
-    segment_counts = [0] * segments
-    for frame in altered_frames:
-        segment_idx = min(segments - 1, frame // segment_size)
-        segment_counts[segment_idx] += 1
+    segment_counts = np.bincount(
+        np.minimum(segments - 1, altered_frames // segment_size), minlength=segments
+    )
     
     # Normalize the counts for better visualization
-    max_count = max(segment_counts) if segment_counts else 1
-    normalized_counts = [count / max_count for count in segment_counts]
-    
-    # Create a dataframe for the heatmap
-    df = pd.DataFrame({
-        'Segment': list(range(segments)),
-        'Alteration Intensity': normalized_counts
-    })
-    
-    # Reshape for heatmap (1-row matrix)
-    matrix = np.array(normalized_counts).reshape(1, -1)
+    normalized_counts = segment_counts / max(1, segment_counts.max())
     
     # Create heatmap
     fig = go.Figure(data=go.Heatmap(
-        z=matrix,
+        z=normalized_counts.reshape(1, -1),
         colorscale='Reds',
         showscale=True,
         text=[[f"{int(c * 100)}%" if c > 0 else "" for c in normalized_counts]],
@@ -167,3 +255,22 @@ def create_frame_heatmap(altered_frames, total_frames):
     # Add explanation
     st.caption("The heatmap shows the distribution of alterations across the video timeline. " +
             "Darker red areas indicate segments with more detected alterations.")
+
+def show_frame_list(frames, key, page_size=1000):
+    """
+    Show a long list of frame indices one page at a time
+
+    Only the current page is sent to the browser, instead of the whole list.
+
+    Args:
+        frames (array-like): Frame indices
+        key (str): Unique widget key for the page selector
+        page_size (int): Frames shown per page
+    """
+    frames = np.asarray(frames, dtype=np.int64)
+    pages = max(1, -(-len(frames) // page_size))
+    page = 1
+    if pages > 1:
+        page = st.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, value=1, key=key)
+    shown = frames[(page - 1) * page_size:page * page_size]
+    st.dataframe({'Frame': shown}, use_container_width=True, height=300, hide_index=True)